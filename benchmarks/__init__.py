@@ -0,0 +1,7 @@
+"""Routing micro-benchmarks for heaven.
+
+Run `python -m benchmarks --help` from the repository root. The package is not
+part of the heaven distribution and only touches heaven through interfaces that
+older releases have as well, so the same script can be pointed at an installed
+release and at a checkout and the two JSON reports compared.
+"""
@@ -0,0 +1,41 @@
+"""python -m benchmarks [--sizes 100 1000 10000] [--modes live frozen generated] [--output results.json]"""
+import json
+import sys
+from argparse import ArgumentParser
+
+from .routing import MODES, SIZES, run
+
+
+def describe(result: dict) -> str:
+    head = f"{result['routes']:>6} routes  {result['mode']:<9}"
+    if result.get('unsupported'): return f'{head}  unsupported by this heaven'
+    resolve = '  '.join(f"{kind} {stats['ns'] / 1000:.2f}" for kind, stats in result['resolve'].items() if stats)
+    call = result['call'].get('typed') or result['call'].get('static')
+    return (
+        f"{head}  {result['memory']['bytes_per_route']:>7.0f} B/route  resolve µs: {resolve}"
+        f"  xhooks {result['xhooks']['ns'] / 1000:.2f}µs  call {call['ops_per_sec']:,}/s"
+    )
+
+
+def main(argv=None):
+    parser = ArgumentParser(prog='python -m benchmarks', description='Routing micro-benchmarks for heaven, reported as JSON.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help='route table sizes (default: %(default)s)')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES), help='how the routes are held (default: all)')
+    parser.add_argument('--rounds', type=int, default=7, help='timed rounds, the median is reported (default: %(default)s)')
+    parser.add_argument('--warmup', type=int, default=2, help='untimed rounds first (default: %(default)s)')
+    parser.add_argument('--probes', type=int, default=200, help='request paths per kind (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the synthetic tables (default: %(default)s)')
+    parser.add_argument('--output', '-o', help='write the JSON report here instead of stdout')
+    parser.add_argument('--quiet', '-q', action='store_true', help='no progress lines on stderr')
+    args = parser.parse_args(argv)
+
+    report = None if args.quiet else lambda result: print(describe(result), file=sys.stderr, flush=True)
+    results = run(args.sizes, args.modes, args.rounds, args.warmup, args.probes, args.seed, report)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output: output.write(text + '\n')
+    else: print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,309 @@
+"""Synthetic route tables and the measurements taken against them.
+
+A table of N routes is spread over a few subdomains and mixes static routes,
+routes with typed `:param` segments and `*` wildcards, registered mostly under GET
+with some POST, PUT and DELETE. For each table the probes are concrete request
+paths of five kinds: a static route, a typed route with valid values, a path a
+wildcard catches, a path nothing matches (404) and a registered path asked for
+with a method it does not have (405).
+
+Every timing disables the garbage collector, runs warmup rounds first and
+reports the median of the rounds along with the fastest, in nanoseconds per
+operation.
+"""
+import asyncio
+import gc
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Tuple
+from uuid import UUID
+
+import heaven
+from heaven import App, Context, Request, Response
+from heaven.constants import DEFAULT
+
+
+SIZES = (100, 1000, 10000)
+SUBDOMAINS = (DEFAULT, 'api', 'admin', 'tenant')
+KINDS = ('static', 'typed', 'wildcard', 'miss', 'method')
+
+# live walks the mutable tries; frozen and generated need Router.freeze, which
+# older releases do not have, and are reported as unsupported there
+MODES = ('live', 'frozen', 'generated')
+
+
+class Unsupported(Exception):
+    """The heaven being measured cannot build a table in the mode asked for."""
+
+WORDS = (
+    'accounts', 'api', 'billing', 'builds', 'carts', 'customers', 'events', 'files',
+    'health', 'invoices', 'items', 'jobs', 'logs', 'orders', 'orgs', 'payments',
+    'products', 'projects', 'reports', 'search', 'settings', 'status', 'teams',
+    'tokens', 'users', 'v1', 'v2', 'webhooks',
+)
+TYPES = ('int', 'uuid', 'str')
+
+
+class Table(object):
+    def __init__(self, size: int, seed: int = 0, probes: int = 200):
+        """`size` distinct routes and up to `probes` request paths of each kind."""
+        rng = random.Random(seed)
+        self.size = size
+        self.routes: List[Tuple[str, str, str]] = []
+        self.probes: Dict[str, List[Tuple[str, str, str]]] = {kind: [] for kind in KINDS}
+        examples = {kind: [] for kind in ('static', 'typed', 'wildcard')}
+
+        # two routes differing only in parameter names land on the same node
+        shapes = set()
+        while len(self.routes) < size:
+            subdomain = rng.choice(SUBDOMAINS)
+            parts = [rng.choice(WORDS) for _ in range(rng.randint(1, 4))]
+            roll = rng.random()
+            if roll < .6: kind = 'static'
+            elif roll < .9:
+                kind = 'typed'
+                for _ in range(rng.randint(1, 3)):
+                    parts.insert(rng.randint(1, len(parts)), f':p{len(parts)}:{rng.choice(TYPES)}')
+            else:
+                kind = 'wildcard'
+                parts.append('*')
+            method = 'GET' if rng.random() < .75 else rng.choice(('POST', 'PUT', 'DELETE'))
+            shape = (subdomain, method, tuple(':' if part.startswith(':') else part for part in parts))
+            if shape in shapes: continue
+            shapes.add(shape)
+            route = '/' + '/'.join(parts)
+            self.routes.append((subdomain, method, route))
+            examples[kind].append((subdomain, method, route))
+
+        for kind, registered in examples.items():
+            for subdomain, method, route in rng.sample(registered, min(probes, len(registered))):
+                self.probes[kind].append((subdomain, method, self.concrete(route, rng)))
+        # a miss follows a registered GET route to its end and then leaves the
+        # tree, so the walk goes as deep as a real lookup before it fails
+        gets = [example for example in examples['static'] + examples['typed'] if example[1] == 'GET']
+        for _ in range(probes * 10 if gets else 0):
+            if len(self.probes['miss']) == probes: break
+            subdomain, _, route = rng.choice(gets)
+            path = f'{self.concrete(route, rng)}/nowhere{rng.randrange(10 ** 6)}'
+            if not self.covered(subdomain, path): self.probes['miss'].append((subdomain, 'GET', path))
+        for subdomain, _, route in rng.sample(examples['static'], min(probes, len(examples['static']))):
+            # nothing is ever registered under PATCH, so a registered path answers 405
+            self.probes['method'].append((subdomain, 'PATCH', route))
+
+    def covered(self, subdomain: str, path: str) -> bool:
+        """Whether a GET route in the table could answer `path`, taking every
+        `:param` to accept any value."""
+        parts = path.strip('/').split('/')
+        for registered, method, route in self.routes:
+            if registered != subdomain or method != 'GET': continue
+            pattern = route.strip('/').split('/')
+            if pattern[-1] == '*':
+                if len(parts) >= len(pattern) and parts[:len(pattern) - 1] == pattern[:-1]: return True
+            elif len(parts) == len(pattern) and all(want == got or want.startswith(':') for want, got in zip(pattern, parts)): return True
+        return False
+
+    @staticmethod
+    def concrete(route: str, rng: random.Random) -> str:
+        """A request path that `route` matches."""
+        parts = []
+        for part in route.strip('/').split('/'):
+            if part == '*': parts.append('deep/er')
+            elif part.startswith(':'):
+                kind = part.rsplit(':', 1)[1]
+                if kind == 'int': parts.append(str(rng.randrange(10 ** 6)))
+                elif kind == 'uuid': parts.append(str(UUID(int=rng.getrandbits(128))))
+                else: parts.append(f'slug{rng.randrange(1000)}')
+            else: parts.append(part)
+        return '/' + '/'.join(parts)
+
+
+async def _handler(req, res, ctx):
+    res.body = b'ok'
+
+
+async def _hook(req, res, ctx):
+    pass
+
+
+def build(table: Table, mode: str = 'live') -> App:
+    """An app with every route in `table` and a few BEFORE and AFTER hooks per
+    subdomain. Raises Unsupported for a mode this heaven cannot do."""
+    app = App()
+    for subdomain in SUBDOMAINS:
+        if subdomain != DEFAULT: app.subdomain(subdomain)
+        app.BEFORE('/*', _hook, subdomain=subdomain)
+        app.BEFORE('/*', _hook, subdomain=subdomain)
+        app.AFTER('/*', _hook, subdomain=subdomain)
+        for word in WORDS[:4]: app.BEFORE(f'/{word}/*', _hook, subdomain=subdomain)
+    for subdomain, method, route in table.routes:
+        getattr(app, method)(route, _handler, subdomain=subdomain)
+
+    if mode == 'live': return app
+    if not hasattr(app, 'freeze'): raise Unsupported(mode)
+    if mode == 'frozen': app.freeze()
+    else:
+        try: app.freeze(generate_code=True)
+        except TypeError: raise Unsupported(mode)
+    return app
+
+
+class _Sink(object):
+    """Takes what Routes.resolve writes onto a request without being one, so the
+    timing is of the lookup rather than of building a Request."""
+    def __init__(self):
+        self._params = None
+        self._hint = None
+
+    @property
+    def params(self): return self._params
+
+    @params.setter
+    def params(self, pair):
+        if not self._params: self._params = {}
+        key, value = pair
+        self._params[key] = value
+
+
+def _summary(samples: List[float]) -> dict:
+    median = statistics.median(samples)
+    return {'ns': round(median, 1), 'min_ns': round(min(samples), 1), 'ops_per_sec': round(1e9 / median) if median else None}
+
+
+def timed(operation: Callable, items: list, rounds: int = 7, warmup: int = 2, reset: Callable = None) -> dict:
+    """Call `operation` on every item, `rounds` times over, and summarise the time per call.
+    `reset`, if given, is called untimed before each round."""
+    if not items: return None
+    for _ in range(warmup):
+        if reset: reset()
+        for item in items: operation(item)
+    samples = []
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            if reset: reset()
+            start = time.perf_counter_ns()
+            for item in items: operation(item)
+            samples.append((time.perf_counter_ns() - start) / len(items))
+    finally: gc.enable()
+    return _summary(samples)
+
+
+async def atimed(operation: Callable, items: list, rounds: int = 7, warmup: int = 2) -> dict:
+    """timed() for a coroutine function, all rounds run inside one event loop."""
+    if not items: return None
+    for _ in range(warmup):
+        for item in items: await operation(item)
+    samples = []
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            start = time.perf_counter_ns()
+            for item in items: await operation(item)
+            samples.append((time.perf_counter_ns() - start) / len(items))
+    finally: gc.enable()
+    return _summary(samples)
+
+
+def memory(table: Table, mode: str) -> dict:
+    """Bytes allocated by building the app, and per route, as tracemalloc sees them."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        app = build(table, mode)
+        gc.collect()
+        held = tracemalloc.get_traced_memory()[0] - before
+    finally: tracemalloc.stop()
+    del app
+    return {'bytes': held, 'bytes_per_route': round(held / table.size, 1)}
+
+
+def _scope(subdomain: str, method: str, path: str) -> dict:
+    host = b'example.com' if subdomain == DEFAULT else f'{subdomain}.example.com'.encode()
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'scheme': 'http',
+        'server': ('127.0.0.1', 8000), 'client': ('127.0.0.1', 50000), 'root_path': '',
+        'method': method, 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+        'headers': [(b'host', host), (b'accept', b'*/*'), (b'user-agent', b'benchmarks')],
+    }
+
+
+async def _throughput(app: App, table: Table, rounds: int, warmup: int) -> dict:
+    async def receive(): return {'type': 'http.request', 'body': b'', 'more_body': False}
+    async def send(message): pass
+    async def call(scope): await app(dict(scope), receive, send)
+    return {
+        kind: await atimed(call, [_scope(*probe) for probe in probes], rounds, warmup)
+        for kind, probes in table.probes.items()
+    }
+
+
+async def _hooks(app: App, table: Table, rounds: int, warmup: int) -> dict:
+    """Time the BEFORE chain of the matched route for each typed probe."""
+    calls = []
+    for subdomain, method, path in table.probes['typed']:
+        engine = app.subdomains[subdomain]
+        matched, _, _ = engine.resolve(method, path, _Sink())
+        request = Request(_scope(subdomain, method, path), b'', None, (subdomain, None), app)
+        context = Context(app)
+        calls.append((engine, matched, request, Response(app, context, request), context))
+
+    async def run(call):
+        engine, matched, request, response, context = call
+        await engine.xhooks(engine.befores, engine.beforemethods, matched, request, response, context, True)
+    return await atimed(run, calls, rounds, warmup)
+
+
+def bench(table: Table, mode: str, rounds: int = 7, warmup: int = 2) -> dict:
+    """Every measurement for one table in one mode."""
+    result = {'routes': table.size, 'subdomains': len(SUBDOMAINS), 'mode': mode}
+    try: app = build(table, mode)
+    except Unsupported:
+        result['unsupported'] = True
+        return result
+
+    engines = app.subdomains
+    result['memory'] = memory(table, mode)
+    result['resolve'] = {
+        kind: timed(lambda probe: engines[probe[0]].resolve(probe[1], probe[2], _Sink()), probes, rounds, warmup)
+        for kind, probes in table.probes.items()
+    }
+    # Allow sets are only worked out for requests nothing answered. Each round
+    # starts with the memo of them empty, so it times the walks and not the memo
+    def forget():
+        for engine in engines.values():
+            allowances = getattr(engine, 'allowances', None)
+            if allowances is not None: allowances.clear()
+    result['allowed'] = {
+        kind: timed(lambda probe: engines[probe[0]].allowed(probe[2]), table.probes[kind], rounds, warmup, forget)
+        for kind in ('miss', 'method')
+    }
+    result['xhooks'] = asyncio.run(_hooks(app, table, rounds, warmup))
+    result['call'] = asyncio.run(_throughput(app, table, rounds, warmup))
+    return result
+
+
+def run(sizes=SIZES, modes=MODES, rounds: int = 7, warmup: int = 2, probes: int = 200, seed: int = 0, report=None) -> dict:
+    """Benchmark every size in every mode. `report`, if given, is called with each
+    result as it is finished."""
+    started = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    results = []
+    for size in sizes:
+        table = Table(size, seed, probes)
+        for mode in modes:
+            result = bench(table, mode, rounds, warmup)
+            results.append(result)
+            if report: report(result)
+    return {
+        'heaven': getattr(heaven, '__version__', None),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'started': started,
+        'settings': {'sizes': list(sizes), 'modes': list(modes), 'rounds': rounds, 'warmup': warmup, 'probes': probes, 'seed': seed},
+        'results': results,
+    }
@@ -0,0 +1,192 @@
+"""Small static files kept in memory, so `ASSETS` answers a hit without the disk.
+
+An `AssetCache` holds each file it has served under the path it was asked for:
+the bytes, and the headers `res.file` would have sent, made once when the file
+is read. A hit is one dictionary lookup and a few header writes. Every
+`revalidate` seconds an entry is checked with a single `stat` of the file, and
+dropped for a fresh read if its size or modification time moved. Files over
+`largest` bytes, and requests for byte ranges, go through `res.file` as before.
+"""
+import mimetypes
+from asyncio import get_running_loop
+from os import fstat, path, sep, stat
+from stat import S_ISREG
+from time import monotonic
+from typing import Union
+
+from .etags import fresh, httpdate, weak
+from .utils import LRU
+
+# what an entry costs beyond its body and headers, roughly, in bytes
+OVERHEAD = 200
+
+# paths remembered as not worth reading: too large, not a file, absent or outside
+# the folder. Bounded by count, since any client can make up names to ask for
+PASSES = 4096
+
+
+def confine(root: str, filepath: str) -> Union[str, None]:
+    """`filepath` resolved against `root`, or None when it lands outside it."""
+    root = path.realpath(root)
+    filepath = path.realpath(path.join(root, filepath))
+    if filepath != root and not filepath.startswith(root + sep): return None
+    return filepath
+
+
+def _signature(info) -> Union[tuple, None]:
+    return None if info is None else (info.st_mode, info.st_size, info.st_mtime_ns)
+
+
+def _stat(filepath: str):
+    try: return stat(filepath)
+    except (OSError, ValueError): return None
+
+
+def _read(filepath: str, largest: int):
+    # the file's stat, and its bytes when it is a regular file of up to `largest`
+    # bytes; the stat alone, or None for a missing file, says why not. Checked
+    # before opening, which would block on a FIFO
+    info = _stat(filepath)
+    if info is None or not S_ISREG(info.st_mode) or info.st_size > largest: return info, None
+    try:
+        with open(filepath, 'rb') as file:
+            # the stat of the open file, so the validators describe the bytes read
+            info = fstat(file.fileno())
+            if not S_ISREG(info.st_mode) or info.st_size > largest: return info, None
+            return info, file.read()
+    except (OSError, ValueError): return None, None
+
+
+class _Asset(object):
+    __slots__ = ('path', 'size', 'mtime_ns', 'modified', 'etag', 'headers', 'length', 'body', 'checked')
+
+    def __init__(self, filepath: str, info, body: bytes, checked: float):
+        self.path = filepath
+        self.size = info.st_size
+        self.mtime_ns = info.st_mtime_ns
+        self.modified = info.st_mtime
+        self.etag = weak(info.st_size, info.st_mtime_ns)
+        mime_type, _ = mimetypes.guess_type(filepath)
+        self.headers = [
+            (b'Content-Type', (mime_type or 'application/octet-stream').encode()),
+            (b'Content-Disposition', f'inline; filename="{path.basename(filepath)}"'.encode()),
+            (b'ETag', self.etag.encode()),
+            (b'Last-Modified', httpdate(info.st_mtime).encode()),
+        ]
+        # sent with the body only, never on a 304
+        self.length = [(b'Accept-Ranges', b'bytes'), (b'Content-Length', str(len(body)).encode())]
+        self.body = body
+        self.checked = checked
+
+
+class _Pass(object):
+    # a path left to res.file, and the stat that decided it: None for a path
+    # outside the folder, and for a missing file (signature None too)
+    __slots__ = ('path', 'signature', 'checked')
+
+    def __init__(self, filepath: Union[str, None], signature: Union[tuple, None], checked: float):
+        self.path = filepath
+        self.signature = signature
+        self.checked = checked
+
+
+class AssetCache(object):
+    """Files of up to `largest` bytes kept in an LRU bounded by `maxbytes`, each
+    checked against the disk at most every `revalidate` seconds: 0 checks on
+    every hit, None never, for a folder that only changes with a deploy.
+
+    A path that cannot be kept, being too large, not a regular file, missing or
+    outside the folder, is remembered with its stat and left to `res.file` at
+    once, until the same revalidation finds that stat changed.
+
+    `hits`, `misses`, `stores`, `passes` and `evictions` count what the cache
+    saw; `size` is the bytes it holds."""
+    def __init__(self, maxbytes: int = 32 * 1024 * 1024, largest: int = 1024 * 1024, revalidate: Union[float, None] = 1.0):
+        if maxbytes < 1: raise ValueError('An asset cache must be allowed at least one byte')
+        if largest < 0: raise ValueError('An asset cache needs a largest file size of zero or more bytes')
+        if revalidate is not None and revalidate < 0: raise ValueError('An asset cache needs a revalidate interval of zero or more seconds, or None')
+        self.largest = largest
+        self.revalidate = revalidate
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.passes = 0
+        self._entries = LRU(maxbytes=maxbytes)
+        self._passes = LRU(maxsize=PASSES)
+
+    @property
+    def evictions(self) -> int: return self._entries.evictions
+
+    @property
+    def size(self) -> int: return self._entries.size
+
+    def __len__(self) -> int: return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+        self._passes.clear()
+
+    def _current(self, key, entry: _Asset) -> Union[_Asset, None]:
+        now = monotonic()
+        if self.revalidate is None or now - entry.checked < self.revalidate: return entry
+        info = _stat(entry.path)
+        if info is None or info.st_size != entry.size or info.st_mtime_ns != entry.mtime_ns:
+            self._entries.pop(key)
+            return None
+        entry.checked = now
+        return entry
+
+    def _passing(self, key, passed: _Pass) -> bool:
+        now = monotonic()
+        if self.revalidate is None or now - passed.checked < self.revalidate: return True
+        # a path outside the folder is resolved again, in case a symlink moved
+        if passed.path is not None and _signature(_stat(passed.path)) == passed.signature:
+            passed.checked = now
+            return True
+        self._passes.pop(key)
+        return False
+
+    async def serve(self, root: str, name: str, r, w) -> bool:
+        """Answer the request `r` for `name` under the folder `root` on `w` from
+        memory, reading the file in first if it is small enough. False leaves the
+        request to `res.file`: a range, a missing or large file, or a path that
+        leaves `root`."""
+        if r.headers.get('range') is not None: return False
+        key = root, name
+        entry = self._entries.get(key)
+        if entry is not None: entry = self._current(key, entry)
+        if entry is None:
+            # known to be left to res.file, which is sent there without a thread hop
+            passed = self._passes.get(key)
+            if passed is not None and self._passing(key, passed):
+                self.passes += 1
+                return False
+            self.misses += 1
+            filepath = confine(root, name)
+            if filepath is None:
+                self._passes.put(key, _Pass(None, None, monotonic()))
+                return False
+            info, body = await get_running_loop().run_in_executor(None, _read, filepath, self.largest)
+            if body is None:
+                self._passes.put(key, _Pass(filepath, _signature(info), monotonic()))
+                return False
+            self._passes.pop(key)
+            entry = _Asset(filepath, info, body, monotonic())
+            size = len(body) + sum(len(header) + len(value) for header, value in entry.headers) + OVERHEAD
+            if self._entries.put(key, entry, size): self.stores += 1
+            # larger than the whole cache, so served this once and passed on after
+            else: self._passes.put(key, _Pass(filepath, _signature(info), entry.checked))
+        else: self.hits += 1
+
+        # headers set by BEFORE hooks are replaced one by one, as res.file would
+        if w._headers:
+            for header, value in entry.headers: w.header(header, value.decode())
+        else: w._headers = list(entry.headers)
+        if fresh(r.headers, entry.etag, entry.modified):
+            w.status = 304
+            w.body = b''
+            return True
+        for header, value in entry.length: w.header(header, value.decode())
+        w.status = 200
+        w.body = entry.body
+        return True
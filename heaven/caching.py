@@ -0,0 +1,183 @@
+"""Whole responses kept in memory and served again without running the handler.
+
+A `ResponseCache` is set on a route or a wildcard group with `Router.cache`. For a
+GET (or HEAD) request it covers, the router runs the BEFORE hooks as usual, so
+authentication and rate limits still apply, then looks the request up. A hit
+puts the stored status, headers and body on the response and skips the handler
+and AFTER hooks, whose work is already in what was stored. A miss runs them and
+stores the result: the headers the handler and AFTER hooks set, and the body as
+the bytes that go on the wire.
+
+The handler's own `Cache-Control` decides over the cache's defaults: `no-store`,
+`no-cache` and `private` keep a response out, `s-maxage` or `max-age` replace the
+time to live and `stale-while-revalidate` the stale window. Responses setting a
+cookie, or with `Vary: *`, are never stored. Entries are keyed by host, path and
+query string. A stored `Vary` makes the headers it names part of the key, along
+with any the cache was created to vary on.
+
+Within the stale window an expired entry is still served, and one refresh per
+entry is scheduled with `res.defer`, so the client that found it stale does not
+wait for it and the entry is fresh for the ones after.
+"""
+from time import monotonic
+from typing import Awaitable, Callable, Iterable, Tuple, Union
+
+from .utils import LRU, joined
+
+# an ASGI scope extension marking the request a stale entry refreshes itself with
+REVALIDATE = 'heaven.revalidate'
+
+# what an entry costs beyond its body and headers, roughly, in bytes
+OVERHEAD = 200
+
+# URLs whose stored responses varied on other headers than the cache's own, and
+# which. Bounded by count, since any client can make up query strings to send
+VARIES = 4096
+
+
+def _directives(value: str) -> dict:
+    directives = {}
+    for part in value.lower().split(','):
+        name, _, argument = part.strip().partition('=')
+        if name: directives[name] = argument.strip().strip('"')
+    return directives
+
+
+def _seconds(value: str) -> Union[float, None]:
+    try: return max(float(value), 0.0)
+    except ValueError: return None
+
+
+class _Entry(object):
+    __slots__ = ('status', 'headers', 'body', 'stored', 'expires', 'stale', 'refreshing')
+
+    def __init__(self, status: int, headers: list, body: bytes, stored: float, expires: float, stale: float):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.stored = stored
+        self.expires = expires
+        self.stale = stale
+        self.refreshing = False
+
+
+class ResponseCache(object):
+    """Responses kept for `ttl` seconds, and served for up to `stale` more while a
+    refresh runs, in an LRU bounded by `maxbytes`. `vary` names request headers
+    that are always part of the key; `statuses` are the ones worth keeping.
+
+    `hits`, `stale_hits`, `misses`, `stores` and `evictions` count what the cache
+    saw; `size` is the bytes it holds."""
+    def __init__(self, ttl: float = 60.0, maxbytes: int = 32 * 1024 * 1024, stale: float = 0.0, vary: Iterable[str] = (), statuses: Iterable[int] = (200,)):
+        if ttl < 0 or stale < 0: raise ValueError('A response cache needs a ttl and stale window of zero or more seconds')
+        if maxbytes < 1: raise ValueError('A response cache must be allowed at least one byte')
+        self.ttl = ttl
+        self.stale = stale
+        self.vary = tuple(header.lower() for header in vary)
+        self.statuses = frozenset(statuses)
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self._entries = LRU(maxbytes=maxbytes)
+        # (host, path, query string) -> the header names its last stored response
+        # varied on, when they are not just `vary`
+        self._varies = LRU(maxsize=VARIES)
+
+    @property
+    def evictions(self) -> int: return self._entries.evictions
+
+    @property
+    def size(self) -> int: return self._entries.size
+
+    def __len__(self) -> int: return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+        self._varies.clear()
+
+    def _primary(self, r) -> tuple:
+        # the host too, so a wildcard or default subdomain keeps tenants apart
+        scope = r._scope
+        return joined(r.headers.get('host')), scope.get('path'), scope.get('query_string', b'')
+
+    def key(self, r, names: Tuple[str, ...] = None) -> tuple:
+        primary = self._primary(r)
+        if names is None: names = self._varies.get(primary, self.vary)
+        if not names: return primary
+        headers = r.headers
+        return primary + tuple(joined(headers.get(name)) for name in names)
+
+    def serve(self, r, w, revalidate: Callable[[], Awaitable] = None) -> bool:
+        """Put the stored response for `r` on `w` if there is one still usable.
+        When what was served is stale, `revalidate()` is deferred on `w` to run
+        the request again, once per entry at a time."""
+        if r._scope.get(REVALIDATE): return False
+        # a client asking for a fresh answer gets one, and the cache is refilled
+        if 'no-cache' in (r.headers.get('cache-control') or ''): return False
+
+        key = self.key(r)
+        entry = self._entries.get(key)
+        now = monotonic()
+        if entry is not None and now >= entry.stale:
+            self._entries.pop(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return False
+        if now >= entry.expires:
+            self.stale_hits += 1
+            if revalidate is not None and not entry.refreshing:
+                entry.refreshing = True
+                w.defer(lambda application: self._refresh(entry, revalidate))
+        else: self.hits += 1
+
+        w.status = entry.status
+        w.body = entry.body
+        for name, value in entry.headers: w.header(name, value)
+        w.header('Age', str(int(now - entry.stored)))
+        return True
+
+    async def _refresh(self, entry: _Entry, revalidate: Callable[[], Awaitable]):
+        # a refresh that stores nothing leaves the stale entry to be tried again
+        try: await revalidate()
+        finally: entry.refreshing = False
+
+    def store(self, r, w, before: list) -> bool:
+        """Keep the response on `w` for the requests after `r`. `before` is what the
+        headers were when the BEFORE hooks finished, which are left out."""
+        if w._abort or w.status not in self.statuses: return False
+        # serialized once here instead of on every hit
+        w._encode()
+        body = w.body
+        if not isinstance(body, bytes): return False
+
+        headers = []
+        ttl, stale, names = self.ttl, self.stale, self.vary
+        for name, value in w.headers:
+            lowered = name.lower()
+            if lowered == b'set-cookie': return False
+            if lowered == b'cache-control':
+                directives = _directives(value.decode())
+                if 'no-store' in directives or 'no-cache' in directives or 'private' in directives: return False
+                age = directives.get('s-maxage') or directives.get('max-age')
+                if age is not None: ttl = _seconds(age) or 0.0
+                window = directives.get('stale-while-revalidate')
+                if window is not None: stale = _seconds(window) or 0.0
+            elif lowered == b'vary':
+                varied = [header.strip().lower() for header in value.decode().split(',') if header.strip()]
+                if '*' in varied: return False
+                names = tuple(dict.fromkeys([*self.vary, *varied]))
+            if (name, value) not in before: headers.append((name.decode(), value.decode()))
+        if ttl <= 0: return False
+
+        primary = self._primary(r)
+        if names != self.vary: self._varies.put(primary, names)
+        else: self._varies.pop(primary)
+
+        now = monotonic()
+        entry = _Entry(w.status, headers, body, now, now + ttl, now + ttl + stale)
+        size = len(body) + sum(len(name) + len(value) for name, value in headers) + OVERHEAD
+        if not self._entries.put(self.key(r, names), entry, size): return False
+        self.stores += 1
+        return True
@@ -0,0 +1,101 @@
+"""Stopping work nobody is waiting for any more.
+
+Once a buffered request body has been read, the next thing an ASGI server hands
+`receive` is `http.disconnect`, when the client goes away. A `Watch` waits for
+that beside the handler and cancels the task running it, so a client that gives
+up stops costing database queries and streamed chunks. Routes reading their own
+body with `stream=True` own `receive` and are not watched.
+
+Most handlers finish without ever giving the loop a turn, and for them a watching
+task would be pure overhead: the watch only starts one the first time the loop
+gets control back while the handler is still running.
+
+A `Deadline` cancels the same way once a route has run for its `timeout`. Both
+leave the CancelledError at whatever the handler was awaiting, so cancellation
+is cooperative: a sync handler running on the loop finishes regardless.
+"""
+from asyncio import current_task, ensure_future, get_running_loop
+from time import monotonic
+from typing import Callable
+
+
+class _Cancels(object):
+    # `fired` is set once this one has cancelled `_task`
+    __slots__ = ('_task', 'fired')
+
+    def caught(self) -> bool:
+        """Whether the CancelledError just raised is this one's doing rather than
+        a cancellation from outside, which must be left to propagate. Clears the
+        task's pending cancellation count where the loop keeps one, so timeouts
+        further out still work."""
+        if not self.fired: return False
+        uncancel = getattr(self._task, 'uncancel', None)
+        if uncancel: uncancel()
+        return True
+
+
+class Disconnects(object):
+    """How many requests one Router stopped early because their client left:
+    `handlers` were cancelled while hooks or the handler ran, `streams` while a
+    streaming body was being sent."""
+    def __init__(self):
+        self.handlers = 0
+        self.streams = 0
+
+
+class Watch(_Cancels):
+    """Cancels the current task when `receive` reports the client disconnected.
+    Call `stop()` as soon as the watched work is done."""
+    __slots__ = ('_receive', '_watcher')
+
+    def __init__(self, receive: Callable):
+        self.fired = False
+        self._task = current_task()
+        self._receive = receive
+        # a Handle until the loop runs it, then the Task doing the waiting
+        self._watcher = get_running_loop().call_soon(self._start)
+
+    def _start(self):
+        self._watcher = ensure_future(self._watch(self._receive))
+
+    async def _watch(self, receive: Callable):
+        # a body message instead means a server (or test client) with nothing more
+        # to say, so there is nothing to watch for
+        message = await receive()
+        if message.get('type') == 'http.disconnect':
+            self.fired = True
+            self._task.cancel()
+
+    def stop(self):
+        # a watcher cancelled here never starts or resumes, so it cannot cancel the
+        # task after the watched work has finished
+        self._watcher.cancel()
+
+    @property
+    def disconnected(self) -> bool: return self.fired
+
+
+class Deadline(_Cancels):
+    """Cancels the current task `timeout` seconds from now. `at` is when, on the
+    `time.monotonic` clock. Call `stop()` as soon as the bounded work is done."""
+    __slots__ = ('at', '_timer')
+
+    def __init__(self, timeout: float):
+        self.at = monotonic() + timeout
+        self.fired = False
+        self._task = current_task()
+        self._timer = get_running_loop().call_later(timeout, self._expire)
+
+    def _expire(self):
+        self.fired = True
+        self._task.cancel()
+
+    def stop(self): self._timer.cancel()
+
+    @property
+    def expired(self) -> bool: return self.fired
+
+    @property
+    def remaining(self) -> float:
+        """Seconds left before the deadline, never below zero."""
+        return max(self.at - monotonic(), 0.0)
@@ -0,0 +1,99 @@
+"""Single-flight handling of identical GET requests.
+
+When a popular resource goes cold, every request for it arriving before the first
+one is answered would run the same handler against the same backend. A route
+registered with `coalesce=` runs its handler once per key instead: the first
+request in becomes the leader, and requests with the same method, host, path,
+query string and `vary` header values arriving while it runs wait for its result.
+
+Only the handler is shared. Each request still runs its own BEFORE hooks, so
+authentication and rate limits apply per client, and its own AFTER hooks, so
+sessions and logging do too. A waiter is answered with the leader's status, its
+body and the headers its handler set.
+"""
+from asyncio import get_running_loop, shield
+from copy import copy
+from typing import Awaitable, Callable, Iterable
+
+from .utils import joined
+
+
+class _Flight(object):
+    __slots__ = ('future', 'waiters')
+
+    def __init__(self, future):
+        self.future = future
+        self.waiters = 0
+
+
+class Coalesce(object):
+    """How one route shares handler runs. At most `waiters` requests wait on one
+    run; more than that run the handler themselves. `vary` names request headers
+    whose values must match too, such as `accept-language` or `authorization`.
+
+    `executions` counts handler runs made by leaders, `saved` the requests answered
+    from another's run, `overflowed` the ones that found a run full, and `inflight`
+    is the number of runs under way now."""
+    def __init__(self, waiters: int = 100, vary: Iterable[str] = ()):
+        self.waiters = waiters
+        self.vary = tuple(header.lower() for header in vary)
+        self.executions = 0
+        self.saved = 0
+        self.overflowed = 0
+        self._flights = {}
+
+    @property
+    def inflight(self) -> int:
+        return len(self._flights)
+
+    def key(self, r) -> tuple:
+        scope = r._scope
+        headers = r.headers
+        # the host too, so a wildcard or default subdomain keeps tenants apart
+        key = (scope.get('method'), joined(headers.get('host')), scope.get('path'), scope.get('query_string', b''))
+        if self.vary: key += tuple(joined(headers.get(header)) for header in self.vary)
+        return key
+
+    async def share(self, r, w, run: Callable[[], Awaitable]):
+        """Have `run()` put the handler's answer on `w`, or copy the answer a run
+        already under way for the same key puts on its own response."""
+        key = self.key(r)
+        flight = self._flights.get(key)
+        if flight is None: return await self._lead(key, w, run)
+
+        if flight.waiters >= self.waiters:
+            self.overflowed += 1
+            return await run()
+        flight.waiters += 1
+        # shielded, so a waiter whose client leaves does not cancel the others
+        outcome = await shield(flight.future)
+        if outcome is None:
+            # the leader never finished or sent a stream, which cannot be shared
+            return await run()
+        if isinstance(outcome, BaseException): raise outcome
+
+        status, body, headers, aborted = outcome
+        self.saved += 1
+        w.status = status
+        # a handler that aborted skips the AFTER hooks of every request it answers
+        w._abort = aborted
+        # the AFTER hooks of each request may edit a dict or list body in place
+        w.body = copy(body) if isinstance(body, (dict, list)) else body
+        for name, value in headers: w.header(name, value.decode())
+
+    async def _lead(self, key: tuple, w, run: Callable[[], Awaitable]):
+        flight = self._flights[key] = _Flight(get_running_loop().create_future())
+        before = list(w.headers)
+        outcome = None
+        self.executions += 1
+        try:
+            await run()
+            if not hasattr(w.body, '__aiter__'):
+                outcome = w.status, w.body, [header for header in w.headers if header not in before], w._abort
+        except Exception as e:
+            outcome = e
+            raise
+        finally:
+            # later requests start a run of their own
+            del self._flights[key]
+            flight.future.set_result(outcome)
@@ -0,0 +1,178 @@
+"""Turn a frozen route tree into one generated Python function per method.
+
+The function takes the path split on `/` and returns (route, handler, params,
+hint), the hint being the node's (queryhint, coercions), or None on a miss.
+Everything Route.match works out while walking - which child a literal segment
+selects, where a wildcard was passed, which position each parameter sits at and
+what it converts with - is already known for every point in the tree, so the
+generated code carries it as constants and nested `if`s. What is left per
+request is comparing strings and converting the values that matched.
+
+Children of a node fanning out wider than FANOUT, or sitting deeper than the
+tokenizer is comfortable nesting, go into helper functions reached through a dict
+instead of an `if` chain.
+
+A url spelling out `:` or `*` as a segment walks into those nodes as if they were
+literals. Generating that second way into every parameter and wildcard would
+double the code at each of them, so such urls are handed to FrozenRoute.match.
+"""
+from typing import Callable, List, Tuple, Union
+
+from .constants import WILDCARD
+
+# children beyond this many dispatch through a dict rather than comparisons
+FANOUT = 8
+
+# nesting past this many indents moves on into a helper function
+DEPTH = 40
+
+
+class _Source(object):
+    def __init__(self, namespace: dict):
+        self.namespace = namespace
+        self.helpers = []
+        self.tables = []
+        self.constants = {}
+
+    def constant(self, value, prefix: str) -> str:
+        """The namespace name holding `value`, which the generated code reads as a global."""
+        name = self.constants.get(id(value))
+        if name is None:
+            name = f'{prefix}{len(self.constants)}'
+            self.constants[id(value)] = name
+            self.namespace[name] = value
+        return name
+
+
+class _Recorder(object):
+    """What FrozenRoute.match needs of a Request to write its findings into."""
+    __slots__ = ('_params', '_hint')
+
+    def __init__(self):
+        self._params = None
+        self._hint = None
+
+    @property
+    def params(self): return self._params
+
+    @params.setter
+    def params(self, pair):
+        if not self._params: self._params = {}
+        key, value = pair
+        self._params[key] = value
+
+
+def _interpreted(root) -> Callable[[list], Union[Tuple, None]]:
+    def match(s):
+        recorder = _Recorder()
+        matched, handler = root.match(s, recorder)
+        if matched == '': return None
+        return matched, handler, recorder._params, recorder._hint
+    return match
+
+
+def _wildcard(source: _Source, wildcard, index: int) -> str:
+    """The expression answering a path with `wildcard`, capturing from `index` on."""
+    rest = f"'/'.join(s[{index}:])" if index else "'/'.join(s)"
+    return f"return {repr(wildcard.route)}, {source.constant(wildcard.handler, 'H')}, {{'*': {rest}}}, None"
+
+
+def _fallback(source: _Source, deviation) -> str:
+    if deviation is None: return 'return None'
+    return _wildcard(source, *deviation)
+
+
+def _exhausted(source: _Source, lines: List[str], level: int, node, deviation, parameters):
+    """The url ended on `node`: the terminal half of Route.match."""
+    pad = '    ' * level
+    if not node.route:
+        lines.append(pad + _fallback(source, deviation))
+        return
+
+    pairs = []
+    for position, ((name, convert), index) in enumerate(zip(node.parameters, parameters)):
+        if convert is None:
+            pairs.append(f'{repr(name)}: s[{index}]')
+            continue
+        converter = source.constant(convert, 'C')
+        lines.append(f'{pad}try: v{position} = {converter}(s[{index}])')
+        lines.append(f'{pad}except Exception: {_fallback(source, deviation)}')
+        pairs.append(f'{repr(name)}: v{position}')
+
+    hint = source.constant(node.hint, 'Q') if node.hint else 'None'
+    params = '{' + ', '.join(pairs) + '}' if pairs else 'None'
+    lines.append(f"{pad}return {repr(node.route)}, {source.constant(node.handler, 'H')}, {params}, {hint}")
+
+
+def _entered(source: _Source, lines: List[str], level: int, node, index: int, deviation, parameters):
+    """A segment just selected `node`; check any segments merged into it, then go on."""
+    pad = '    ' * level
+    if node.prefix:
+        end = index + len(node.prefix)
+        checks = [f'n >= {end}'] + [f's[{index + offset}] == {repr(part)}' for offset, part in enumerate(node.prefix)]
+        lines.append(f"{pad}if {' and '.join(checks)}:")
+        _at(source, lines, level + 1, node, end, deviation, parameters)
+        lines.append(pad + _fallback(source, deviation))
+        return
+    _at(source, lines, level, node, index, deviation, parameters)
+
+
+def _at(source: _Source, lines: List[str], level: int, node, index: int, deviation, parameters):
+    """Segments up to `index` have brought the walk to `node`."""
+    pad = '    ' * level
+    lines.append(f'{pad}if n == {index}:')
+    _exhausted(source, lines, level + 1, node, deviation, parameters)
+    lines.append(f'{pad}x = s[{index}]')
+
+    children = list(zip(node.keys, node.nodes)) if node.nodes else list((node.keys or {}).items())
+    # `:` and `*` as segments never get this far, see the module docstring
+    children = [(label, child) for label, child in children if label != ':' and label != WILDCARD]
+    if len(children) > FANOUT or level > DEPTH:
+        # filled with helper names here and swapped for the functions once they exist
+        table = {label: _helper(source, child, index + 1, deviation, parameters) for label, child in children}
+        source.tables.append(table)
+        lines.append(f"{pad}f = {source.constant(table, 'T')}.get(x)")
+        lines.append(f'{pad}if f is not None: return f(s, n)')
+    else:
+        for label, child in children:
+            lines.append(f'{pad}if x == {repr(label)}:')
+            _entered(source, lines, level + 1, child, index + 1, deviation, parameters)
+
+    if node.param is not None:
+        if node.wildcard is not None: deviation = (node.wildcard, index)
+        _entered(source, lines, level, node.param, index + 1, deviation, [*parameters, index])
+    elif node.wildcard is not None:
+        lines.append(pad + _wildcard(source, node.wildcard, index))
+    else:
+        lines.append(pad + _fallback(source, deviation))
+
+
+def _helper(source: _Source, node, index: int, deviation, parameters) -> str:
+    """Generate the walk from `node` on as a function of its own, returning its name."""
+    name = f'_n{len(source.helpers)}'
+    lines = [f'def {name}(s, n):']
+    source.helpers.append(lines)
+    _entered(source, lines, 1, node, index, deviation, parameters)
+    return name
+
+
+def generate(root, name: str = 'routes') -> Callable[[list], Union[Tuple, None]]:
+    """Generate the matcher for a FrozenRoute tree. The returned function keeps its
+    source on `__source__` for anyone wanting to read what was generated."""
+    namespace = {'__builtins__': __builtins__}
+    source = _Source(namespace)
+
+    namespace['I'] = _interpreted(root)
+    lines = ['def match(s):', f"    if ':' in s or {repr(WILDCARD)} in s: return I(s)", '    n = len(s)']
+    deviation = (root.wildcard, 0) if root.wildcard is not None else None
+    _at(source, lines, 1, root, 0, deviation, [])
+
+    text = '\n'.join(['\n'.join(helper) for helper in source.helpers] + ['\n'.join(lines)]) + '\n'
+    exec(compile(text, f'<heaven {name}>', 'exec'), namespace)
+
+    for table in source.tables:
+        for label, helper in table.items(): table[label] = namespace[helper]
+
+    match = namespace['match']
+    match.__source__ = text
+    return match
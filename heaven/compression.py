@@ -0,0 +1,208 @@
+"""Compressing response bodies for the clients that accept it.
+
+A `Compression` picks an encoding from the request's `Accept-Encoding`, by the
+client's q-values and then by its own order of preference, and compresses the
+body the router is about to send: in one go for a bytes body, chunk by chunk for
+a streamed one. Each chunk of a stream is flushed as it is compressed, so every
+Server-Sent Event reaches the client when it is produced and a large file never
+sits in memory whole.
+
+gzip and deflate come with Python. Brotli (`br`) is offered when the `brotli`
+package is installed and zstd when `zstandard` is, or when Python ships
+`compression.zstd`.
+
+Bodies under `minimum` bytes, responses already carrying a Content-Encoding or a
+Content-Range, and content types that are compressed already, like images and
+archives, are sent as they are. Anything compressible gets `Vary: Accept-Encoding`
+whether or not this client took an encoding, so shared caches keep the variants
+apart.
+"""
+import zlib
+from typing import Iterable, Union
+
+from .utils import LRU, joined
+
+try: import brotli
+except ImportError: brotli = None
+
+try: from compression import zstd
+except ImportError:
+    zstd = None
+    try: import zstandard
+    except ImportError: zstandard = None
+
+# distinct Accept-Encoding values whose negotiation is remembered; browsers send
+# a handful between them
+NEGOTIATIONS = 64
+
+# content types not worth compressing again, matched by prefix; svg is the one
+# image that is text
+INCOMPRESSIBLE = (
+    b'image/', b'video/', b'audio/', b'font/woff', b'application/zip', b'application/gzip',
+    b'application/x-gzip', b'application/zstd', b'application/x-7z-compressed',
+    b'application/x-rar-compressed', b'application/x-bzip2', b'application/x-xz', b'application/pdf',
+)
+COMPRESSIBLE = (b'image/svg+xml',)
+
+
+class _Zlib(object):
+    __slots__ = ('_compressor',)
+
+    def __init__(self, level: int, wbits: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+    def compress(self, data: bytes) -> bytes: return self._compressor.compress(data)
+    def flush(self) -> bytes: return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+    def finish(self) -> bytes: return self._compressor.flush()
+
+
+class _Brotli(object):
+    __slots__ = ('_compressor',)
+
+    def __init__(self, level: int):
+        # levels stop at 9, short of brotli's qualities 10 and 11, which are far
+        # too slow for bodies built per request
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes: return self._compressor.process(data)
+    def flush(self) -> bytes: return self._compressor.flush()
+    def finish(self) -> bytes: return self._compressor.finish()
+
+
+class _Zstd(object):
+    __slots__ = ('_compressor',)
+
+    def __init__(self, level: int):
+        if zstd is not None: self._compressor = zstd.ZstdCompressor(level)
+        else: self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes: return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        if zstd is not None: return self._compressor.flush(zstd.ZstdCompressor.FLUSH_BLOCK)
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes: return self._compressor.flush()
+
+
+# encoding -> a function of the level returning a fresh encoder
+ENCODERS = {'gzip': lambda level: _Zlib(level, 31), 'deflate': lambda level: _Zlib(level, 15)}
+if brotli is not None: ENCODERS['br'] = _Brotli
+if zstd is not None or zstandard is not None: ENCODERS['zstd'] = _Zstd
+
+# the order encodings are preferred in when a client rates them the same
+PREFERENCE = ('br', 'zstd', 'gzip', 'deflate')
+
+
+def _vary(w):
+    for name, value in w.headers:
+        if name.lower() != b'vary': continue
+        if b'accept-encoding' in value.lower() or value.strip() == b'*': return
+        w.header('Vary', f'{value.decode()}, Accept-Encoding')
+        return
+    w.header('Vary', 'Accept-Encoding')
+
+
+class Compression(object):
+    """Responses compressed at `level` (1 to 9, higher is smaller and slower) with
+    the first of `encodings` the client accepts, when the body is at least
+    `minimum` bytes. `encodings` defaults to every one available, in PREFERENCE
+    order.
+
+    `compressed` counts the responses compressed; `before` and `after` add up the
+    bytes of the bodies compressed whole, so their ratio is what it saved."""
+    def __init__(self, level: int = 6, minimum: int = 500, encodings: Union[Iterable[str], None] = None):
+        if not 1 <= level <= 9: raise ValueError('Compression levels run from 1 to 9')
+        if encodings is None: encodings = [encoding for encoding in PREFERENCE if encoding in ENCODERS]
+        for encoding in encodings:
+            if encoding not in PREFERENCE: raise ValueError(f'Unknown content encoding "{encoding}"')
+            if encoding not in ENCODERS: raise ValueError(f'The "{encoding}" encoding needs its package installed: brotli for br, zstandard for zstd')
+        self.level = level
+        self.minimum = minimum
+        self.encodings = tuple(encodings)
+        self.compressed = 0
+        self.before = 0
+        self.after = 0
+        self._negotiated = LRU(maxsize=NEGOTIATIONS)
+
+    def negotiate(self, accept: Union[list, str, None]) -> Union[str, None]:
+        """The encoding to answer a request sending `accept` as its Accept-Encoding
+        with, or None to send the body as it is. A header sent more than once is
+        read as the one list it is equivalent to."""
+        accept = joined(accept)
+        if not accept: return None
+        encoding = self._negotiated.get(accept, False)
+        if encoding is not False: return encoding
+
+        weights = {}
+        for part in accept.lower().split(','):
+            name, _, parameters = part.partition(';')
+            weight = 1.0
+            parameter = parameters.strip()
+            if parameter.startswith('q='):
+                try: weight = float(parameter[2:])
+                except ValueError: weight = 0.0
+            weights[name.strip()] = weight
+        default = weights.get('*', 0.0)
+        best, encoding = 0.0, None
+        for candidate in self.encodings:
+            weight = weights.get(candidate, default)
+            if weight > best: best, encoding = weight, candidate
+        self._negotiated.put(accept, encoding)
+        return encoding
+
+    def compressible(self, w) -> bool:
+        """Whether the response on `w` is worth compressing at all."""
+        status = w.status
+        if status < 200 or status == 204 or status == 206 or status == 304: return False
+        for name, value in w.headers:
+            name = name.lower()
+            if name == b'content-encoding' or name == b'content-range': return False
+            if name == b'content-type':
+                kind = value.lower()
+                if kind.startswith(INCOMPRESSIBLE) and not kind.startswith(COMPRESSIBLE): return False
+        body = w.body
+        return hasattr(body, '__aiter__') or (isinstance(body, bytes) and len(body) >= self.minimum)
+
+    def apply(self, accept: Union[list, str, None], w) -> bool:
+        """Compress the body on `w` for a client sending `accept`, setting the
+        headers that go with it. False means it was left as it was."""
+        if not self.compressible(w): return False
+        _vary(w)
+        encoding = self.negotiate(accept)
+        if encoding is None: return False
+
+        encoder = ENCODERS[encoding](self.level)
+        body = w.body
+        # encoded before any header changes, so a failure leaves the response whole
+        if not hasattr(body, '__aiter__'): compressed = encoder.compress(body) + encoder.finish()
+        w.header('Content-Encoding', encoding)
+        for name, value in w.headers:
+            if name.lower() != b'etag': continue
+            # the encoded bytes differ from the ones a strong ETag vouches for
+            if not value.startswith(b'W/'): w.header('ETag', f'W/{value.decode()}')
+            break
+        if hasattr(body, '__aiter__'):
+            w.body = self._stream(body, encoder)
+            w.header('Content-Length', None)
+        else:
+            self.before += len(body)
+            self.after += len(compressed)
+            w.body = compressed
+            if any(name.lower() == b'content-length' for name, _ in w.headers): w.header('Content-Length', str(len(compressed)))
+        self.compressed += 1
+        return True
+
+    @staticmethod
+    async def _stream(body, encoder):
+        try:
+            async for chunk in body:
+                if not chunk: continue
+                if isinstance(chunk, str): chunk = chunk.encode()
+                # flushed every chunk, so each event or piece goes out when it is made
+                yield encoder.compress(chunk) + encoder.flush()
+            yield encoder.finish()
+        finally:
+            # closed early by a client leaving, so the body's generator stops too
+            aclose = getattr(body, 'aclose', None)
+            if aclose is not None: await aclose()
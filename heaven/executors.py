@@ -0,0 +1,164 @@
+"""Where the router runs handler code that must not run on the event loop.
+
+Sync handlers and hooks are called on the loop thread unless an app asks for
+threads, so one blocking call in them holds up every request the worker is
+serving. `Threads` is the pool a Router hands such calls to when asked, created
+on first use and shut down with the app's lifespan.
+
+CPU-bound work gains nothing from threads while the GIL is held, so routes
+registered with `cpu=True` go to `Processes` instead. Only picklable values cross
+into a worker process: the handler gets a `Work` describing the request and
+returns what the response should be, which `respond` writes back.
+"""
+from asyncio import CancelledError, gather, wrap_future
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextvars import copy_context
+from multiprocessing import get_context
+from threading import Lock
+from typing import Any, Callable, Union
+
+
+class Threads(object):
+    """A bounded ThreadPoolExecutor owned by one Router, with gauges.
+
+    `queued` counts calls handed over that no thread has picked up yet, `active`
+    the ones running now and `completed` the ones finished, however they ended.
+    """
+    def __init__(self, workers: Union[int, None] = None):
+        self.workers = workers
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self._executor = None
+        self._lock = Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='heaven')
+            # report the size the pool settled on when left to choose
+            self.workers = self._executor._max_workers
+        return self._executor
+
+    def _call(self, function: Callable, args: tuple):
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+        try: return function(*args)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+
+    async def run(self, function: Callable, *args):
+        """Call `function(*args)` on a pool thread and wait for it without blocking
+        the loop. Context variables set by earlier hooks are visible to it."""
+        with self._lock: self.queued += 1
+        try: future = self.executor.submit(copy_context().run, self._call, function, args)
+        except BaseException:
+            with self._lock: self.queued -= 1
+            raise
+        try: return await wrap_future(future)
+        except CancelledError:
+            # a call cancelled before any thread took it never runs _call; one
+            # already running cannot be stopped and settles the gauges itself
+            if future.cancel():
+                with self._lock: self.queued -= 1
+            raise
+
+    def shutdown(self):
+        """Stop the threads once the calls already handed over finish. Using the
+        pool again starts a new one."""
+        executor, self._executor = self._executor, None
+        if executor is not None: executor.shutdown(wait=False)
+
+
+class Work(object):
+    """The picklable part of a request, handed to a `cpu=True` handler in its
+    worker process. Headers repeated on the request arrive as lists."""
+    __slots__ = ('method', 'path', 'route', 'params', 'queries', 'headers', 'body')
+
+    def __init__(self, method: str, path: str, route: str, params: dict, queries: dict, headers: dict, body: bytes):
+        self.method = method
+        self.path = path
+        self.route = route
+        self.params = params
+        self.queries = queries
+        self.headers = headers
+        self.body = body
+
+    def __getstate__(self): return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state): setattr(self, name, value)
+
+    @classmethod
+    def of(cls, r) -> 'Work':
+        return cls(r.method, r.url, r.route, dict(r.params), dict(r.queries), dict(r.headers), r.body)
+
+
+def respond(w, result: Any):
+    """Write what a `cpu=True` handler returned onto the response: a body on its
+    own, or a (status, body) or (status, body, headers) tuple."""
+    if isinstance(result, tuple):
+        status, body, *rest = result
+        w.status = status
+        for key, value in (rest[0] if rest else {}).items(): w.headers = key, value
+    else: body = result
+    w.body = body
+
+
+def _ready(): return True
+
+
+class Processes(object):
+    """A ProcessPoolExecutor owned by one Router for `cpu=True` routes.
+
+    Workers are spawned rather than forked, so nothing of the running loop is
+    copied into them, and handlers must be importable module-level functions.
+    The router starts the workers on lifespan startup and stops them on shutdown;
+    without a lifespan the pool starts on first use. `pending` counts calls
+    submitted and not yet finished, `completed` the ones that finished.
+    """
+    def __init__(self, workers: Union[int, None] = None):
+        self.workers = workers
+        self.pending = 0
+        self.completed = 0
+        self._executor = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context('spawn'))
+            # report the size the pool settled on when left to choose
+            self.workers = self._executor._max_workers
+        return self._executor
+
+    async def start(self):
+        """Spawn the workers now, so the first requests do not wait for them."""
+        executor = self.executor
+        await gather(*[wrap_future(executor.submit(_ready)) for _ in range(self.workers)])
+
+    async def run(self, function: Callable, *args):
+        """Call `function(*args)` in a worker process and wait for what it returns."""
+        self.pending += 1
+        try:
+            future = self.executor.submit(function, *args)
+            try: return await wrap_future(future)
+            except CancelledError:
+                future.cancel()
+                raise
+            except BrokenProcessPool:
+                # a worker died mid-call; the next call starts a fresh pool
+                self._executor = None
+                raise
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    def shutdown(self):
+        """Stop the workers, dropping calls no worker has started. Using the pool
+        again starts a new one."""
+        executor, self._executor = self._executor, None
+        if executor is not None: executor.shutdown(wait=False, cancel_futures=True)
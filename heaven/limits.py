@@ -0,0 +1,120 @@
+"""Concurrency limits for groups of routes, so one heavy endpoint cannot take every
+slot a worker has.
+
+A `Limit` admits up to `limit` requests at once. Past that, requests wait in a
+bounded queue for at most `wait` seconds; a full queue or an expired wait sheds
+the request, which the router answers with 503 and a Retry-After header. Slots
+are handed straight to the oldest waiter on release, so a queued request is never
+overtaken by one arriving later.
+
+An adaptive Limit moves `limit` between 1 and the configured concurrency the way
+TCP moves its window: every request answered within the target latency adds
+1/limit, so the limit grows by about one per limit-full of requests, and one
+answered slower multiplies it by BACKOFF, at most once per round trip. The target
+is the given `latency`, or TOLERANCE times the fastest recent response.
+"""
+from asyncio import CancelledError, get_running_loop
+from collections import deque
+from time import monotonic
+from typing import Union
+
+# multiplicative decrease applied to an adaptive limit when responses run slow
+BACKOFF = 0.9
+
+# how much slower than the fastest recent response still counts as healthy
+TOLERANCE = 2.0
+
+# how far each response pulls the fastest recent response towards itself, so the
+# baseline follows a service that got slower for good
+DRIFT = 0.01
+
+
+def _expire(waiter, waiters: deque):
+    if waiter.done(): return
+    waiters.remove(waiter)
+    waiter.set_result(False)
+
+
+class Limit(object):
+    """At most `concurrency` requests at once, up to `queue` more waiting up to
+    `wait` seconds each. `inflight`, `queued`, `admitted` and `shed` are gauges and
+    counters for metrics; `limit` is the current ceiling, which only moves when
+    `adaptive`."""
+    def __init__(self, concurrency: int, queue: Union[int, None] = None, wait: Union[float, None] = 1.0, adaptive=False, latency: Union[float, None] = None):
+        if concurrency < 1: raise ValueError('A concurrency limit must admit at least one request')
+        self.maximum = concurrency
+        self.limit = float(concurrency)
+        self.queue = concurrency if queue is None else queue
+        self.wait = wait
+        self.adaptive = adaptive
+        self.latency = latency
+        self.inflight = 0
+        self.admitted = 0
+        self.shed = 0
+        self._waiters = deque()
+        self._floor = None
+        self._calm = 0.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def retry_after(self) -> int:
+        """Seconds a shed client is told to wait before trying again."""
+        return max(int(self.wait or 0) + 1, 1)
+
+    async def acquire(self) -> bool:
+        """Take a slot, queueing for one if need be. False means the request was
+        shed: the queue was full or the wait ran out."""
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            self.admitted += 1
+            return True
+        if len(self._waiters) >= self.queue:
+            self.shed += 1
+            return False
+
+        loop = get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        timer = None
+        if self.wait is not None: timer = loop.call_later(self.wait, _expire, waiter, self._waiters)
+        try: admitted = await waiter
+        except CancelledError:
+            # a slot handed over just as the request was cancelled goes to the next one
+            if waiter.done() and not waiter.cancelled() and waiter.result(): self.release()
+            elif waiter in self._waiters: self._waiters.remove(waiter)
+            raise
+        finally:
+            if timer is not None: timer.cancel()
+        if admitted: self.admitted += 1
+        else: self.shed += 1
+        return admitted
+
+    def release(self, elapsed: Union[float, None] = None):
+        """Give a slot back, `elapsed` seconds after it was taken, and hand it on."""
+        self.inflight -= 1
+        if self.adaptive and elapsed is not None: self._adapt(elapsed)
+        waiters = self._waiters
+        while waiters and self.inflight < int(self.limit):
+            waiter = waiters.popleft()
+            if waiter.done(): continue
+            self.inflight += 1
+            waiter.set_result(True)
+
+    def _adapt(self, elapsed: float):
+        floor = self._floor
+        if floor is None or elapsed < floor: floor = elapsed
+        else: floor += (elapsed - floor) * DRIFT
+        self._floor = floor
+
+        if elapsed <= (self.latency or floor * TOLERANCE):
+            self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+            return
+        now = monotonic()
+        # one decrease per round trip: the responses finishing now were all admitted
+        # under the same limit, and cutting for each of them would collapse it
+        if now >= self._calm:
+            self.limit = max(1.0, self.limit * BACKOFF)
+            self._calm = now + elapsed
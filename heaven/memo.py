@@ -0,0 +1,231 @@
+"""Memoized functions with bounded memory.
+
+What `Router.keep` is given stays for as long as the app runs, so a lookup cached
+there grows with every distinct argument it sees. A function decorated with
+`app.cached` keeps at most `maxsize` results, each for at most `ttl` seconds,
+dropping the least recently used first, and forgets them on demand: one result
+by the arguments it was called with, or every result carrying a tag.
+
+Concurrent calls missing on the same arguments share one computation. The first
+one runs the function; the others wait for it and get its result, or the error
+it raised, which is never stored. Sync functions share across threads the same
+way, so a threaded route blocks on a load already under way instead of repeating
+it.
+"""
+from asyncio import get_running_loop, shield
+from collections import OrderedDict
+from functools import wraps
+from inspect import iscoroutinefunction
+from threading import Event, Lock
+from time import monotonic
+from typing import Callable, Hashable, Iterable, Union
+
+# separates the positional arguments in a key from the keyword ones
+_KEYWORDS = object()
+
+# what a lookup answers when there is no usable result
+_MISSING = object()
+
+
+def _key(args: tuple, kwargs: dict) -> tuple:
+    if not kwargs: return args
+    return args + (_KEYWORDS,) + tuple(sorted(kwargs.items()))
+
+
+class _Entry(object):
+    __slots__ = ('value', 'expires', 'tags')
+
+    def __init__(self, value, expires: Union[float, None], tags: tuple):
+        self.value = value
+        self.expires = expires
+        self.tags = tags
+
+
+class _Load(object):
+    # `waiter` is a Future for coroutine functions and an Event for sync ones;
+    # `outcome` is (True, value), (False, error) or None for a load cut short
+    __slots__ = ('waiter', 'outcome', 'tags')
+
+    def __init__(self, waiter, tags: tuple):
+        self.waiter = waiter
+        self.outcome = None
+        self.tags = tags
+
+
+class Memo(object):
+    """The results of one function, at most `maxsize` of them (None for no bound),
+    each kept `ttl` seconds (None for no expiry). `key` turns the arguments into
+    the key instead of using them as they are, and `tags` are the tags every
+    result carries, or a function of the arguments returning them.
+
+    `hits` and `misses` count calls answered from memory or not, `loads` the
+    times the function actually ran, and `evictions` and `expirations` the
+    results dropped for room or for age."""
+    def __init__(self, function: Callable, ttl: Union[float, None] = None, maxsize: Union[int, None] = 1024, tags: Union[Iterable[str], Callable] = (), key: Union[Callable, None] = None):
+        if ttl is not None and ttl <= 0: raise ValueError('A cached result must be kept for a positive number of seconds')
+        if maxsize is not None and maxsize < 1: raise ValueError('A cache must hold at least one result')
+        self.function = function
+        self.name = f'{function.__module__}.{function.__qualname__}'
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._tags = tags if callable(tags) else tuple(tags)
+        self._key = key
+        self._entries = OrderedDict()
+        # tag -> keys of the results carrying it
+        self._tagged = {}
+        self._loads = {}
+        # sync functions may be called from many threads at once
+        self._lock = Lock()
+
+    def __len__(self) -> int: return len(self._entries)
+
+    def key(self, *args, **kwargs) -> Hashable:
+        """The key the result of calling with these arguments is kept under."""
+        if self._key is not None: return self._key(*args, **kwargs)
+        return _key(args, kwargs)
+
+    def invalidate(self, *args, **kwargs) -> bool:
+        """Forget the result of calling with these arguments. A load of it under
+        way finishes for its callers but is not kept."""
+        key = self.key(*args, **kwargs)
+        with self._lock:
+            self._loads.pop(key, None)
+            return self._discard(key)
+
+    def invalidate_tag(self, tag: str) -> int:
+        """Forget every result carrying `tag`, returning how many there were."""
+        with self._lock:
+            for key, load in list(self._loads.items()):
+                if tag in load.tags: del self._loads[key]
+            keys = list(self._tagged.get(tag, ()))
+            for key in keys: self._discard(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tagged.clear()
+            self._loads.clear()
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires is None or monotonic() < entry.expires:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.value
+            self._discard(key)
+            self.expirations += 1
+        self.misses += 1
+        return _MISSING
+
+    def _discard(self, key) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None: return False
+        for tag in entry.tags:
+            keys = self._tagged.get(tag)
+            if keys is None: continue
+            keys.discard(key)
+            if not keys: del self._tagged[tag]
+        return True
+
+    def _store(self, key, value, tags: tuple):
+        self._discard(key)
+        self._entries[key] = _Entry(value, monotonic() + self.ttl if self.ttl else None, tags)
+        for tag in tags: self._tagged.setdefault(tag, set()).add(key)
+        if self.maxsize is None: return
+        while len(self._entries) > self.maxsize:
+            self._discard(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _begin(self, key, args: tuple, kwargs: dict, waiter) -> _Load:
+        tags = tuple(self._tags(*args, **kwargs)) if callable(self._tags) else self._tags
+        load = self._loads[key] = _Load(waiter, tags)
+        self.loads += 1
+        return load
+
+    def _finish(self, key, load: _Load, outcome):
+        load.outcome = outcome
+        # an invalidation while loading took the load out, and the result is stale
+        if self._loads.get(key) is not load: return
+        del self._loads[key]
+        if outcome is not None and outcome[0]: self._store(key, outcome[1], load.tags)
+
+    async def acall(self, args: tuple, kwargs: dict):
+        """Call a coroutine function through the cache."""
+        key = self.key(*args, **kwargs)
+        value = self._lookup(key)
+        if value is not _MISSING: return value
+
+        load = self._loads.get(key)
+        if load is not None:
+            # shielded, so a caller that is cancelled does not cancel the load
+            outcome = await shield(load.waiter)
+            # the loading call was cancelled, so load afresh
+            if outcome is None: return await self.acall(args, kwargs)
+            succeeded, value = outcome
+            if succeeded: return value
+            raise value
+
+        load = self._begin(key, args, kwargs, get_running_loop().create_future())
+        outcome = None
+        try:
+            value = await self.function(*args, **kwargs)
+            outcome = True, value
+            return value
+        except Exception as e:
+            outcome = False, e
+            raise
+        finally:
+            self._finish(key, load, outcome)
+            load.waiter.set_result(outcome)
+
+    def call(self, args: tuple, kwargs: dict):
+        """Call a sync function through the cache."""
+        key = self.key(*args, **kwargs)
+        with self._lock:
+            value = self._lookup(key)
+            if value is not _MISSING: return value
+            load = self._loads.get(key)
+            leading = load is None
+            if leading: load = self._begin(key, args, kwargs, Event())
+
+        if not leading:
+            load.waiter.wait()
+            outcome = load.outcome
+            if outcome is None: return self.call(args, kwargs)
+            succeeded, value = outcome
+            if succeeded: return value
+            raise value
+
+        outcome = None
+        try:
+            value = self.function(*args, **kwargs)
+            outcome = True, value
+            return value
+        except Exception as e:
+            outcome = False, e
+            raise
+        finally:
+            with self._lock: self._finish(key, load, outcome)
+            load.waiter.set()
+
+    def wrap(self) -> Callable:
+        """The function to call in place of the one memoized, with this Memo on its
+        `memo` attribute and `invalidate` and `clear` on it for convenience."""
+        function, memo = self.function, self
+        if iscoroutinefunction(function):
+            @wraps(function)
+            async def cached(*args, **kwargs): return await memo.acall(args, kwargs)
+        else:
+            @wraps(function)
+            def cached(*args, **kwargs): return memo.call(args, kwargs)
+        cached.memo = memo
+        cached.invalidate = memo.invalidate
+        cached.clear = memo.clear
+        return cached
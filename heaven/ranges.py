@@ -0,0 +1,71 @@
+"""Byte ranges, so a client can fetch part of a file: the rest of a broken
+download, or the piece of a video it is seeking to.
+
+`parse` reads a `Range: bytes=...` header against the size of the file. What it
+returns decides the answer: None to ignore the header and send the whole file,
+an empty list for 416, one range for a 206 with a Content-Range, and several for
+a 206 with a `multipart/byteranges` body, each part carrying its own headers.
+"""
+from email.utils import mktime_tz, parsedate_tz
+from typing import List, Tuple, Union
+
+# ranges honoured in one request; asking for more gets the whole file, so many
+# tiny overlapping ranges cannot turn one request into a lot of seeking
+MAXIMUM = 16
+
+
+def parse(header: Union[str, list], size: int) -> Union[List[Tuple[int, int]], None]:
+    """The (first, last) byte offsets, both inclusive, that `header` asks for in
+    a file of `size` bytes. None when the header is malformed, sent more than
+    once or asks for too much to be worth honouring, [] when none of it lies
+    within the file."""
+    if isinstance(header, list): return None
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs: return None
+    specs = specs.split(',')
+    if len(specs) > MAXIMUM: return None
+
+    ranges = []
+    for spec in specs:
+        first, dash, last = spec.strip().partition('-')
+        if not dash: return None
+        try:
+            if not first:
+                # a suffix: the final `last` bytes
+                length = int(last)
+                if length < 0: return None
+                if length == 0 or size == 0: continue
+                ranges.append((max(size - length, 0), size - 1))
+                continue
+            first = int(first)
+            last = int(last) if last else max(first, size - 1)
+        except ValueError: return None
+        if first < 0 or last < first: return None
+        if first >= size: continue
+        ranges.append((first, min(last, size - 1)))
+    return ranges
+
+
+def current(header: Union[str, list], etag: Union[str, None], modified: float) -> bool:
+    """Whether an If-Range `header` names the version of the file with `etag`,
+    last modified at the `modified` timestamp, so its ranges may be sent. The
+    comparison is strong: a weak ETag never matches, a date must be exact, and a
+    header sent more than once names no one version."""
+    if isinstance(header, list): return False
+    header = header.strip()
+    if header.startswith('W/'): return False
+    if header.startswith('"'): return etag is not None and header == etag
+    try: return int(modified) == mktime_tz(parsedate_tz(header))
+    except (TypeError, ValueError, OverflowError): return False
+
+
+def multipart(ranges: List[Tuple[int, int]], size: int, content_type: str, boundary: str) -> Tuple[List[bytes], int]:
+    """The bytes sent before each range of a `multipart/byteranges` body, then
+    the closing delimiter, and the length of the whole body."""
+    parts = []
+    for index, (first, last) in enumerate(ranges):
+        delimiter = '' if index == 0 else '\r\n'
+        parts.append(f'{delimiter}--{boundary}\r\nContent-Type: {content_type}\r\nContent-Range: bytes {first}-{last}/{size}\r\n\r\n'.encode())
+    parts.append(f'\r\n--{boundary}--\r\n'.encode())
+    length = sum(len(part) for part in parts) + sum(last - first + 1 for first, last in ranges)
+    return parts, length
@@ -0,0 +1,85 @@
+"""Token-bucket rate limiting without a bucket object per client.
+
+A bucket refilling one token every `emission` seconds, holding at most `burst`,
+is fully described by one float: the theoretical arrival time (TAT) at which it
+would be full again. A request at `now` is allowed when taking a token would not
+push the TAT more than a bucket's worth (`window` seconds) past `now`. This is the
+generic cell rate algorithm: one dict lookup, some arithmetic and one store per
+request, whatever the rate.
+
+Clients are spread over SHARDS shards, each keeping two generations of TATs. A
+TAT is never more than `window` ahead of when it was stored, so a generation
+retired `window` seconds ago only holds buckets that are full again and can be
+dropped whole, without scanning for stale clients. The dicts hold only strings
+and floats, which the garbage collector does not track, so many thousands of
+clients add nothing to collection pauses.
+"""
+from math import floor
+from time import monotonic
+from typing import Tuple
+
+# independent dicts the clients are spread over, a power of two
+SHARDS = 16
+
+
+class _Shard(object):
+    __slots__ = ('current', 'previous', 'rotates')
+
+    def __init__(self):
+        self.current = {}
+        self.previous = {}
+        self.rotates = 0.0
+
+
+class RateLimiter(object):
+    """`rate` requests every `per` seconds for each key, in bursts of up to `burst`
+    (default: `rate`). `allowed` and `limited` count the decisions taken."""
+    def __init__(self, rate: float, per: float = 1.0, burst: int = None):
+        if rate <= 0 or per <= 0: raise ValueError('A rate limit needs a positive rate and period')
+        self.rate = rate
+        self.per = per
+        self.burst = int(burst or rate)
+        if self.burst < 1: raise ValueError('A rate limit must allow bursts of at least one request')
+        self.emission = per / rate
+        self.window = self.burst * self.emission
+        self.allowed = 0
+        self.limited = 0
+        # the BEFORE hook Router.ratelimit registered, for Earth to bypass in tests
+        self.hook = None
+        self._shards = tuple(_Shard() for _ in range(SHARDS))
+
+    def __len__(self) -> int:
+        """Keys currently remembered, including some whose bucket is full again."""
+        return sum(len(shard.current) + len(shard.previous) for shard in self._shards)
+
+    def hit(self, key: str, now: float = None) -> Tuple[bool, int, float]:
+        """Take a token for `key`. Returns whether the request is allowed, the
+        tokens left, and the seconds until the bucket is full again if allowed or
+        until the next token if not."""
+        if now is None: now = monotonic()
+        shard = self._shards[hash(key) & (SHARDS - 1)]
+        if now >= shard.rotates:
+            # a shard left alone for two windows has nothing worth keeping
+            shard.previous = shard.current if now < shard.rotates + self.window else {}
+            shard.current = {}
+            shard.rotates = now + self.window
+
+        current = shard.current
+        tat = current.get(key)
+        if tat is None:
+            # carried over, so a client that keeps coming back is never dropped
+            tat = shard.previous.pop(key, None)
+            if tat is None: tat = now
+            else: current[key] = tat
+        if tat < now: tat = now
+
+        emission = self.emission
+        tat += emission
+        earliest = tat - self.window
+        if now < earliest:
+            self.limited += 1
+            return False, 0, earliest - now
+
+        current[key] = tat
+        self.allowed += 1
+        return True, floor((now - earliest) / emission + 1e-9), tat - now
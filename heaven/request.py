@@ -1,8 +1,7 @@
 from typing import Any, TYPE_CHECKING, Union, TypeVar, Generic
-from urllib.parse import parse_qs
 
 from heaven.form import Form
-from heaven.utils import CONVERTERS, Lookup, boolean
+from heaven.utils import NO_HINT, Lookup, collect_headers, compile_queryhint, parse_querystring
 from orjson import dumps, loads
 from pytastic import Pytastic
 
@@ -20,8 +19,8 @@ class Request(Generic[T]):
         self._form = None
         self._route = None
         self._receive = receive
-        self.__qh = {}
-        self.__queryhint = ''
+        # (queryhint, coercions), assigned from the matched route node as it is
+        self._hint = NO_HINT
         self._scope = scope
         self._subdomain, self._headers = metadata
         self._params = None
@@ -33,6 +32,7 @@ class Request(Generic[T]):
         self._mounted_from_application = None
         self._streaming = False
         self._streamed = False
+        self._deadline = None
 
     @property
     def json(self):
@@ -60,23 +60,16 @@ class Request(Generic[T]):
         qs = self._scope.get("query_string", b"")
         if isinstance(qs, bytes):
             qs = qs.decode()
-        
-        parsed = parse_qs(qs, keep_blank_values=True)
+
+        coercions = self._hint[1]
         qsd = {}
-        
-        for key, values in parsed.items():
-            coercion = self.__qh.get(key)
-            processed_values = []
-            for value in values:
-                if coercion:
-                    try: value = coercion(value)
+        for key, values in parse_querystring(qs).items():
+            coercion = coercions.get(key)
+            if coercion:
+                for index, value in enumerate(values):
+                    try: values[index] = coercion(value)
                     except: pass
-                processed_values.append(value)
-            
-            if len(processed_values) == 1:
-                qsd[key] = processed_values[0]
-            else:
-                qsd[key] = processed_values
+            qsd[key] = values[0] if len(values) == 1 else values
         return qsd
 
     @property
@@ -108,6 +101,13 @@ class Request(Generic[T]):
             self._cookies = csd
         return self._cookies
 
+    @property
+    def deadline(self) -> Union[float, None]:
+        """Seconds left before the route's timeout answers this request with 504,
+        for passing on to downstream calls, or None when the route has no timeout."""
+        if self._deadline is None: return None
+        return self._deadline.remaining
+
     @property
     def form(self) -> Union["Form", None]:
         """The parsed form, or None when the request has no form content type.
@@ -127,12 +127,9 @@ class Request(Generic[T]):
 
     @property
     def headers(self):
-        if not self._headers:
-            self._headers = {}
-            for header in self._scope.get("headers"):
-                key = header[0].decode() if isinstance(header[0], bytes) else header[0]
-                value = header[1].decode() if isinstance(header[1], bytes) else header[1]
-                self._headers[key] = value
+        # the router only scans for the Host header, leaving the rest to be
+        # decoded here if a hook or handler asks for them
+        if not self._headers: self._headers = collect_headers(self._scope)
         return self._headers
 
     @property
@@ -146,27 +143,13 @@ class Request(Generic[T]):
 
     @property
     def qh(self) -> str:
-        return self.__queryhint
+        return self._hint[0]
 
     @qh.setter
     def qh(self, val: str):
         '''Here we process queryhints so heaven can try to coerce query string values'''
-        if self.__queryhint: raise ValueError('Querystring metadata already set')
-
-        # Query values keep their historical lenient boolean, where an unreadable
-        # value reads as False. Route segments use the strict parse from CONVERTERS
-        # because there a failure means the route simply does not match.
-        def lenient_boolean(v: str) -> bool:
-            try: return boolean(v)
-            except ValueError: return False
-
-        kinds = {**CONVERTERS, 'bool': lenient_boolean}
-        for pair in val.split('&'):
-            try: k, v = pair.split(':')
-            except: continue
-            kind = kinds.get(v)
-            if kind: self.__qh[k] = kind
-        self.__queryhint = val
+        if self._hint[0]: raise ValueError('Querystring metadata already set')
+        self._hint = (val, compile_queryhint(val))
 
     @property
     def route(self):
@@ -1,15 +1,21 @@
 import mimetypes
 from http import HTTPStatus
-from os import path, sep
+from os import path, stat
+from stat import S_ISREG
 from typing import Any, AsyncGenerator, Optional, Union, TYPE_CHECKING
 import traceback
 import sys
+from secrets import token_hex
 
 from functools import singledispatch, update_wrapper
 from orjson import dumps, loads
 
 from .constants import MESSAGE_NOT_FOUND, STATUS_NOT_FOUND
+from .assets import confine
 from .context import Context
+from .etags import fresh, httpdate, weak
+from .ranges import current, multipart, parse as byteranges
+from .sendfile import CHUNK, FileBody
 from .tutorials import get_guardian_angel_html, ASYNC_RENDER, NO_TEMPLATING, SYNC_RENDER
 from .request import Request
 if TYPE_CHECKING:
@@ -70,6 +76,10 @@ class Response():
         self._status = STATUS_NOT_FOUND
         self._template = None
         self._mounted_from_application : Union['Router', None] = None
+        # the route's Compression, False for none, or None for the app's
+        self._compression = None
+        # whether 200 answers to GET and HEAD get an ETag and may become 304s
+        self._etag = False
 
     @MethodDispatch
     def abort(self, payload):
@@ -99,6 +109,13 @@ class Response():
         self._deferred.append(func)
         return self
 
+    def _encode(self):
+        # a dict or list body as the JSON bytes the router would send, for code
+        # that needs them before it does
+        if not isinstance(self._body, (dict, list)): return
+        self._body = dumps(self._body)
+        if not any(name.lower() == b'content-type' for name, _ in self._headers): self.header('Content-Type', 'application/json')
+
     @property
     def deferred(self):
         return len(self._deferred) > 0
@@ -287,7 +304,7 @@ class Response():
         template = templater.get_template(name)
         return await template.render_async({'ctx': self._ctx, **contexts})
 
-    def file(self, filepath: str, filename: Optional[str] = None, chunk_size: int = 4096, within: Optional[str] = None) -> 'Response':
+    def file(self, filepath: str, filename: Optional[str] = None, chunk_size: int = CHUNK, within: Optional[str] = None) -> 'Response':
         """Serve a file from the filesystem with streaming support.
 
         `within` confines the read to one directory. It can be anywhere the process
@@ -300,35 +317,65 @@ class Response():
             res.file(req.params.get('name'), within='/var/lib/app/uploads')
         """
         if within is not None:
-            root = path.realpath(within)
-            filepath = path.realpath(path.join(root, filepath))
-            if filepath != root and not filepath.startswith(root + sep):
+            filepath = confine(within, filepath)
+            if filepath is None:
                 self.status = HTTPStatus.NOT_FOUND
                 self.body = b'File not found'
                 return self
 
-        if not path.isfile(filepath):
+        try: info = stat(filepath)
+        except (OSError, ValueError): info = None
+        if info is None or not S_ISREG(info.st_mode):
             self.status = HTTPStatus.NOT_FOUND
             self.body = b'File not found'
             return self
 
         mime_type, _ = mimetypes.guess_type(filepath)
-        self.headers = 'Content-Type', mime_type or 'application/octet-stream'
+        content_type = mime_type or 'application/octet-stream'
+        self.headers = 'Content-Type', content_type
         
         if filename:
             self.headers = 'Content-Disposition', f'attachment; filename="{filename}"'
         else:
             self.headers = 'Content-Disposition', f'inline; filename="{path.basename(filepath)}"'
 
-        async def file_sender():
-            from aiofiles import open as async_open
-            async with async_open(filepath, mode='rb') as f:
-                while True:
-                    chunk = await f.read(chunk_size)
-                    if not chunk:
-                        break
-                    yield chunk
-
-        self.body = file_sender()
-        self.status = HTTPStatus.OK
+        if self._etag:
+            # the stat answers a client that is up to date without opening the file
+            etag = weak(info.st_size, info.st_mtime_ns)
+            self.headers = 'ETag', etag
+            self.headers = 'Last-Modified', httpdate(info.st_mtime)
+            if fresh(self._req.headers, etag, info.st_mtime):
+                self.status = HTTPStatus.NOT_MODIFIED
+                self.body = b''
+                return self
+
+        size = info.st_size
+        self.headers = 'Accept-Ranges', 'bytes'
+        ranges = parts = None
+        request = self._req
+        header = request.headers.get('range') if request is not None and request.method == 'GET' else None
+        if header:
+            # ranges of a version the client no longer holds would not fit together
+            condition = request.headers.get('if-range')
+            if condition is None or current(condition, None, info.st_mtime): ranges = byteranges(header, size)
+        if ranges == []:
+            self.status = HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+            self.headers = 'Content-Range', f'bytes */{size}'
+            self.body = b''
+            return self
+        if not ranges:
+            # the stat gives the length, so a whole file is not sent chunked
+            self.headers = 'Content-Length', str(size)
+        elif len(ranges) == 1:
+            first, last = ranges[0]
+            self.headers = 'Content-Range', f'bytes {first}-{last}/{size}'
+            self.headers = 'Content-Length', str(last - first + 1)
+        else:
+            boundary = token_hex(12)
+            parts, length = multipart(ranges, size, content_type, boundary)
+            self.headers = 'Content-Type', f'multipart/byteranges; boundary={boundary}'
+            self.headers = 'Content-Length', str(length)
+
+        self.body = FileBody(path.abspath(filepath), size, ranges, parts, chunk_size)
+        self.status = HTTPStatus.PARTIAL_CONTENT if ranges else HTTPStatus.OK
         return self
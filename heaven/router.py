@@ -1,11 +1,13 @@
-from asyncio import gather, get_running_loop, sleep as asleep
+from asyncio import CancelledError, gather, get_running_loop, sleep as asleep
 from collections import deque
 from functools import wraps
 from http import HTTPStatus
 from importlib import import_module
 from inspect import iscoroutinefunction
+from math import ceil
+from pickle import PicklingError, dumps as pickled
 from os import path, getcwd
-from typing import Any, Callable, Tuple, Union, overload, TypeVar, Generic
+from typing import Any, Callable, Iterable, Tuple, Union, overload, TypeVar, Generic
 
 T = TypeVar("T")
 
@@ -49,11 +51,23 @@ from .constants import (
     URL_ERROR_MESSAGE,
     WILDCARD
 )
-from .utils import CONVERTERS, parameter_parts, preprocessor
+from .assets import AssetCache
+from .caching import REVALIDATE, ResponseCache
+from .cancellation import Deadline, Disconnects, Watch
+from .codegen import generate
+from .coalesce import Coalesce
+from .compression import Compression
+from .etags import conditional, tag
+from .executors import Processes, Threads, Work, respond
+from .limits import Limit
+from .memo import Memo
+from .ratelimit import RateLimiter
+from .sendfile import PATHSEND, FileBody
+from .utils import CONVERTERS, LRU, NO_HINT, compile_queryhint, host_header, parameter_parts, subdomain_of
 from .request import Request
 from .response import Response
 from .context import Context, Look, Key
-from .errors import AbortException, ParameterError, SubdomainError, UrlDuplicateError, UrlError
+from .errors import AbortException, SubdomainError, UrlDuplicateError, UrlError
 
 methods = ['get', 'post', 'put', 'delete', 'connect', 'head', 'options', 'patch']
 
@@ -62,13 +76,32 @@ Handler = Union[Handles, str]
 
 SEPARATOR = INDEX = "/"
 
+# how many paths Routes remembers the Allow set of
+ALLOWANCES = 1024
+
+# how many distinct Host headers Router.__call__ remembers the engine for
+HOSTS = 1024
+
+# keyword options a route can be registered with besides `stream`
+ROUTE_OPTIONS = ('threaded', 'cpu', 'timeout', 'coalesce', 'compress', 'etag')
+
+# a frozen node with at most this many children scans a tuple instead of keeping a dict
+FANOUT = 8
+
 
 def _closure_mounted_application(handler: Handles, mounted: 'Router'):
+    # stay sync for a sync handler, so the parent still sees one it may run on its threads
+    if not iscoroutinefunction(handler):
+        def delegate(req: Request, res: Response, ctx: Context):
+            req.mounted = mounted
+            res._mounted_from_application = mounted
+            handler(req, res, ctx)
+        return delegate
+
     async def delegate(req: Request, res: Response, ctx: Context):
         req.mounted = mounted
         res._mounted_from_application = mounted
-        if iscoroutinefunction(handler): await handler(req, res, ctx)
-        else: handler(req, res, ctx)
+        await handler(req, res, ctx)
     return delegate
 
 
@@ -105,9 +138,9 @@ def _set_content_type(req: Request, res: Response):
 
 class _Probe(object):
     """Stand-in for a Request when walking the tree purely to ask whether a path
-    would match. Route.match writes params/qh as it goes; here they are discarded."""
+    would match. Route.match writes params/_hint as it goes; here they are discarded."""
     params = None
-    qh = None
+    _hint = None
 
 
 OPENAPI_TYPES = {
@@ -149,30 +182,15 @@ def _string_to_function_handler(handler: Handler):
     return handler
 
 
-class Parameter(object):
-    def __init__(self, value: Any, potentials: dict[str, str]):
-        '''Potentials are a dictionary of potential parameter names'''
-        self._value = value
-        self._potentials = potentials
-
-    def resolve(self, parameter_address: str) -> Tuple[str, Any]:
-        param = self._potentials.get(parameter_address)
-        if not param: raise ParameterError(f'no parameter registered for {parameter_address}')
-
-        key, kind = parameter_parts(param)
-        if not kind: return key, self._value
-
-        # the type name was checked when the route was registered, so it is present
-        try: return key, CONVERTERS[kind](self._value)
-        except Exception: raise ParameterError(f'{self._value!r} is not a valid {kind}')
-
-
-
 class Route(object):
     def __init__(self, route: str, handler: Callable, router: 'Router') -> None:
         self.heaven_instance = router
-        self.parameterized = {}
+        # on a node carrying a route: (name, converter or None) for each of its
+        # `:` segments in order, so matching resolves params without parsing
+        self.parameters = ()
         self.queryhint = None
+        # (queryhint, its compiled coercions), handed to each request as it is
+        self.hint = None
         self.route = route
         self.handler = handler
         self.children = {}
@@ -181,7 +199,7 @@ class Route(object):
         matched: str = ''
         node: Route = self
         route_at_deviation = '/'.join(routes)
-        parameters = []
+        values = []
 
         # grand father deviation point in case
         # we are dealing from the start with a catch all route
@@ -190,12 +208,16 @@ class Route(object):
         while routes:
             route = routes.popleft()
             current_node = node.children.get(route)
-            if not current_node:
+            if current_node:
+                # a url spelling out ':' walks into the parameter node without
+                # supplying a value for it; keep the positions lined up regardless
+                if route == ':': values.append(None)
+            else:
                 # is there a parameterized child?
                 current_node = node.children.get(':')
                 if current_node:
                     # we are going to use this later when we know the address that has been matched
-                    parameters.append(Parameter(value = route, potentials = current_node.parameterized))
+                    values.append(route)
 
                     if(node.children.get('*')):
                         """If there was also a wildcard seeing as placeholder ':' takes precedence, then
@@ -241,8 +263,9 @@ class Route(object):
         # its value means this route does not describe the url after all, so treat
         # it as a miss rather than handing the handler an unconverted string.
         try:
-            for parameter in parameters: r.params = parameter.resolve(node.route)
-        except ParameterError:
+            for (name, convert), value in zip(node.parameters, values):
+                if value is not None: r.params = name, (convert(value) if convert else value)
+        except Exception:
             # back out to a wildcard we passed on the way here, the same way a
             # structural miss does, and drop any params resolved before the failure
             if deviation_point:
@@ -250,7 +273,7 @@ class Route(object):
                 r.params = '*', route_at_deviation
                 return deviation_point.route, deviation_point.handler
             return matched, self.not_found
-        r.qh = node.queryhint
+        r._hint = node.hint
         return node.route, node.handler
 
     def not_found(self, r: Request, w: Response, c: Context):
@@ -258,8 +281,178 @@ class Route(object):
         w.body = b'Not found'
 
 
+class FrozenRoute(object):
+    """The compact, read-only form `Routes.freeze()` turns a Route tree into. Nodes are
+    slotted; a node with no children holds None rather than an empty dict; a few
+    children are held as two tuples and only a wide fan-out keeps a dict; and each
+    run of interior nodes with a single literal child is merged into the node above
+    it radix-style, leaving the merged segments in `prefix` to be checked in place.
+
+    Matching gives exactly the answers Route.match does, including `:` winning over
+    `*` and falling back to the wildcard passed at the point the walk deviated.
+    """
+    __slots__ = ('prefix', 'route', 'handler', 'queryhint', 'hint', 'parameters', 'keys', 'nodes', 'param', 'wildcard')
+
+    def __init__(self, node: Route, compress=True):
+        prefix = []
+        while compress and node.route is None and len(node.children) == 1:
+            (label, child), = node.children.items()
+            if label == ':' or label == WILDCARD: break
+            prefix.append(label)
+            node = child
+        self.prefix = tuple(prefix) or None
+
+        self.route = node.route
+        self.handler = node.handler
+        self.queryhint = node.queryhint
+        self.hint = node.hint
+        self.parameters = node.parameters
+
+        # `:` and `*` stay among the keys as well, since the walk looks every
+        # segment up literally first and a url can spell either out. A `*` node
+        # is answered with its own route when it catches a path, so it is never
+        # the head of a merged run.
+        children = {label: FrozenRoute(child, label != WILDCARD) for label, child in node.children.items()}
+        self.param = children.get(':')
+        self.wildcard = children.get(WILDCARD)
+        if not children: self.keys = self.nodes = None
+        elif len(children) <= FANOUT: self.keys, self.nodes = tuple(children), tuple(children.values())
+        else: self.keys, self.nodes = children, None
+
+    def terminals(self):
+        """Yield (route, node) for every node in this tree that carries a route."""
+        if self.route is not None: yield self.route, self
+        for child in (self.nodes or (self.keys.values() if self.keys else ())):
+            yield from child.terminals()
+
+    def match(self, routes: list, r: Request) -> Tuple[str, Callable[[Request, Response, Context], None]]:
+        node: FrozenRoute = self
+        deviation_point = node.wildcard
+        deviation = 0
+        values = []
+        index, count = 0, len(routes)
+
+        while index < count:
+            route = routes[index]
+            keys = node.keys
+            if keys is None: current_node = None
+            elif node.nodes is None: current_node = keys.get(route)
+            elif route in keys: current_node = node.nodes[keys.index(route)]
+            else: current_node = None
+
+            if current_node is not None:
+                if route == ':': values.append(None)
+            else:
+                current_node = node.param
+                if current_node is None:
+                    if node.wildcard is not None:
+                        r.params = '*', '/'.join(routes[index:])
+                        return node.wildcard.route, node.wildcard.handler
+                    break
+
+                values.append(route)
+                if node.wildcard is not None:
+                    deviation = index
+                    deviation_point = node.wildcard
+
+            node = current_node
+            index += 1
+
+            prefix = node.prefix
+            if prefix:
+                # the url has to spell out every merged segment; stopping short of
+                # them or leaving them is the walk failing on an interior node
+                if tuple(routes[index:index + len(prefix)]) != prefix: break
+                index += len(prefix)
+        else:
+            if not (deviation_point and not node.route):
+                if not node.route: return '', self.not_found
+                try:
+                    for (name, convert), value in zip(node.parameters, values):
+                        if value is not None: r.params = name, (convert(value) if convert else value)
+                except Exception:
+                    if not deviation_point: return '', self.not_found
+                    r._params = None
+                else:
+                    r._hint = node.hint
+                    return node.route, node.handler
+
+        if deviation_point:
+            r.params = '*', '/'.join(routes[deviation:])
+            return deviation_point.route, deviation_point.handler
+        return '', self.not_found
+
+    not_found = Route.not_found
+
+
+def _patterns(matched: str) -> list:
+    """The wildcard patterns covering `matched`, broadest first, then `matched`
+    itself: /*, /users/*, /users/:id/*, /users/:id/orders. Each appears once, so
+    a wildcard route is not listed again after its own pattern."""
+    parts = matched.strip(SEPARATOR).split(SEPARATOR)
+    patterns = []
+    for position in range(len(parts)):
+        joinedparts = "/".join(parts[:position])
+        _ = '' if position == 0 else SEPARATOR
+        patterns.append(f'/{joinedparts}{_}*')
+    if patterns[-1] != matched: patterns.append(matched)
+    return patterns
+
+
+class Pipeline(object):
+    """What running one matched route for one request method takes, worked out once
+    instead of per request: the BEFORE and AFTER hooks that apply, already ordered,
+    deduplicated and filtered by their method scopes, and whether each of them and
+    the handler must be awaited. Routes builds these lazily and drops them all when
+    a route or hook is registered."""
+    __slots__ = ('handler', 'call', 'asynchronous', 'befores', 'afters', 'threaded', 'cpu', 'timeout', 'limits', 'coalesce', 'cache', 'compress', 'etag')
+
+    def __init__(self, handler: Callable, befores: tuple, afters: tuple, options: Union[dict, None] = None, limits: tuple = (), cache: Union[ResponseCache, None] = None):
+        self.handler = handler
+        try: handler.__requesthandler__
+        except: call = handler
+        else: call = handler.__call__
+        self.call = call
+        self.asynchronous = iscoroutinefunction(call)
+        self.befores = befores
+        self.afters = afters
+
+        # whether the sync hooks and handler go to the app's threads; None leaves
+        # it to the app
+        self.threaded = (options or {}).get('threaded')
+        # whether the handler is called with a Work in the app's processes instead
+        self.cpu = bool((options or {}).get('cpu'))
+        # seconds the hooks and handler get before a 504; None leaves it to the app
+        # and 0 turns an app-wide default off
+        self.timeout = (options or {}).get('timeout')
+        # the concurrency Limits covering the route, narrowest first
+        self.limits = limits
+        # how identical requests share one handler run, if they do
+        self.coalesce = (options or {}).get('coalesce')
+        # the narrowest ResponseCache covering the route, for GET and HEAD only
+        self.cache = cache
+        # how the route's responses are compressed: a Compression, False for not at
+        # all, or None to leave it to the app
+        self.compress = (options or {}).get('compress')
+        # whether GET and HEAD answers get ETags and 304s; None leaves it to the app
+        self.etag = (options or {}).get('etag')
+
+    @staticmethod
+    async def hooks(hooks: tuple, r: Request, w: Response, c: Context, offload: Union[Callable, None] = None):
+        # Earth bypasses are read per request since tests register them at any time.
+        # An app whose earth was never touched has none, so skip creating it.
+        earth = getattr(r._application, '_earth', None)
+        bypasses = earth._bypasses if earth else None
+        for hook, original, asynchronous in hooks:
+            if w._abort: raise AbortException
+            if bypasses and (hook in bypasses or original in bypasses): continue
+            if asynchronous: await hook(r, w, c)
+            elif offload: await offload(hook, r, w, c)
+            else: hook(r, w, c)
+
+
 class Routes(object):
-    def __init__(self):
+    def __init__(self, cache_size: Union[int, None] = None):
         self.afters = {}
         self.befores = {}
 
@@ -272,27 +465,99 @@ class Routes(object):
         self.cache = {CONNECT: {}, DELETE: {}, GET: {}, HEAD: {}, OPTIONS: {}, PATCH: {}, POST: {}, PUT: {}, TRACE: {}, SOCKET: {}}
         self.routes = {}
 
+        # Exact-match table for routes with no `:param` or `*` segment, keyed by
+        # method then by the path with its slashes stripped. Such a path can only
+        # ever resolve to its own node, so one dict lookup replaces the tree walk.
+        self.statics = {}
+
+        # Optional bounded memo of walks that matched, keyed by (method, path), with
+        # the params already converted. Off unless a size is given; any route being
+        # added or removed empties it since either can change what a path resolves to.
+        self.resolved = LRU(maxsize=cache_size) if cache_size else None
+
+        # compiled Pipeline per (request method, matched route)
+        self.pipelines = {}
+
+        # route pattern, wildcards included -> the concurrency Limit on it
+        self.limits = {}
+
+        # route pattern, wildcards included -> the ResponseCache on it
+        self.caches = {}
+
+        # What answering 404/405 needs, kept so a miss costs as few walks as possible:
+        # the methods registered on each static path, the methods with a route
+        # starting at each literal first segment, and the methods whose tree takes a
+        # `:` or `*` at its root and so might match any path at all.
+        self.allows = {}
+        self.prefixes = {}
+        self.catchalls = set()
+
+        # method -> FrozenRoute once freeze() has compacted the trees, and the
+        # matcher generated from each when freezing was asked to generate code
+        self.frozen = {}
+        self.generated = {}
+
+        # Bounded memo of allowed() by path. Scanners repeat the same handful of
+        # probes, and a path no tree can match is remembered as an empty set.
+        self.allowances = LRU(maxsize=ALLOWANCES)
+
         # (method, route) pairs whose body is handed to the handler in chunks
         # instead of being buffered before it runs
         self.streams = set()
 
-    def add(self, method: str, route: str, handler: Callable, router: 'Router', stream=False):
+        # (method, route) -> the ROUTE_OPTIONS it was registered with, if any
+        self.options = {}
+
+    def add(self, method: str, route: str, handler: Callable, router: 'Router', stream=False, **options):
         """
         method: one of POST, GET, OPTIONS... etc - i.e. the HTTP method
         route: the route url/endpoint
         handler: function corresponding to the signature of a heaven handler
         stream: leave the body unread so the handler can consume it with req.stream()
+        threaded: True to run the route's sync hooks and handler on the app's threads,
+            False to keep them on the event loop, leaving it to the app when omitted
+        cpu: True to call the handler in the app's processes with a picklable Work
+            instead of (req, res, ctx), writing back what it returns
+        timeout: seconds the route's hooks and handler may take before the request
+            is answered with 504, 0 for no limit, leaving it to the app when omitted
+        coalesce: True or a Coalesce, to run the handler of a GET route once for
+            identical requests arriving while it runs and answer them all with it
+        compress: True or a Compression to compress the route's responses, False
+            to never compress them, leaving it to the app when omitted
+        etag: True to give the route's GET and HEAD answers ETags and answer
+            clients holding the current one with 304, leaving it to the app when omitted
         """
+        for option in options:
+            if option not in ROUTE_OPTIONS: raise TypeError(f'Unknown route option "{option}" for {method} {route}')
+        if options.get('cpu'):
+            if iscoroutinefunction(handler): raise TypeError(f'{method} {route}: a cpu route needs a sync handler')
+            if stream: raise TypeError(f'{method} {route}: a cpu route cannot stream its body')
+            # only a module-level function reaches a worker process, so say so now
+            try: pickled(handler)
+            except (PicklingError, AttributeError, TypeError) as e:
+                raise TypeError(f'{method} {route}: a cpu route needs a picklable handler ({e})') from None
+        if options.get('coalesce'):
+            # sharing one answer is only sound for requests that change nothing
+            if method != GET: raise TypeError(f'{method} {route}: only GET routes can coalesce')
+            if options['coalesce'] is True: options['coalesce'] = Coalesce()
+        if options.get('compress') is True: options['compress'] = Compression()
+
         queryhint = ''
         if len(route.split('?')) > 1:
             route, queryhint = route.split('?', 1)
+        # compiled once here and kept on the route node, so a request is only handed it
+        hint = (queryhint, compile_queryhint(queryhint)) if queryhint else NO_HINT
 
-        if stream: self.streams.add((method, route))
+        if self.frozen: raise RuntimeError(f'Cannot register {method} {route}: the routes have been frozen')
 
-        # ensure the method and route combo has not been already registered
+        # ensure the method and route combo has not been already registered, before
+        # anything about the route is recorded over the one that was
         try: assert self.cache.get(method, {}).get(route) is None
         except AssertionError: raise UrlDuplicateError(f'URL: {route} already registered for METHOD: {method}')
 
+        if stream: self.streams.add((method, route))
+        if options: self.options[(method, route)] = options
+        self.invalidate()
         self.cache[method][route] = handler
 
         # here we check and set the root to be a route node i.e. / with no handler
@@ -306,6 +571,7 @@ class Routes(object):
             route_node.route = route
             route_node.handler = handler
             route_node.queryhint = queryhint
+            route_node.hint = hint
             return
 
         # Otherwise strip and split the routes into stops or stoppable
@@ -314,6 +580,7 @@ class Routes(object):
 
         # get the length of the routes so we can use for validation checks in a loop later
         stop_at = len(routes) - 1
+        parameters = []
 
         for index, part in enumerate(routes):
             # this gives us ':' and the remainder i.e. xxx if heaven is of the form :xxx
@@ -328,6 +595,7 @@ class Routes(object):
                         f'Unknown type "{kind}" for route parameter ":{remainder}" in {route}. '
                         f'Valid types are: {", ".join(sorted(CONVERTERS))}'
                     )
+                parameters.append((name, CONVERTERS[kind] if kind else None))
 
             new_route_node = route_node.children.get(label)
             if not new_route_node:
@@ -335,13 +603,22 @@ class Routes(object):
                 route_node.children[label] = new_route_node
 
             route_node = new_route_node
-            if remainder: route_node.parameterized[route] = remainder
 
             if index == stop_at:
                 assert route_node.handler is None, f'Handler already registered for route: {route}'
                 route_node.route = route
                 route_node.handler = handler
                 route_node.queryhint = queryhint
+                route_node.hint = hint
+                route_node.parameters = tuple(parameters)
+
+        if not any(part == WILDCARD or part.startswith(':') for part in routes):
+            self.statics.setdefault(method, {})[route.strip(SEPARATOR)] = route_node
+            if method != SOCKET: self.allows.setdefault(route.strip(SEPARATOR), set()).add(method)
+
+        head = routes[0]
+        if head == WILDCARD or head.startswith(':'): self.catchalls.add(method)
+        else: self.prefixes.setdefault(head, set()).add(method)
 
     @property
     def after(self):
@@ -350,6 +627,7 @@ class Routes(object):
     @after.setter
     def after(self, pair):
         route, handler = pair
+        self.pipelines.clear()
         routes = self.afters.get(route)
         if routes:
             routes.append(handler)
@@ -363,6 +641,7 @@ class Routes(object):
     @before.setter
     def before(self, values):
         route, handler = values
+        self.pipelines.clear()
         routes = self.befores.get(route)
         if routes:
             routes.append(handler)
@@ -382,6 +661,7 @@ class Routes(object):
         store[key] = None if existing is None else (existing | scope)
 
     def add_before(self, route, handler, methods=None):
+        self.pipelines.clear()
         self._scope(self.beforemethods, route, handler, methods)
         routes = self.befores.get(route)
         if routes:
@@ -390,6 +670,7 @@ class Routes(object):
             self.befores[route] = [handler]
 
     def add_after(self, route, handler, methods=None):
+        self.pipelines.clear()
         self._scope(self.aftermethods, route, handler, methods)
         routes = self.afters.get(route)
         if routes:
@@ -397,6 +678,40 @@ class Routes(object):
         else:
             self.afters[route] = [handler]
 
+    def invalidate(self):
+        """Forget everything derived from the registered routes and hooks. Called by
+        every registration; anything editing `befores`/`afters` directly, as mount
+        does, must call it too."""
+        self.pipelines.clear()
+        self.allowances.clear()
+        if self.resolved is not None: self.resolved.clear()
+
+    def freeze(self, generate_code=False):
+        """Swap each method's tree for its compact FrozenRoute form and let the
+        mutable nodes go. The roots stay, childless, since they carry the root
+        route and the router the engine was first registered on. Registering or
+        removing a route afterwards raises.
+
+        With `generate_code` each frozen tree is also compiled into a generated
+        Python function (see heaven.codegen), which resolve() then prefers."""
+        if generate_code and not self.generated:
+            self.freeze()
+            self.generated = {method: generate(frozen, method) for method, frozen in self.frozen.items()}
+            self.invalidate()
+        if self.frozen: return
+        for method, route_node in self.routes.items():
+            frozen = FrozenRoute(route_node, compress=False)
+            self.frozen[method] = frozen
+            route_node.children = {}
+
+            # point the exact-match table at the frozen nodes, or it would keep
+            # the mutable ones alive
+            static = self.statics.get(method)
+            if static:
+                terminals = dict(frozen.terminals())
+                for path, node in static.items(): static[path] = terminals[node.route]
+        self.invalidate()
+
     def get_handler(self, routes):
         for route in routes:...
         return None, None
@@ -412,21 +727,67 @@ class Routes(object):
         if route == SEPARATOR:
             return route_node.route, route_node.handler, route_node
 
-        matched, handler = route_node.match(deque(route.strip(SEPARATOR).split('/')), r)
+        # a path naming a static route exactly can only land on that route, since
+        # a literal segment always wins over `:` and `*` during the walk
+        static = self.statics.get(method)
+        if static:
+            node = static.get(route.strip(SEPARATOR))
+            if node:
+                r._hint = node.hint
+                return node.route, node.handler, route_node
+
+        resolved = self.resolved
+        if resolved is not None:
+            hit = resolved.get((method, route))
+            if hit:
+                matched, handler, params, hint = hit
+                if params: r._params = dict(params)
+                r._hint = hint
+                return matched, handler, route_node
+
+        generated = self.generated.get(method)
+        frozen = self.frozen.get(method)
+        if generated:
+            found = generated(route.strip(SEPARATOR).split(SEPARATOR))
+            if found is None: matched, handler = '', None
+            else:
+                matched, handler, params, hint = found
+                if params: r._params = params
+                if hint is not None: r._hint = hint
+        elif frozen: matched, handler = frozen.match(route.strip(SEPARATOR).split(SEPARATOR), r)
+        else: matched, handler = route_node.match(deque(route.strip(SEPARATOR).split('/')), r)
+        if matched and resolved is not None:
+            params = tuple(r._params.items()) if r._params else ()
+            resolved.put((method, route), (matched, handler, params, r._hint))
         return matched, handler, route_node
 
     def allowed(self, route: str):
         """The HTTP methods that have a handler registered for this path."""
-        allowed = set()
-        for method, route_node in self.routes.items():
-            if method == SOCKET or not route_node: continue
-            if route == SEPARATOR:
-                if route_node.handler: allowed.add(method)
-                continue
-            matched, _ = route_node.match(deque(route.strip(SEPARATOR).split('/')), _Probe())
-            if matched: allowed.add(method)
+        remembered = self.allowances.get(route)
+        if remembered is not None: return set(remembered)
+
+        if route == SEPARATOR:
+            allowed = {method for method, route_node in self.routes.items() if method != SOCKET and route_node.handler}
+        else:
+            path = route.strip(SEPARATOR)
+
+            # Static registrations answer for themselves. Beyond those only a tree
+            # holding a route under this first segment, or a `:`/`*` at its root,
+            # could match, so a path under no registered prefix walks nothing.
+            allowed = set(self.allows.get(path, ()))
+            candidates = self.prefixes.get(path.split(SEPARATOR, 1)[0], set()) | self.catchalls
+            for method in candidates - allowed:
+                route_node = self.frozen.get(method) or self.routes.get(method)
+                if method == SOCKET or not route_node: continue
+                segments = path.split(SEPARATOR)
+                generated = self.generated.get(method)
+                if generated: matched = (generated(segments) or ('',))[0]
+                else: matched, _ = route_node.match(segments if self.frozen else deque(segments), _Probe())
+                if matched: allowed.add(method)
+
         # anything answering GET answers HEAD too
         if GET in allowed: allowed.add(HEAD)
+        self.allowances.put(route, frozenset(allowed))
         return allowed
 
     def unmatched(self, scope, method: str, route: str, w: Response):
@@ -515,14 +876,47 @@ class Routes(object):
 
         # call all pre handle request hooks but first reset response_writer from not found to found
         w.status = 200; w.body = b''
+        pipeline = self.pipeline(r.method, matched, handler)
+        w._compression = pipeline.compress
+        etag = pipeline.etag
+        if etag is None: etag = getattr(application, '_etag', False)
+        w._etag = etag = bool(etag) and method in (GET, HEAD)
+
+        # sync code goes to the app's threads when the route or the app asks for it
+        threaded = pipeline.threaded
+        if threaded is None: threaded = getattr(application, '_threaded', False)
+        offload = application.threads.run if threaded and application else None
+
+        # with the body read, receive has nothing left to report but the client leaving
+        watch = Watch(receive) if scope['type'] == 'http' and not r._streaming else None
+        timeout = pipeline.timeout
+        if timeout is None: timeout = getattr(application, '_timeout', None)
+        deadline = r._deadline = Deadline(timeout) if timeout and method != SOCKET else None
+        # when each limit let the request in: the time queued for a slot is not the
+        # endpoint's latency, and an adaptive limit would cut itself for its backlog
+        admitted = []
         try:
-            await self.xhooks(self.befores, self.beforemethods, matched, r, w, c, before=True)
+            # shed before any hook runs, so an overloaded route costs as little as possible
+            for limit in pipeline.limits:
+                if not await limit.acquire():
+                    w.status = 503
+                    w.body = b"Service Unavailable"
+                    w.header('Retry-After', str(limit.retry_after))
+                    return w
+                admitted.append(time.monotonic())
+
+            await pipeline.hooks(pipeline.befores, r, w, c, offload)
 
             # call request handler
             if w._abort: raise AbortException
-            try: handler.__requesthandler__
-            except: pass
-            else: handler = handler.__call__
+            cache = pipeline.cache
+            if cache is not None:
+                # a hit already holds what the handler and AFTER hooks made of it
+                if cache.serve(r, w, lambda: self.revalidate(scope, r._subdomain, application)):
+                    if etag: conditional(r, w)
+                    return w
+                before = list(w.headers)
+            handler = pipeline.call
             if method == SOCKET:
                 await send({'type': 'websocket.accept'})
                 async def sender(data):
@@ -538,27 +932,80 @@ class Routes(object):
                         if msg['type'] == 'websocket.receive':
                             return msg.get('text') or msg.get('bytes')
 
-                if iscoroutinefunction(handler): await handler(sender, receiver, r, c)
+                if pipeline.asynchronous: await handler(sender, receiver, r, c)
                 else: handler(sender, receiver, r, c)
+            elif pipeline.coalesce is not None:
+                await pipeline.coalesce.share(r, w, lambda: self.invoke(pipeline, r, w, c, offload, application))
             else:
-                if iscoroutinefunction(handler): await handler(r, w, c)
+                if pipeline.cpu: respond(w, await application.processes.run(pipeline.handler, Work.of(r)))
+                elif pipeline.asynchronous: await handler(r, w, c)
+                elif offload: await offload(handler, r, w, c)
                 else: handler(r, w, c)
 
             # call all post handle request hooks
-            await self.xhooks(self.afters, self.aftermethods, matched, r, w, c)
+            await pipeline.hooks(pipeline.afters, r, w, c, offload)
+            if etag and not w._abort:
+                # hashed as the bytes that go on the wire, and stored with the response
+                w._encode()
+                tag(w)
+            # a HEAD is answered from what a GET stored but never stores its own
+            if cache is not None and method == GET: cache.store(r, w, before)
+            if etag and not w._abort: conditional(r, w)
         except AbortException:
             return w
+        except CancelledError:
+            # both checked, so each clears its own cancellation when both fired
+            disconnected = watch is not None and watch.caught()
+            expired = deadline is not None and deadline.caught()
+            if disconnected:
+                # nobody will read the response, but AFTER hooks may release what
+                # the BEFORE hooks took, so they still run
+                w._disconnected = True
+                w.status = 499
+                if application: application.disconnects.handlers += 1
+                # the timeout bounded the handler, not this cleanup
+                if deadline is not None: deadline.stop()
+                try: await pipeline.hooks(pipeline.afters, r, w, c, offload)
+                except Exception: pass
+            elif expired:
+                # like the 500 below, keep what the BEFORE hooks put on w (CORS...)
+                w.status = 504
+                w.body = b"Gateway Timeout"
+            else: raise
         except Exception as e:
             # Preserve response w (which carries BEFORE hook headers like CORS)
             # and attach the exception so __call__ can log/debug it.
             w._unhandled_error = e
             w.status = 500
             w.body = b"Internal Server Error"
+        finally:
+            if watch is not None: watch.stop()
+            if deadline is not None: deadline.stop()
+            if admitted:
+                now = time.monotonic()
+                for limit, started in zip(pipeline.limits, admitted): limit.release(now - started)
 
         return w
 
+    async def revalidate(self, scope: dict, subdomain: str, application):
+        """Run a cached GET again with nobody waiting for the answer, so its
+        ResponseCache stores a fresh one."""
+        async def receive(): return {'type': 'http.request', 'body': b'', 'more_body': False}
+        async def send(message): pass
+        await self.handle({**scope, 'method': GET, REVALIDATE: True}, receive, send, (subdomain, None), application)
+
+    @staticmethod
+    async def invoke(pipeline: Pipeline, r: Request, w: Response, c: Context, offload: Union[Callable, None], application):
+        """Run the route's handler for one HTTP request, as handle does inline."""
+        if pipeline.cpu: respond(w, await application.processes.run(pipeline.handler, Work.of(r)))
+        elif pipeline.asynchronous: await pipeline.call(r, w, c)
+        elif offload: await offload(pipeline.call, r, w, c)
+        else: pipeline.call(r, w, c)
+
     def remove(self, method: str, route: str):
         assert method in METHODS
+        if self.frozen: raise RuntimeError(f'Cannot remove {method} {route}: the routes have been frozen')
+        self.invalidate()
         route_node = self.routes.get(method)
         if not route_node: return
         if not route_node.children: return
@@ -574,24 +1021,41 @@ class Routes(object):
                 route_node.route = None
                 route_node.handler = None
                 self.cache[method][route] = None
-
-    async def xhooks(self, hookstore, methodstore, matched, r: Request, w: Response, c: Context, before=False):
-        """Run the hooks registered for `matched`, outermost pattern first on the way
-        in and innermost first on the way out, so BEFORE/AFTER pairs nest properly:
+                self.statics.get(method, {}).pop(route.strip(SEPARATOR), None)
+                self.allows.get(route.strip(SEPARATOR), set()).discard(method)
+                # prefixes and catchalls are left as they are: another route may
+                # share them, and a stale entry only costs a walk that then misses
+
+    def pipeline(self, method: str, matched: str, handler: Callable) -> Pipeline:
+        """The compiled Pipeline for `matched` under request `method`, built on first use."""
+        pipeline = self.pipelines.get((method, matched))
+        if pipeline is None or pipeline.handler is not handler:
+            options = self.options.get((method, matched))
+            # a HEAD answered by the GET route runs with that route's options
+            if options is None and method == HEAD: options = self.options.get((GET, matched))
+            pipeline = Pipeline(
+                handler,
+                self.chain(self.befores, self.beforemethods, matched, method, before=True),
+                self.chain(self.afters, self.aftermethods, matched, method),
+                options,
+                tuple(self.limits[pattern] for pattern in reversed(_patterns(matched)) if pattern in self.limits),
+                next((self.caches[pattern] for pattern in reversed(_patterns(matched)) if pattern in self.caches), None) if method in (GET, HEAD) else None,
+            )
+            self.pipelines[(method, matched)] = pipeline
+        return pipeline
+
+    def chain(self, hookstore, methodstore, matched: str, method: str, before=False) -> tuple:
+        """The hooks registered for `matched` that answer to `method`, outermost pattern
+        first on the way in and innermost first on the way out, so BEFORE/AFTER pairs
+        nest properly:
 
             BEFORE:  /*  ->  /users/*  ->  /users/:id  ->  handler
             AFTER:                         /users/:id  ->  /users/*  ->  /*
-        """
-        parts = matched.strip(SEPARATOR).split(SEPARATOR)
-        wildcards = []
-        for position, part in enumerate(parts):
-            joinedparts = "/".join(parts[:position])
-            _ = '' if position == 0 else SEPARATOR
-            # broadest first i.e. /*, then /users/*, then /users/:id/*
-            wildcards.append(f'/{joinedparts}{_}*')
 
-        if before: patterns = [*wildcards, matched]
-        else: patterns = [matched, *reversed(wildcards)]
+        Each entry is (hook, unwrapped hook, whether it is a coroutine function).
+        """
+        patterns = _patterns(matched)
+        if not before: patterns.reverse()
 
         # A hook registered under several matching patterns still runs only once,
         # at the earliest position it appears in.
@@ -601,28 +1065,17 @@ class Routes(object):
             for hook in hookstore.get(pattern, []):
                 if hook in seen: continue
                 seen.add(hook)
-                hooks.append((pattern, hook))
 
-        for pattern, hook in hooks:
-            if w._abort: raise AbortException
+                # Skip if this registration is method-scoped and the request doesn't match
+                hook_methods = methodstore.get((pattern, hook))
+                if hook_methods and method not in hook_methods: continue
 
-            # Skip if this registration is method-scoped and the request doesn't match
-            hook_methods = methodstore.get((pattern, hook))
-            if hook_methods and r.method not in hook_methods:
-                continue
+                hooks.append((hook, getattr(hook, '__wrapped__', hook), iscoroutinefunction(hook)))
+        return tuple(hooks)
 
-            # Check for Earth bypasses
-            application = r._application
-            if application and hasattr(application, 'earth'):
-                if hook in application.earth._bypasses:
-                    continue
-                # Also check unwrapped original if it exists
-                original = getattr(hook, '__wrapped__', hook)
-                if original in application.earth._bypasses:
-                    continue
-
-            if iscoroutinefunction(hook): await hook(r, w, c)
-            else: hook(r, w, c)
+    async def xhooks(self, hookstore, methodstore, matched, r: Request, w: Response, c: Context, before=False):
+        """Run the hooks registered for `matched` in the order `chain` gives them."""
+        await Pipeline.hooks(self.chain(hookstore, methodstore, matched, r.method, before), r, w, c)
 
 
 class SchemaRegistry:
@@ -673,36 +1126,59 @@ class SubdomainContext:
     
     def AFTER(self, route: str, handler: Handler): self.app.AFTER(route, handler, subdomain=self.name)
     def BEFORE(self, route: str, handler: Handler): self.app.BEFORE(route, handler, subdomain=self.name)
-    def CONNECT(self, route: str, handler: Handler): self.app.CONNECT(route, handler, subdomain=self.name)
-    def DELETE(self, route: str, handler: Handler): self.app.DELETE(route, handler, subdomain=self.name)
-    def GET(self, route: str, handler: Handler): self.app.GET(route, handler, subdomain=self.name)
-    def HEAD(self, route: str, handler: Handler): self.app.HEAD(route, handler, subdomain=self.name)
-    def HTTP(self, route: str, handler: Handler): self.app.HTTP(route, handler, subdomain=self.name)
-    def OPTIONS(self, route: str, handler: Handler): self.app.OPTIONS(route, handler, subdomain=self.name)
-    def PATCH(self, route: str, handler: Handler, stream=False): self.app.PATCH(route, handler, subdomain=self.name, stream=stream)
-    def POST(self, route: str, handler: Handler, stream=False): self.app.POST(route, handler, subdomain=self.name, stream=stream)
-    def PUT(self, route: str, handler: Handler, stream=False): self.app.PUT(route, handler, subdomain=self.name, stream=stream)
-    def TRACE(self, route: str, handler: Handler): self.app.TRACE(route, handler, subdomain=self.name)
+    def CONNECT(self, route: str, handler: Handler, **options): self.app.CONNECT(route, handler, subdomain=self.name, **options)
+    def DELETE(self, route: str, handler: Handler, **options): self.app.DELETE(route, handler, subdomain=self.name, **options)
+    def GET(self, route: str, handler: Handler, **options): self.app.GET(route, handler, subdomain=self.name, **options)
+    def HEAD(self, route: str, handler: Handler, **options): self.app.HEAD(route, handler, subdomain=self.name, **options)
+    def HTTP(self, route: str, handler: Handler, **options): self.app.HTTP(route, handler, subdomain=self.name, **options)
+    def OPTIONS(self, route: str, handler: Handler, **options): self.app.OPTIONS(route, handler, subdomain=self.name, **options)
+    def PATCH(self, route: str, handler: Handler, stream=False, **options): self.app.PATCH(route, handler, subdomain=self.name, stream=stream, **options)
+    def POST(self, route: str, handler: Handler, stream=False, **options): self.app.POST(route, handler, subdomain=self.name, stream=stream, **options)
+    def PUT(self, route: str, handler: Handler, stream=False, **options): self.app.PUT(route, handler, subdomain=self.name, stream=stream, **options)
+    def TRACE(self, route: str, handler: Handler, **options): self.app.TRACE(route, handler, subdomain=self.name, **options)
     def SOCKET(self, route: str, handler: Handler): self.app.SOCKET(route, handler, subdomain=self.name)
     def WEBSOCKET(self, route: str, handler: Handler): self.app.WEBSOCKET(route, handler, subdomain=self.name)
     def WS(self, route: str, handler: Handler): self.app.WS(route, handler, subdomain=self.name)
-    def ASSETS(self, folder: str, route=None, relative_to=None): self.app.ASSETS(folder, route, subdomain=self.name, relative_to=relative_to)
-    def abettor(self, method: str, route: str, handler: Handler): self.app.abettor(method, route, handler, subdomain=self.name)
+    def ASSETS(self, folder: str, route=None, relative_to=None, cache=False): return self.app.ASSETS(folder, route, subdomain=self.name, relative_to=relative_to, cache=cache)
+    def abettor(self, method: str, route: str, handler: Handler, **options): self.app.abettor(method, route, handler, subdomain=self.name, **options)
     def doc(self, route: str, title="API Reference", version="0.0.1", favicon=None): self.app.DOCS(route, title, version, subdomain=self.name, favicon=favicon)
     def cors(self, handler=None, **kwargs): return self.app.cors(handler, subdomains=[self.name], **kwargs)
+    def limit(self, route: str, concurrency: int, **kwargs) -> Limit: return self.app.limit(route, concurrency, subdomain=self.name, **kwargs)
+    def ratelimit(self, rate: float, **kwargs) -> RateLimiter: return self.app.ratelimit(rate, subdomains=[self.name], **kwargs)
+    def cache(self, route: str = '/*', **kwargs) -> ResponseCache: return self.app.cache(route, subdomain=self.name, **kwargs)
 
 
 class Router(object):
-    def __init__(self, configurator=None, protect_output=True, allow_partials=False, fail_on_output=True, debug=False, monitor: Union[float, None] = None, max_body_size: Union[int, None] = None):
+    def __init__(self, configurator=None, protect_output=True, allow_partials=False, fail_on_output=True, debug=False, monitor: Union[float, None] = None, max_body_size: Union[int, None] = None, route_cache: Union[int, None] = None, threads: Union[int, None] = None, processes: Union[int, None] = None, timeout: Union[float, None] = None, compress: Union[bool, Compression] = False, etag=False):
         self._debug = debug
         self._max_body_size = max_body_size
+        self._route_cache = route_cache
         self.__ws = None
         self.finalized = False
         self.initializers = deque()
         self.deinitializers = deque()
         self.subdomains = {}
-        self.subdomains[DEFAULT] = Routes()
+        self.subdomains[DEFAULT] = Routes(route_cache)
+        # raw Host header -> (subdomain, engine), emptied whenever a subdomain is added
+        self._hosts = LRU(maxsize=HOSTS)
+        # giving a thread count sends every route's sync hooks and handler to the
+        # pool unless the route says threaded=False; routes can opt in regardless
+        self._threads = Threads(threads)
+        self._threaded = threads is not None
+        # worker processes for cpu=True routes, spawned on lifespan startup if any
+        self._processes = Processes(processes)
+        self._disconnects = Disconnects()
+        # seconds every route gets before a 504, unless registered with its own
+        self._timeout = timeout
+        # how every route's responses are compressed unless it says otherwise
+        self._compression = Compression() if compress is True else (compress or None)
+        # whether every route's GET and HEAD answers get ETags, unless it says otherwise
+        self._etag = etag
         self._buckets = {}
+        # what app.cached memoizes, for counters and invalidation by tag
+        self._memos = []
+        # the SharedCache app.share opened, if any
+        self._shared = None
         self._configuration = _get_configuration(configurator)
         self._templater = None
         self._loader = None
@@ -732,6 +1208,37 @@ class Router(object):
     def _(self):
         return Look(self._buckets)
 
+    @property
+    def threads(self) -> Threads:
+        """The pool sync hooks and handlers of threaded routes run on, with its
+        `workers`, `queued`, `active` and `completed` gauges."""
+        return self._threads
+
+    @property
+    def shared(self):
+        """The SharedCache opened with `share`, for values every worker on the
+        host sees."""
+        if self._shared is None: raise RuntimeError('No shared cache: call app.share(path) first')
+        return self._shared
+
+    @property
+    def memos(self) -> dict:
+        """The Memo behind every function decorated with `cached`, by qualified
+        name, for its `hits`, `misses`, `loads`, `evictions` and `expirations`."""
+        return {memo.name: memo for memo in self._memos}
+
+    @property
+    def disconnects(self) -> Disconnects:
+        """Counts of requests cancelled because their client went away, split into
+        `handlers` and `streams`."""
+        return self._disconnects
+
+    @property
+    def processes(self) -> Processes:
+        """The worker processes cpu routes run on, with its `workers`, `pending`
+        and `completed` gauges."""
+        return self._processes
+
     @property
     def earth(self):
         if not hasattr(self, '_earth'):
@@ -798,22 +1305,33 @@ class Router(object):
                 if message['type'] == 'lifespan.startup':
                     try: await self._register()
                     except: _notify()
+                    if self._computes(): await self._processes.start()
                     await send({'type': 'lifespan.startup.complete'})
                     await self.__rundaemons()
                 elif message['type'] == 'lifespan.shutdown':
                     try: await self._unregister()
                     except: _notify(event=SHUTDOWN)
+                    self._threads.shutdown()
+                    self._processes.shutdown()
+                    if self._shared is not None: self._shared.close()
                     await send({'type': 'lifespan.shutdown.complete'})
 
-        metadata = preprocessor(scope)
-        subdomain = metadata[0]
-        wildcard_engine = self.subdomains.get(WILDCARD)
-        engine: Union[Routes, None] = self.subdomains.get(subdomain)
-        if not engine:
-            engine = wildcard_engine if wildcard_engine else self.subdomains.get(DEFAULT)
+        # the Host header alone picks the engine, so answer repeat hosts from a
+        # bounded cache and leave the other headers undecoded until asked for
+        host = host_header(scope)
+        dispatch = self._hosts.get(host)
+        if dispatch is None:
+            subdomain = subdomain_of(host)
+            wildcard_engine = self.subdomains.get(WILDCARD)
+            engine: Union[Routes, None] = self.subdomains.get(subdomain)
+            if not engine:
+                engine = wildcard_engine if wildcard_engine else self.subdomains.get(DEFAULT)
+            dispatch = subdomain, engine
+            self._hosts.put(host, dispatch)
+        subdomain, engine = dispatch
         if not self._baked: self._bake_schemas()
 
-        response = await engine.handle(scope, receive, send, metadata, self)  # type: ignore
+        response = await engine.handle(scope, receive, send, (subdomain, None), self)  # type: ignore
 
         # If the handler raised an unhandled exception, log it and optionally
         # show Guardian Angel — but keep the same response object so BEFORE
@@ -838,15 +1356,24 @@ class Router(object):
                 response.status = 500
                 response.body = b"Internal Server Error: JSON Serialization Failed"
         
+        # compressed before HEAD drops the body, so both carry the same headers
+        compression = getattr(response, '_compression', None)
+        if compression is None: compression = self._compression
+        if compression and scope['type'] == 'http':
+            # a response that cannot be compressed still goes out as it is
+            try: compression.apply(response._req.headers.get('accept-encoding'), response)
+            except Exception as e: print(f"Compression Error: {e}")
+
         # a HEAD response carries the headers a GET would, but never a body
         if scope.get('method') == HEAD: response.body = b''
 
-        if scope['type'] == 'http':
+        if scope['type'] == 'http' and not getattr(response, '_disconnected', False):
             await send({'type': 'http.response.start', 'headers': response.headers, 'status': response.status})
-            if hasattr(response.body, '__aiter__'):
-                async for chunk in response.body:
-                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
-                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+            body = response.body
+            if isinstance(body, FileBody) and body.whole and PATHSEND in (scope.get('extensions') or {}):
+                # the server sends the file itself, without its bytes passing through Python
+                await send({'type': PATHSEND, 'path': body.path})
+            elif hasattr(body, '__aiter__'): await self._stream(body, receive, send)
             else:
                 await send({'type': 'http.response.body', 'body': response.body, **response.metadata})
 
@@ -854,6 +1381,23 @@ class Router(object):
         if response.deferred:
             await gather(*[func(self) for func in response._deferred])
 
+    async def _stream(self, body, receive, send):
+        """Send an async-iterable body chunk by chunk, closing it early if the
+        client disconnects so a generator stops producing what nobody reads."""
+        watch = Watch(receive)
+        try:
+            async for chunk in body:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        except CancelledError:
+            if not watch.caught(): raise
+            self._disconnects.streams += 1
+            # runs the generator's finally blocks, unless the cancellation already
+            # ended it from inside
+            aclose = getattr(body, 'aclose', None)
+            if aclose: await aclose()
+        finally: watch.stop()
+
     async def __rundaemons(self):
         loop = get_running_loop()
         for daemon in self.__daemons:
@@ -878,13 +1422,17 @@ class Router(object):
             if iscoroutinefunction(deinitializer): await deinitializer(self)
             else: deinitializer(self)
 
-    def abettor(self, method: str, route: str, handler: Handler, subdomain=DEFAULT, router = None, stream=False):
+    def _computes(self) -> bool:
+        """Whether any route was registered with cpu=True."""
+        return any(options.get('cpu') for engine in self.subdomains.values() for options in engine.options.values())
+
+    def abettor(self, method: str, route: str, handler: Handler, subdomain=DEFAULT, router = None, stream=False, **options):
         if not route.startswith('/'): raise UrlError(f'{route} is not a valid route - must start with /')
         handler = _string_to_function_handler(handler)
         engine = self.subdomains.get(subdomain)
         if not isinstance(engine, Routes):
             raise SubdomainError
-        engine.add(method, route, handler, router or self, stream=stream)
+        engine.add(method, route, handler, router or self, stream=stream, **options)
 
     def call(self, handler: str, *args, **kwargs):
         if isinstance(handler, str): handler = _string_to_function_handler(handler)
@@ -917,6 +1465,15 @@ class Router(object):
             loop.create_task(_daemon(app))
         self.__daemons.append(_daemon)
 
+    def freeze(self, generate_code=False):
+        """Compact every subdomain's route trees into their read-only form once all
+        routes are registered. Lookups give the same answers on less memory; any
+        registration after this raises. `generate_code` goes further and compiles
+        each tree into a generated matcher function."""
+        for engine in self.subdomains.values(): engine.freeze(generate_code)
+        self.finalized = True
+        return self
+
     @overload
     def keep(self, key: Key[T], value: T) -> None: ...
     
@@ -929,6 +1486,42 @@ class Router(object):
         else:
             self._buckets[key] = value
 
+    def cached(self, ttl: Union[float, None] = None, maxsize: Union[int, None] = 1024, tags: Union[Iterable[str], Callable] = (), key: Union[Callable, None] = None):
+        """
+        Decorator memoizing a sync or async function by its arguments, for lookups
+        too expensive to repeat and too many to `keep` forever.
+        ttl: seconds a result is kept, None for as long as there is room.
+        maxsize: results kept, least recently used out first; None for no bound.
+        tags: tags every result carries, or a function of the arguments returning
+            them, for `invalidate` to forget groups of results by.
+        key: a function of the arguments returning the key, when they are not
+            hashable or not all of them matter.
+        Concurrent calls missing on the same key run the function once.
+        """
+        def decorate(function: Callable) -> Callable:
+            memo = Memo(function, ttl, maxsize, tags, key)
+            self._memos.append(memo)
+            return memo.wrap()
+        return decorate
+
+    def invalidate(self, *tags: str) -> int:
+        """Forget every result any `cached` function keeps under one of `tags`,
+        returning how many were dropped."""
+        return sum(memo.invalidate_tag(tag) for memo in self._memos for tag in tags)
+
+    def share(self, path: str, slots: int = 4096, slotsize: int = 4096):
+        """
+        Open the cache in the file at `path`, creating it with room for `slots`
+        entries of up to `slotsize` bytes if need be, and make it `app.shared`.
+        Every worker opening the same path reads and writes the same entries.
+        Returns the heaven.shared.SharedCache.
+        """
+        # fcntl is POSIX-only, so apps that never share still import on Windows
+        from .shared import SharedCache
+        if self._shared is not None: self._shared.close()
+        self._shared = SharedCache(path, slots, slotsize)
+        return self._shared
+
     def unkeep(self, key: Union[str, Key[T]]):
         k = key.name if isinstance(key, Key) else key
         value = self._buckets[k]
@@ -1033,6 +1626,89 @@ class Router(object):
             self.OPTIONS("/*", lambda req, res, ctx: None, subdomain=sd)
         return self
 
+    def limit(self, route: str, concurrency: int, queue: Union[int, None] = None, wait: Union[float, None] = 1.0, adaptive=False, latency: Union[float, None] = None, subdomain=DEFAULT) -> Limit:
+        """
+        Admit at most `concurrency` requests at once to `route`, which may be a
+        registered route or a wildcard pattern like `/reports/*` covering a group.
+        Up to `queue` more (default: as many again) wait up to `wait` seconds for a
+        slot; the rest are answered 503 with Retry-After before any hook runs.
+        adaptive: move the limit between 1 and `concurrency` from observed latency,
+            against `latency` seconds if given, else twice the fastest recent response.
+        Returns the Limit, whose `inflight`, `queued`, `admitted` and `shed` are
+        there to be read.
+        """
+        if not route.startswith('/'): raise UrlError(URL_ERROR_MESSAGE)
+        engine = self.subdomains.get(subdomain)
+        if not isinstance(engine, Routes): raise SubdomainError
+        limit = engine.limits[route] = Limit(concurrency, queue, wait, adaptive, latency)
+        engine.invalidate()
+        return limit
+
+    def cache(self, route: str = '/*', ttl: float = 60.0, maxbytes: int = 32 * 1024 * 1024, stale: float = 0.0, vary=(), statuses=(200,), subdomain=DEFAULT) -> ResponseCache:
+        """
+        Keep whole GET responses for `route`, a registered route or a wildcard
+        pattern like `/catalog/*`, and answer repeats of them without running the
+        handler or AFTER hooks. BEFORE hooks still run on every request.
+        ttl: seconds a response is fresh, unless its Cache-Control says otherwise.
+        maxbytes: memory the cache may hold, least recently used out first.
+        stale: seconds past `ttl` a response is still served while it is refreshed
+            in the background.
+        vary: request headers whose values key the response, besides any its Vary
+            header names.
+        statuses: the response statuses worth keeping.
+        Returns the ResponseCache, whose counters are there to be read.
+        """
+        if not route.startswith('/'): raise UrlError(URL_ERROR_MESSAGE)
+        engine = self.subdomains.get(subdomain)
+        if not isinstance(engine, Routes): raise SubdomainError
+        cache = engine.caches[route] = ResponseCache(ttl, maxbytes, stale, vary, statuses)
+        engine.invalidate()
+        return cache
+
+    def ratelimit(self, rate: float, per: float = 1.0, burst: Union[int, None] = None, key: Union[str, Callable, None] = None, route: str = '/*', methods=None, subdomains=None, headers=True) -> RateLimiter:
+        """
+        Allow each client `rate` requests every `per` seconds, in bursts of up to
+        `burst` (default: `rate`), answering the rest with 429 and Retry-After.
+        key: who counts as one client - None for the client IP, a header name such
+            as 'x-api-key' (falling back to the IP without it), or a callable
+            taking the request and returning a string.
+        route: the route or wildcard pattern the limit covers, '/*' for everything.
+        methods: only count requests with these methods.
+        subdomains: list of subdomain names to apply it to (defaults to ["www"]).
+        headers: send RateLimit-Limit, RateLimit-Remaining and RateLimit-Reset on
+            every response the limit covers.
+        Every subdomain shares the one RateLimiter, which is returned.
+        """
+        _subdomains = subdomains or [DEFAULT]
+        if isinstance(_subdomains, str): _subdomains = [_subdomains]
+        limiter = RateLimiter(rate, per, burst)
+        limit = str(limiter.burst)
+
+        def address(req):
+            client = req._scope.get('client')
+            return client[0] if client else ''
+
+        if key is None: identify = address
+        elif isinstance(key, str):
+            header = key.lower()
+            identify = lambda req: req.headers.get(header) or address(req)
+        else: identify = key
+
+        async def limit_rate(req, res, ctx):
+            allowed, remaining, reset = limiter.hit(identify(req))
+            if headers:
+                res.headers = 'RateLimit-Limit', limit
+                res.headers = 'RateLimit-Remaining', str(remaining)
+                res.headers = 'RateLimit-Reset', str(ceil(reset))
+            if not allowed:
+                res.status = 429
+                res.headers = 'Retry-After', str(ceil(reset))
+                res.abort(b'Too Many Requests')
+
+        for sd in _subdomains: self.BEFORE(route, limit_rate, subdomain=sd, methods=methods)
+        limiter.hook = limit_rate
+        return limiter
+
     def sessions(self, secret_key, cookie_name="session", max_age=3600, subdomains=None, **cookie_opts):
         """
         Enables secure, signed cookie-based sessions.
@@ -1091,7 +1767,8 @@ class Router(object):
 
     def subdomain(self, subdomain: str):
         if not self.subdomains.get(subdomain):
-            self.subdomains[subdomain] = Routes()
+            self.subdomains[subdomain] = Routes(self._route_cache)
+            self._hosts.clear()
         return SubdomainContext(self, subdomain)
 
     def mount(self, router: 'Router', isolated = True, prefer=None):
@@ -1117,6 +1794,7 @@ class Router(object):
 
         if not isolated:
             self._buckets = {**router._buckets, **self._buckets}
+            self._memos = [*self._memos, *router._memos]
             self._configuration = {**router._configuration, **self._configuration}
             if self._loader and router._loader:
                 if router._template_prefix or self._template_prefix:
@@ -1168,13 +1846,18 @@ class Router(object):
                 for route in cache:
                     handler = cache[route]
                     self.subdomain(subdomain)
+                    options = engine.options.get((method, route), {})
                     if method == SOCKET:
                         closured_handler = _closure_mounted_ws(handler, router)
+                    elif options.get('cpu'):
+                        # a cpu handler never sees req, and a closure would not pickle
+                        closured_handler = handler
                     else:
                         closured_handler = _closure_mounted_application(handler, router)
                     self.abettor(method, route, closured_handler, subdomain=subdomain,
                                  router=router if isolated else self,
-                                 stream=(method, route) in engine.streams)
+                                 stream=(method, route) in engine.streams,
+                                 **options)
             for after in engine.afters:
                 self.subdomains[subdomain].afters[after] = [*engine.afters[after], *self.subdomains[subdomain].afters.get(after, [])]
             for before in engine.befores:
@@ -1186,6 +1869,10 @@ class Router(object):
             parent = self.subdomains[subdomain]
             parent.aftermethods = {**engine.aftermethods, **parent.aftermethods}
             parent.beforemethods = {**engine.beforemethods, **parent.beforemethods}
+            # the child's limits go on sharing one set of slots with the child
+            parent.limits = {**engine.limits, **parent.limits}
+            parent.caches = {**engine.caches, **parent.caches}
+            parent.invalidate()
 
     def websocket(self):
         # only if app is already running
@@ -1212,39 +1899,39 @@ class Router(object):
         handler = _string_to_function_handler(handler)
         engine.add_before(route, handler, methods=methods)
 
-    def CONNECT(self, route: str, handler: Handler, subdomain=DEFAULT):
-        self.abettor(METHOD_CONNECT, route, handler, subdomain)
+    def CONNECT(self, route: str, handler: Handler, subdomain=DEFAULT, **options):
+        self.abettor(METHOD_CONNECT, route, handler, subdomain, **options)
 
     def CONFIG(self, config):
         return self._configuration[config]
 
-    def DELETE(self, route: str, handler: Handler, subdomain=DEFAULT):
-        self.abettor(METHOD_DELETE, route, handler, subdomain)
+    def DELETE(self, route: str, handler: Handler, subdomain=DEFAULT, **options):
+        self.abettor(METHOD_DELETE, route, handler, subdomain, **options)
 
-    def GET(self, route: str, handler: Handler, subdomain=DEFAULT):
-        self.abettor(METHOD_GET, route, handler, subdomain)
+    def GET(self, route: str, handler: Handler, subdomain=DEFAULT, **options):
+        self.abettor(METHOD_GET, route, handler, subdomain, **options)
 
-    def HEAD(self, route: str, handler: Handler, subdomain=DEFAULT):
-        self.abettor(METHOD_HEAD, route, handler, subdomain)
+    def HEAD(self, route: str, handler: Handler, subdomain=DEFAULT, **options):
+        self.abettor(METHOD_HEAD, route, handler, subdomain, **options)
 
-    def HTTP(self, route: str, handler: Handler, subdomain=DEFAULT):
+    def HTTP(self, route: str, handler: Handler, subdomain=DEFAULT, **options):
         for method in [CONNECT, DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT, TRACE]:
-            self.abettor(method, route, handler, subdomain)
+            self.abettor(method, route, handler, subdomain, **options)
 
-    def OPTIONS(self, route: str, handler: Handler, subdomain=DEFAULT):
-        self.abettor(METHOD_OPTIONS, route, handler, subdomain)
+    def OPTIONS(self, route: str, handler: Handler, subdomain=DEFAULT, **options):
+        self.abettor(METHOD_OPTIONS, route, handler, subdomain, **options)
 
-    def PATCH(self, route: str, handler: Handler, subdomain=DEFAULT, stream=False):
-        self.abettor(METHOD_PATCH, route, handler, subdomain, stream=stream)
+    def PATCH(self, route: str, handler: Handler, subdomain=DEFAULT, stream=False, **options):
+        self.abettor(METHOD_PATCH, route, handler, subdomain, stream=stream, **options)
 
-    def POST(self, route: str, handler: Handler, subdomain=DEFAULT, stream=False):
-        self.abettor(METHOD_POST, route, handler, subdomain, stream=stream)
+    def POST(self, route: str, handler: Handler, subdomain=DEFAULT, stream=False, **options):
+        self.abettor(METHOD_POST, route, handler, subdomain, stream=stream, **options)
 
-    def PUT(self, route: str, handler: Handler, subdomain=DEFAULT, stream=False):
-        self.abettor(METHOD_PUT, route, handler, subdomain, stream=stream)
+    def PUT(self, route: str, handler: Handler, subdomain=DEFAULT, stream=False, **options):
+        self.abettor(METHOD_PUT, route, handler, subdomain, stream=stream, **options)
 
-    def TRACE(self, route: str, handler: Handler, subdomain=DEFAULT):
-        self.abettor(METHOD_TRACE, route, handler, subdomain)
+    def TRACE(self, route: str, handler: Handler, subdomain=DEFAULT, **options):
+        self.abettor(METHOD_TRACE, route, handler, subdomain, **options)
 
     def ON(self, *args):
         return self.ONCE(*args)
@@ -1312,19 +1999,29 @@ class Router(object):
         self._loader = file_system_loader
         self._template_prefix = prefix
 
-    def ASSETS(self, folder: str, route=None, subdomain=DEFAULT, relative_to=None):
+    def ASSETS(self, folder: str, route=None, subdomain=DEFAULT, relative_to=None, cache: Union[bool, AssetCache] = False) -> Union[AssetCache, None]:
+        """
+        Serve the files in `folder` at `route`, `/<folder>/*` by default.
+        cache: True, or an AssetCache for other bounds, to keep small files in
+            memory and answer repeats without reading them again.
+        Returns the AssetCache, whose counters are there to be read, if any.
+        """
         # TODO: add warning if root folder slash is used
         route = route or f'/{folder}/*'
         if relative_to: assets_folder_path = path.realpath(path.dirname(relative_to))
         else: assets_folder_path = path.realpath(getcwd())
+        location = path.join(assets_folder_path, f'{folder}')
+        # told apart by type, since an empty cache is falsy
+        assets = cache if isinstance(cache, AssetCache) else (AssetCache() if cache else None)
 
         async def serve_assets(req: Request, res: Response, ctx: Context):
             static_asset = f"{req.params.get('*', '')}"
-            location = path.join(assets_folder_path, f'{folder}')
+            if assets is not None and await assets.serve(location, static_asset, req, res): return
             # `within` keeps the read inside the asset folder, so `..` segments and
             # symlinks leaving the tree resolve to a 404 rather than a file
             res.file(static_asset, within=location)
         self.GET(route, serve_assets, subdomain)
+        return assets
 
     def SOCKET(self, route: str, handler: Handler, subdomain=DEFAULT):
         self.WS(route, handler, subdomain)
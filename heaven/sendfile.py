@@ -0,0 +1,76 @@
+"""The bytes of a file sent by `res.file`, without Python touching them where the
+server allows it.
+
+A server advertising the ASGI `http.response.pathsend` extension is handed the
+path of a whole file and sends it itself, with `sendfile` where the platform has
+it. Otherwise, and for byte ranges, the file is read in large chunks on the
+event loop's default executor, the next chunk already being read while the
+current one is sent.
+"""
+from asyncio import CancelledError, get_running_loop
+from typing import List, Tuple, Union
+
+# the ASGI extension a server lists in scope['extensions'] to be handed a path
+PATHSEND = 'http.response.pathsend'
+
+# bytes read per executor hop; large enough that a gigabyte costs a few thousand
+# hops rather than a quarter of a million, small enough to keep two in memory
+CHUNK = 256 * 1024
+
+
+class FileBody:
+    """An async iterable over `ranges` of the file at `filepath`, each range an
+    inclusive (first, last) pair, with `parts` (see `ranges.multipart`) sent
+    before each range and after the last when given."""
+    __slots__ = ('path', 'size', 'ranges', 'parts', 'chunk_size', '_chunks')
+
+    def __init__(self, filepath: str, size: int, ranges: Union[List[Tuple[int, int]], None] = None, parts: Union[List[bytes], None] = None, chunk_size: int = CHUNK):
+        if chunk_size < 1: raise ValueError('chunk_size must be at least 1')
+        self.path = filepath
+        self.size = size
+        self.ranges = ranges
+        self.parts = parts
+        self.chunk_size = chunk_size
+        self._chunks = None
+
+    @property
+    def whole(self) -> bool:
+        """Whether the whole file is sent as it is, so a server can send it by path."""
+        return self.ranges is None
+
+    def __aiter__(self):
+        self._chunks = self._read()
+        return self._chunks
+
+    async def aclose(self):
+        if self._chunks is not None: await self._chunks.aclose()
+
+    async def _read(self):
+        loop = get_running_loop()
+        ranges = [(0, self.size - 1)] if self.ranges is None else self.ranges
+        parts = self.parts
+        file = await loop.run_in_executor(None, open, self.path, 'rb')
+        pending = None
+        try:
+            for index, (first, last) in enumerate(ranges):
+                if parts: yield parts[index]
+                remaining = last - first + 1
+                if remaining <= 0: continue
+                # straight to the offset, reading nothing before it
+                file.seek(first)
+                pending = loop.run_in_executor(None, file.read, min(self.chunk_size, remaining))
+                while pending is not None:
+                    chunk = await pending
+                    pending = None
+                    if not chunk: break
+                    remaining -= len(chunk)
+                    # the next read runs in the executor while this chunk is sent
+                    if remaining > 0: pending = loop.run_in_executor(None, file.read, min(self.chunk_size, remaining))
+                    yield chunk
+            if parts: yield parts[-1]
+        finally:
+            # a read still in flight finishes before its file is closed under it
+            if pending is not None:
+                try: await pending
+                except (Exception, CancelledError): pass
+            file.close()
@@ -0,0 +1,220 @@
+"""A cache every worker process on a host reads and writes.
+
+Run with several workers and each keeps its own `app.keep` data and its own
+caches: N cold copies of the same thing. A `SharedCache` lives in one memory-mapped
+file instead, so a value one worker stores is there for all of them, with no
+service to run beside the app.
+
+The file is a fixed table of slots, each `slotsize` bytes, grouped into sets of
+WAYS. A key hashes to one set and can only live in one of its slots, so finding
+it reads at most WAYS slot headers. When a set is full, the slot used least
+recently gives way. Keys and values share a slot, so anything bigger than one is
+refused rather than stored.
+
+Each set is guarded by an fcntl record lock over its bytes, so workers touching
+different sets never wait on each other, and a thread lock orders the threads of
+one process, which record locks do not. Values are bytes, stored as they are, or
+anything orjson can serialize, returned deserialized, so every reader gets its
+own copy.
+"""
+import mmap
+import os
+from fcntl import LOCK_EX, LOCK_UN, flock, lockf
+from struct import Struct
+from threading import Lock
+from time import time, time_ns
+from typing import Any, Union
+from zlib import crc32
+
+from orjson import dumps, loads
+
+# slots per set: how many places a key may live, and how many headers a lookup reads
+WAYS = 8
+
+# magic, version, sets, ways and slot size, at the start of the file
+HEADER = Struct('<8sIIII')
+MAGIC = b'HVNSHARE'
+VERSION = 1
+# bytes reserved for the file header before the first slot
+PREAMBLE = 64
+
+# kind, key length, value length, key hash, expiry (epoch seconds, 0 for none)
+# and last use (epoch nanoseconds) at the start of every slot
+SLOT = Struct('<BxHIQdQ')
+
+# what a slot holds
+EMPTY, RAW, JSON = 0, 1, 2
+
+
+def _hashed(key: bytes) -> int:
+    # the builtin hash is salted per process, and every worker must agree; keys
+    # are compared in full, so the hash only has to spread them
+    return crc32(key)
+
+
+class SharedCache(object):
+    """A cache in the file at `path`, created with room for `slots` entries of up
+    to `slotsize` bytes each (key and value together, less a 32 byte header) if it
+    does not exist yet. Every process opening the same file shares its entries.
+
+    `hits`, `misses`, `evictions` and `rejected` count what this process saw."""
+    def __init__(self, path: str, slots: int = 4096, slotsize: int = 4096):
+        if slots < 1: raise ValueError('A shared cache needs at least one slot')
+        if slotsize <= SLOT.size: raise ValueError(f'A shared cache slot must be larger than its {SLOT.size} byte header')
+        sets = -(-slots // WAYS)
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+        self._mutex = Lock()
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            # one process lays the file out while any others starting up wait
+            flock(self._fd, LOCK_EX)
+            try: self.sets, self.slotsize = self._layout(sets, slotsize)
+            finally: flock(self._fd, LOCK_UN)
+            self._size = PREAMBLE + self.sets * WAYS * self.slotsize
+            self._map = mmap.mmap(self._fd, self._size)
+        except BaseException:
+            os.close(self._fd)
+            raise
+
+    def _layout(self, sets: int, slotsize: int):
+        size = os.fstat(self._fd).st_size
+        if size == 0:
+            os.ftruncate(self._fd, PREAMBLE + sets * WAYS * slotsize)
+            os.pwrite(self._fd, HEADER.pack(MAGIC, VERSION, sets, WAYS, slotsize), 0)
+            return sets, slotsize
+        magic, version, sets, ways, slotsize = HEADER.unpack(os.pread(self._fd, HEADER.size, 0))
+        if magic != MAGIC or version != VERSION or ways != WAYS or size != PREAMBLE + sets * ways * slotsize:
+            raise ValueError(f'{self.path} is not a shared cache this version of heaven can open')
+        # whoever created the file decided its shape; later openers follow it
+        return sets, slotsize
+
+    @property
+    def capacity(self) -> int:
+        """How many entries the file has slots for."""
+        return self.sets * WAYS
+
+    def _set(self, key: bytes):
+        hashed = _hashed(key)
+        return hashed, PREAMBLE + (hashed % self.sets) * WAYS * self.slotsize
+
+    def _lock(self, start: int):
+        self._mutex.acquire()
+        try: lockf(self._fd, LOCK_EX, WAYS * self.slotsize, start, os.SEEK_SET)
+        except BaseException:
+            self._mutex.release()
+            raise
+
+    def _unlock(self, start: int):
+        try: lockf(self._fd, LOCK_UN, WAYS * self.slotsize, start, os.SEEK_SET)
+        finally: self._mutex.release()
+
+    def _find(self, start: int, hashed: int, key: bytes, now: float):
+        """The offset of the slot holding `key` in the set at `start`, or None.
+        Expired entries met on the way are emptied."""
+        view = self._map
+        for offset in range(start, start + WAYS * self.slotsize, self.slotsize):
+            kind, keylength, _, slothash, expires, _ = SLOT.unpack_from(view, offset)
+            if kind == EMPTY: continue
+            if expires and expires <= now:
+                view[offset] = EMPTY
+                continue
+            if slothash == hashed and keylength == len(key) and view[offset + SLOT.size:offset + SLOT.size + keylength] == key: return offset
+        return None
+
+    def get(self, key: Union[str, bytes], default: Any = None) -> Any:
+        key = key.encode() if isinstance(key, str) else key
+        hashed, start = self._set(key)
+        self._lock(start)
+        try:
+            offset = self._find(start, hashed, key, time())
+            if offset is not None:
+                view = self._map
+                kind, keylength, length, slothash, expires, _ = SLOT.unpack_from(view, offset)
+                begins = offset + SLOT.size + keylength
+                value = view[begins:begins + length]
+                SLOT.pack_into(view, offset, kind, keylength, length, slothash, expires, time_ns())
+        finally: self._unlock(start)
+
+        if offset is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value if kind == RAW else loads(value)
+
+    def set(self, key: Union[str, bytes], value: Any, ttl: Union[float, None] = None) -> bool:
+        """Store `value` under `key` for `ttl` seconds (None for as long as there
+        is room). False means it did not fit in a slot and was not stored."""
+        key = key.encode() if isinstance(key, str) else key
+        if isinstance(value, (bytes, bytearray, memoryview)): kind, data = RAW, bytes(value)
+        else: kind, data = JSON, dumps(value)
+        if SLOT.size + len(key) + len(data) > self.slotsize or len(key) > 0xFFFF:
+            self.rejected += 1
+            return False
+
+        hashed, start = self._set(key)
+        now = time()
+        expires = now + ttl if ttl else 0.0
+        view = self._map
+        self._lock(start)
+        try:
+            target = self._find(start, hashed, key, now)
+            if target is None:
+                oldest = None
+                for offset in range(start, start + WAYS * self.slotsize, self.slotsize):
+                    if view[offset] == EMPTY:
+                        target = offset
+                        break
+                    used = SLOT.unpack_from(view, offset)[5]
+                    if oldest is None or used < oldest[0]: oldest = used, offset
+                else:
+                    target = oldest[1]
+                    self.evictions += 1
+            begins = target + SLOT.size
+            view[begins:begins + len(key)] = key
+            view[begins + len(key):begins + len(key) + len(data)] = data
+            SLOT.pack_into(view, target, kind, len(key), len(data), hashed, expires, time_ns())
+        finally: self._unlock(start)
+        return True
+
+    def delete(self, key: Union[str, bytes]) -> bool:
+        key = key.encode() if isinstance(key, str) else key
+        hashed, start = self._set(key)
+        self._lock(start)
+        try:
+            offset = self._find(start, hashed, key, time())
+            if offset is not None: self._map[offset] = EMPTY
+        finally: self._unlock(start)
+        return offset is not None
+
+    def __contains__(self, key: Union[str, bytes]) -> bool:
+        key = key.encode() if isinstance(key, str) else key
+        hashed, start = self._set(key)
+        self._lock(start)
+        try: return self._find(start, hashed, key, time()) is not None
+        finally: self._unlock(start)
+
+    def __len__(self) -> int:
+        """Live entries across every worker, counted by reading each slot header."""
+        now, view, count = time(), self._map, 0
+        for offset in range(PREAMBLE, self._size, self.slotsize):
+            kind, _, _, _, expires, _ = SLOT.unpack_from(view, offset)
+            if kind != EMPTY and not (expires and expires <= now): count += 1
+        return count
+
+    def clear(self):
+        """Empty the cache for every worker."""
+        with self._mutex:
+            lockf(self._fd, LOCK_EX, 0, PREAMBLE, os.SEEK_SET)
+            try:
+                for offset in range(PREAMBLE, self._size, self.slotsize): self._map[offset] = EMPTY
+            finally: lockf(self._fd, LOCK_UN, 0, PREAMBLE, os.SEEK_SET)
+
+    def close(self):
+        if self._map.closed: return
+        self._map.close()
+        os.close(self._fd)
@@ -1,5 +1,10 @@
+from collections import OrderedDict
 from datetime import date, datetime
+from functools import lru_cache
 from ipaddress import ip_address
+from types import MappingProxyType
+from typing import Union
+from urllib.parse import unquote
 from uuid import UUID
 
 from .constants import DEFAULT
@@ -26,6 +31,53 @@ CONVERTERS = {
 }
 
 
+def lenient_boolean(value: str) -> bool:
+    """Query values keep their historical lenient boolean, where an unreadable
+    value reads as False. Route segments use the strict parse from CONVERTERS
+    because there a failure means the route simply does not match."""
+    try: return boolean(value)
+    except ValueError: return False
+
+
+QUERY_CONVERTERS = {**CONVERTERS, 'bool': lenient_boolean}
+
+
+@lru_cache(maxsize=1024)
+def compile_queryhint(hint: str) -> MappingProxyType:
+    """Turn a query hint such as `page:int&sort:str` into a read-only map of query
+    key to converter. Pairs that are malformed or name an unknown type are ignored,
+    as they always have been. Routes.add compiles each route's hint once and keeps
+    the map on the route node; the memo only serves hints set on a request by hand."""
+    coercions = {}
+    for pair in hint.split('&'):
+        try: k, v = pair.split(':')
+        except ValueError: continue
+        kind = QUERY_CONVERTERS.get(v)
+        if kind: coercions[k] = kind
+    return MappingProxyType(coercions)
+
+
+# the hint of a route registered without one: no text, nothing to coerce
+NO_HINT = ('', MappingProxyType({}))
+
+
+def parse_querystring(qs: str) -> dict:
+    """What `urllib.parse.parse_qs(qs, keep_blank_values=True)` returns, for the
+    common case worked out with a split and a partition per field: only a field
+    containing `%` or `+` pays for unquoting."""
+    parsed = {}
+    for field in qs.split('&'):
+        if not field: continue
+        key, _, value = field.partition('=')
+        if '%' in field or '+' in field:
+            key = unquote(key.replace('+', ' '))
+            value = unquote(value.replace('+', ' '))
+        values = parsed.get(key)
+        if values is None: parsed[key] = [value]
+        else: values.append(value)
+    return parsed
+
+
 def parameter_parts(segment: str):
     """Split a route parameter body such as `id:int` into (name, kind). The first
     colon separates the two; a segment without one is untyped."""
@@ -36,7 +88,9 @@ def parameter_parts(segment: str):
 b_or_s = lambda x: x.decode() if isinstance(x, bytes) else x
 
     
-def preprocessor(scope):
+def collect_headers(scope) -> dict:
+    """Decode the ASGI header pairs into a dict. A name sent more than once keeps
+    every value, in order, as a list."""
     headers = {}
     for header in scope.get('headers'):
         key, value = [b_or_s(e) for e in header]
@@ -46,18 +100,45 @@ def preprocessor(scope):
             else: exists = [exists, value]
         else: exists = value
         headers[key] = exists
+    return headers
+
+
+def joined(value: Union[list, str, None], separator: str = ', ') -> Union[str, None]:
+    """A header value as one string. A name sent more than once comes out of
+    `collect_headers` as a list, read here as the single comma-separated header
+    it is equivalent to."""
+    return separator.join(value) if isinstance(value, list) else value
+
+
+def host_header(scope) -> Union[bytes, str, None]:
+    """The raw Host header, found by scanning the header pairs rather than decoding
+    them all. ASGI servers send names lowercased."""
+    for key, value in scope.get('headers') or ():
+        if key == b'host' or key == 'host': return value
+    return None
 
-    host: bytes = headers.get('host')
-    if not host: return DEFAULT, headers
+
+def subdomain_of(host: Union[bytes, str, None]) -> str:
+    """The subdomain a Host header addresses, or DEFAULT for none, a bare domain or
+    an IP address."""
+    if not host: return DEFAULT
+    host = b_or_s(host)
     if host.startswith('http://'): host = host.replace('http://', '')
     else: host = host.replace('https://', '')
     host = host.rsplit(':')[0]
-    try: ip_address(host)
-    except: pass
-    else: return DEFAULT, headers
+    # only something made of digits and dots can be an address by now, so most
+    # hostnames skip ip_address and the exception it raises for them
+    if host.replace('.', '').isdigit():
+        try: ip_address(host)
+        except ValueError: pass
+        else: return DEFAULT
     parts = host.split('.', 2)
-    has_subdomain = len(parts) > 2
-    return (parts[0], headers,) if has_subdomain else (DEFAULT, headers,)
+    return parts[0] if len(parts) > 2 else DEFAULT
+
+
+def preprocessor(scope):
+    headers = collect_headers(scope)
+    return subdomain_of(headers.get('host')), headers
 
 
 class Lookup(object):
@@ -69,3 +150,59 @@ class Lookup(object):
         if isinstance(value, dict):
             return Lookup(value)
         return value
+
+
+class LRU(object):
+    """A mapping bounded by entry count, by total size, or both, evicting the least
+    recently used entries first. `size` on `put` is whatever unit `maxbytes` is
+    counted in, usually the byte length of the value. Hits, misses and evictions
+    are counted so a cache can be tuned from what it actually sees."""
+    __slots__ = ('_data', 'maxsize', 'maxbytes', 'size', 'hits', 'misses', 'evictions')
+
+    def __init__(self, maxsize: int = None, maxbytes: int = None):
+        self._data = OrderedDict()
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        try: value, _ = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value, size: int = 0):
+        """Store `value`, evicting older entries to make room. A value larger than
+        the whole size budget is not stored at all."""
+        if self.maxbytes is not None and size > self.maxbytes: return False
+        self.pop(key)
+        self._data[key] = (value, size)
+        self.size += size
+        while (self.maxsize is not None and len(self._data) > self.maxsize) or \
+              (self.maxbytes is not None and self.size > self.maxbytes):
+            _, (_, evicted) = self._data.popitem(last=False)
+            self.size -= evicted
+            self.evictions += 1
+        return True
+
+    def pop(self, key, default=None):
+        try: value, size = self._data.pop(key)
+        except KeyError: return default
+        self.size -= size
+        return value
+
+    def clear(self):
+        self._data.clear()
+        self.size = 0
@@ -0,0 +1,108 @@
+import os
+import tempfile
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+from heaven import App
+from heaven.assets import AssetCache
+from heaven.etags import weak
+
+
+class AssetCacheTest(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.folder, 'assets'))
+        self.write('app.js', b'console.log(1)')
+        self.write('big.bin', b'x' * 5000)
+        with open(os.path.join(self.folder, 'secret.txt'), 'wb') as file: file.write(b'secret')
+        self.app = App()
+
+    def write(self, name, content):
+        with open(os.path.join(self.folder, 'assets', name), 'wb') as file: file.write(content)
+
+    def mount(self, **kwargs):
+        return self.app.ASSETS('assets', relative_to=os.path.join(self.folder, 'app.py'), cache=AssetCache(**kwargs))
+
+    async def test_hits_are_served_from_memory(self):
+        cache = self.mount()
+        _, res, _ = await self.app.earth.GET('/assets/app.js')
+        headers = dict(res.headers)
+        self.assertEqual((res.status, res.body), (200, b'console.log(1)'))
+        self.assertEqual(headers[b'Content-Type'], b'text/javascript')
+        self.assertEqual(headers[b'Content-Length'], b'14')
+        info = os.stat(os.path.join(self.folder, 'assets', 'app.js'))
+        self.assertEqual(headers[b'ETag'].decode(), weak(info.st_size, info.st_mtime_ns))
+
+        with patch('heaven.assets._read') as read, patch('heaven.response.FileBody') as body:
+            _, res, _ = await self.app.earth.GET('/assets/app.js')
+        read.assert_not_called()
+        body.assert_not_called()
+        self.assertEqual(res.body, b'console.log(1)')
+        self.assertEqual((cache.hits, cache.misses, cache.stores, len(cache)), (1, 1, 1, 1))
+
+        _, res, _ = await self.app.earth.GET('/assets/app.js', headers={'if-none-match': headers[b'ETag'].decode()})
+        self.assertEqual((res.status, res.body), (304, b''))
+        self.assertNotIn(b'Content-Length', dict(res.headers))
+
+    async def test_changed_files_are_read_again(self):
+        cache = self.mount(revalidate=0)
+        await self.app.earth.GET('/assets/app.js')
+        self.write('app.js', b'console.log(22)')
+        _, res, _ = await self.app.earth.GET('/assets/app.js')
+        self.assertEqual(res.body, b'console.log(22)')
+        self.assertEqual(cache.misses, 2)
+
+        os.remove(os.path.join(self.folder, 'assets', 'app.js'))
+        _, res, _ = await self.app.earth.GET('/assets/app.js')
+        self.assertEqual(res.status, 404)
+        self.assertEqual(len(cache), 0)
+
+    async def test_without_revalidation_the_first_read_stands(self):
+        self.mount(revalidate=None)
+        await self.app.earth.GET('/assets/app.js')
+        self.write('app.js', b'console.log(22)')
+        _, res, _ = await self.app.earth.GET('/assets/app.js')
+        self.assertEqual(res.body, b'console.log(1)')
+
+    async def test_large_files_ranges_and_escapes_go_through_res_file(self):
+        cache = self.mount(largest=1000, maxbytes=10_000)
+        _, res, _ = await self.app.earth.GET('/assets/big.bin')
+        self.assertEqual((res.status, len(res.body)), (200, 5000))
+        _, res, _ = await self.app.earth.GET('/assets/app.js', headers={'range': 'bytes=0-6'})
+        self.assertEqual((res.status, res.body), (206, b'console'))
+        _, res, _ = await self.app.earth.GET('/assets/../secret.txt')
+        self.assertEqual(res.status, 404)
+        _, res, _ = await self.app.earth.GET('/assets/missing.js')
+        self.assertEqual(res.status, 404)
+        self.assertEqual(len(cache), 0)
+
+    async def test_files_left_to_res_file_skip_the_read_next_time(self):
+        cache = self.mount(largest=1000, revalidate=0)
+        for url in ('/assets/big.bin', '/assets/missing.js', '/assets/../secret.txt'): await self.app.earth.GET(url)
+        self.assertEqual(cache.misses, 3)
+
+        with patch('heaven.assets._read') as read:
+            _, res, _ = await self.app.earth.GET('/assets/big.bin')
+            self.assertEqual(len(res.body), 5000)
+            _, res, _ = await self.app.earth.GET('/assets/missing.js')
+            self.assertEqual(res.status, 404)
+        read.assert_not_called()
+        self.assertEqual((cache.passes, cache.misses), (2, 3))
+
+        # a stat that changed sends the path back to be read
+        self.write('big.bin', b'small')
+        self.write('missing.js', b'found')
+        _, res, _ = await self.app.earth.GET('/assets/big.bin')
+        self.assertEqual(res.body, b'small')
+        _, res, _ = await self.app.earth.GET('/assets/missing.js')
+        self.assertEqual(res.body, b'found')
+        self.assertEqual((cache.stores, len(cache)), (2, 2))
+
+    async def test_bounded_by_bytes(self):
+        cache = self.mount(maxbytes=1000)
+        for index in range(5):
+            self.write(f'{index}.css', b'a' * 300)
+            await self.app.earth.GET(f'/assets/{index}.css')
+        self.assertLessEqual(cache.size, 1000)
+        self.assertGreater(cache.evictions, 0)
+        self.assertRaises(ValueError, AssetCache, maxbytes=0)
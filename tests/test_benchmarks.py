@@ -0,0 +1,54 @@
+import json
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+from benchmarks.__main__ import main
+from benchmarks.routing import KINDS, Table, Unsupported, build, run, timed
+from heaven.mocks import MockRequest
+
+
+class BenchmarksTest(TestCase):
+    def test_tables_are_deterministic_and_probes_match(self):
+        table = Table(120, seed=3, probes=20)
+        self.assertEqual(len(table.routes), 120)
+        self.assertEqual(table.routes, Table(120, seed=3, probes=20).routes)
+        app = build(table)
+        for kind in ('static', 'typed', 'wildcard'):
+            for subdomain, method, path in table.probes[kind]:
+                with self.subTest(kind=kind, path=path):
+                    matched, _, _ = app.subdomains[subdomain].resolve(method, path, MockRequest('/'))
+                    self.assertTrue(matched)
+        self.assertEqual(len(table.probes['miss']), 20)
+        for subdomain, method, path in table.probes['miss']:
+            with self.subTest(kind='miss', path=path):
+                self.assertFalse(app.subdomains[subdomain].resolve(method, path, MockRequest('/'))[0])
+                # the path leaves the tree only at its last segment
+                self.assertTrue(app.subdomains[subdomain].resolve(method, path.rsplit('/', 1)[0], MockRequest('/'))[0])
+        for subdomain, method, path in table.probes['method']:
+            self.assertEqual(app.subdomains[subdomain].resolve(method, path, MockRequest('/'))[0], None)
+            self.assertTrue(app.subdomains[subdomain].allowed(path))
+
+    def test_report_is_json_with_every_measurement(self):
+        out = StringIO()
+        with patch('sys.stdout', out):
+            main(['--sizes', '50', '--rounds', '1', '--warmup', '0', '--probes', '5', '--quiet'])
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['settings']['sizes'], [50])
+        self.assertEqual([result['mode'] for result in report['results']], ['live', 'frozen', 'generated'])
+        for result in report['results']:
+            self.assertEqual(set(result['resolve']), set(KINDS))
+            self.assertEqual(set(result['call']), set(KINDS))
+            self.assertGreater(result['memory']['bytes_per_route'], 0)
+            self.assertGreater(result['xhooks']['ops_per_sec'], 0)
+            self.assertIn('miss', result['allowed'])
+
+    def test_resets_run_before_every_round(self):
+        calls = []
+        timed(calls.append, [1, 2], rounds=3, warmup=1, reset=lambda: calls.append('reset'))
+        self.assertEqual(calls, ['reset', 1, 2] * 4)
+
+    def test_modes_an_older_heaven_lacks_are_marked(self):
+        with patch('benchmarks.routing.build', side_effect=Unsupported):
+            report = run(sizes=(10,), modes=('frozen',), rounds=1, warmup=0, probes=2)
+        self.assertTrue(report['results'][0]['unsupported'])
@@ -0,0 +1,190 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+from heaven import App
+from heaven.caching import ResponseCache
+
+
+async def call(app, path, method='GET', headers=(), host=b'localhost'):
+    """Run one request through the whole app, deferred tasks included."""
+    sent = []
+    async def receive(): return {'type': 'http.request', 'body': b'', 'more_body': False}
+    async def send(message): sent.append(message)
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'headers': [(b'host', host), *headers]}
+    await app(scope, receive, send)
+    return sent[0]['status'], dict(sent[0]['headers']), sent[1]['body']
+
+
+class ResponseCacheTest(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.app = App()
+        self.runs = 0
+
+        async def catalog(req, res, ctx):
+            self.runs += 1
+            res.header('x-run', str(self.runs))
+            res.body = {'run': self.runs, 'page': req.queries.get('page')}
+        self.catalog = catalog
+
+    async def test_hits_skip_handler_and_after_hooks(self):
+        cache = self.app.cache('/catalog')
+        self.app.GET('/catalog', self.catalog)
+        befores = []
+        self.app.BEFORE('/catalog', lambda req, res, ctx: befores.append(1) or res.header('x-before', str(len(befores))))
+        self.app.AFTER('/catalog', lambda req, res, ctx: res.header('x-after', 'yes'))
+
+        for _ in range(3): _, res, _ = await self.app.earth.GET('/catalog')
+        self.assertEqual(self.runs, 1)
+        self.assertEqual(len(befores), 3)
+        headers = dict(res.headers)
+        self.assertEqual(headers[b'x-run'], b'1')
+        self.assertEqual(headers[b'x-after'], b'yes')
+        self.assertEqual(headers[b'x-before'], b'3')
+        self.assertEqual(headers[b'Age'], b'0')
+        self.assertEqual(res.body, b'{"run":1,"page":null}')
+        self.assertEqual((cache.hits, cache.misses, cache.stores), (2, 1, 1))
+
+        # the query string is part of the key
+        await self.app.earth.GET('/catalog?page=2')
+        self.assertEqual(self.runs, 2)
+
+    async def test_wildcards_cover_groups_and_head(self):
+        cache = self.app.cache('/catalog/*')
+        self.app.GET('/catalog/:id', self.catalog)
+        self.app.GET('/other', self.catalog)
+        await call(self.app, '/catalog/1')
+        status, headers, body = await call(self.app, '/catalog/1', method='HEAD')
+        self.assertEqual((status, headers[b'x-run'], body), (200, b'1', b''))
+        await self.app.earth.GET('/other')
+        await self.app.earth.GET('/other')
+        # /other is not covered, so it runs every time
+        self.assertEqual(self.runs, 3)
+        self.assertEqual(len(cache), 1)
+
+    async def test_cache_control_decides(self):
+        self.app.cache('/*')
+
+        def directed(directive):
+            def handler(req, res, ctx):
+                self.runs += 1
+                res.header('Cache-Control', directive)
+                res.body = b'ok'
+            return handler
+        self.app.GET('/private', directed('private, max-age=60'))
+        self.app.GET('/nostore', directed('no-store'))
+        self.app.GET('/expired', directed('max-age=0'))
+        self.app.GET('/public', directed('public, max-age=60'))
+        for path in ('/private', '/nostore', '/expired', '/public'):
+            for _ in range(2): await self.app.earth.GET(path)
+        self.assertEqual(self.runs, 7)
+
+        # a client asking for no-cache goes to the handler
+        await self.app.earth.GET('/public', headers={'cache-control': 'no-cache'})
+        self.assertEqual(self.runs, 8)
+
+    async def test_cookies_errors_and_aborts_are_not_stored(self):
+        cache = self.app.cache('/*')
+        def cookie(req, res, ctx):
+            self.runs += 1
+            res.cookie('seen', 'yes')
+        def broken(req, res, ctx):
+            self.runs += 1
+            res.status = 404
+        def aborted(req, res, ctx):
+            self.runs += 1
+            res.abort(b'no')
+        self.app.GET('/cookie', cookie)
+        self.app.GET('/broken', broken)
+        self.app.GET('/aborted', aborted)
+        for path in ('/cookie', '/broken', '/aborted'):
+            for _ in range(2): await self.app.earth.GET(path)
+        self.assertEqual(self.runs, 6)
+        self.assertEqual(len(cache), 0)
+
+    async def test_vary_splits_entries(self):
+        self.app.cache('/*', vary=['X-Tenant'])
+        def greet(req, res, ctx):
+            self.runs += 1
+            res.header('Vary', 'Accept-Language')
+            res.body = f"{req.headers.get('x-tenant')}:{req.headers.get('accept-language')}".encode()
+        self.app.GET('/greet', greet)
+
+        for tenant, language in (('a', 'en'), ('a', 'fr'), ('b', 'en'), ('a', 'fr')):
+            _, res, _ = await self.app.earth.GET('/greet', headers={'x-tenant': tenant, 'accept-language': language})
+            self.assertEqual(res.body, f'{tenant}:{language}'.encode())
+        self.assertEqual(self.runs, 3)
+
+        def anything(req, res, ctx):
+            self.runs += 1
+            res.header('Vary', '*')
+        self.app.GET('/anything', anything)
+        for _ in range(2): await self.app.earth.GET('/anything')
+        self.assertEqual(self.runs, 5)
+
+    async def test_hosts_and_repeated_headers_split_entries(self):
+        cache = self.app.cache('/*', vary=['X-Tenant'])
+        def me(req, res, ctx):
+            self.runs += 1
+            res.header('Vary', 'Accept-Language')
+            res.body = f"{req.headers.get('host')}:{req.headers.get('x-tenant')}".encode()
+        self.app.GET('/me', me)
+
+        # one default engine answering for every tenant's domain
+        for host in (b'alice.example', b'bob.example', b'alice.example'):
+            _, _, body = await call(self.app, '/me', host=host)
+            self.assertEqual(body, host + b':None')
+        self.assertEqual(self.runs, 2)
+
+        # a header sent twice is keyed as the one it is equivalent to
+        tenants = [(b'x-tenant', b'a'), (b'x-tenant', b'b')]
+        languages = [(b'accept-language', b'en'), (b'accept-language', b'fr')]
+        for _ in range(2): await call(self.app, '/me', headers=tenants + languages)
+        self.assertEqual(self.runs, 3)
+        await call(self.app, '/me', headers=tenants[:1] + languages)
+        self.assertEqual(self.runs, 4)
+
+        # only so many URLs have their vary names remembered
+        app = App()
+        with patch('heaven.caching.VARIES', 2): cache = app.cache('/*')
+        app.GET('/me', me)
+        for index in range(5): await app.earth.GET(f'/me?page={index}')
+        self.assertEqual((cache.stores, len(cache._varies)), (5, 2))
+
+    async def test_bounded_by_bytes(self):
+        cache = self.app.cache('/*', maxbytes=3000)
+        def big(req, res, ctx): res.body = b'x' * 1000
+        self.app.GET('/big/:id', big)
+        for index in range(5): await self.app.earth.GET(f'/big/{index}')
+        self.assertLessEqual(cache.size, 3000)
+        self.assertEqual(cache.evictions, 3)
+        self.assertEqual(len(cache), 2)
+
+    async def test_stale_is_served_while_refreshing(self):
+        cache = self.app.cache('/catalog', ttl=.02, stale=10)
+        self.app.GET('/catalog', self.catalog)
+        await call(self.app, '/catalog')
+        await asyncio.sleep(.03)
+
+        # served stale, with the refresh run once the response went out
+        status, headers, body = await call(self.app, '/catalog')
+        self.assertEqual((status, body), (200, b'{"run":1,"page":null}'))
+        self.assertEqual(self.runs, 2)
+        self.assertEqual(cache.stale_hits, 1)
+
+        status, headers, body = await call(self.app, '/catalog')
+        self.assertEqual(body, b'{"run":2,"page":null}')
+        self.assertEqual(headers[b'Content-Type'], b'application/json')
+        self.assertEqual(cache.hits, 1)
+
+    async def test_too_stale_is_a_miss(self):
+        self.app.cache('/catalog', ttl=.01)
+        self.app.GET('/catalog', self.catalog)
+        await self.app.earth.GET('/catalog')
+        await asyncio.sleep(.02)
+        _, res, _ = await self.app.earth.GET('/catalog')
+        self.assertEqual(res.body, b'{"run":2,"page":null}')
+
+    def test_bad_values(self):
+        with self.assertRaises(ValueError): ResponseCache(ttl=-1)
+        with self.assertRaises(ValueError): ResponseCache(maxbytes=0)
@@ -0,0 +1,178 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from heaven import App
+
+
+def scope(path):
+    return {
+        'type': 'http', 'method': 'GET', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+        'headers': [(b'host', b'example.com')], 'client': ('127.0.0.1', 50000), 'scheme': 'http',
+    }
+
+
+class Client(object):
+    """An ASGI conversation whose client leaves when told to."""
+    def __init__(self):
+        self.left = asyncio.Event()
+        self.sent = []
+        self.bodied = False
+
+    async def receive(self):
+        if not self.bodied:
+            self.bodied = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.left.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        self.sent.append(message)
+        await asyncio.sleep(0)
+
+
+class DisconnectTest(IsolatedAsyncioTestCase):
+    async def test_handler_is_cancelled_and_after_hooks_still_run(self):
+        app = App()
+        events = []
+
+        async def slow(req, res, ctx):
+            try: await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                events.append('cancelled')
+                raise
+        app.GET('/slow', slow)
+        app.AFTER('/*', lambda req, res, ctx: events.append(('after', res.status)))
+
+        client = Client()
+        call = asyncio.ensure_future(app(scope('/slow'), client.receive, client.send))
+        await asyncio.sleep(.01)
+        client.left.set()
+        await asyncio.wait_for(call, 1)
+        self.assertEqual(events, ['cancelled', ('after', 499)])
+        self.assertEqual(client.sent, [])
+        self.assertEqual((app.disconnects.handlers, app.disconnects.streams), (1, 0))
+
+    async def test_a_timeout_does_not_cut_after_hooks_short(self):
+        app = App()
+        events = []
+
+        async def slow(req, res, ctx): await asyncio.sleep(10)
+        async def release(req, res, ctx):
+            await asyncio.sleep(.1)
+            events.append(('released', res.status))
+        app.GET('/slow', slow, timeout=.05)
+        app.AFTER('/*', release)
+
+        client = Client()
+        call = asyncio.ensure_future(app(scope('/slow'), client.receive, client.send))
+        await asyncio.sleep(.01)
+        client.left.set()
+        await asyncio.wait_for(call, 1)
+        self.assertEqual(events, [('released', 499)])
+
+    async def test_streaming_body_is_closed(self):
+        app = App()
+        produced = []
+        closed = asyncio.Event()
+
+        async def chunks():
+            try:
+                for index in range(1000):
+                    produced.append(index)
+                    yield b'x'
+                    await asyncio.sleep(.001)
+            finally: closed.set()
+
+        async def export(req, res, ctx): res.body = chunks()
+        app.GET('/export', export)
+
+        client = Client()
+        call = asyncio.ensure_future(app(scope('/export'), client.receive, client.send))
+        await asyncio.sleep(.02)
+        client.left.set()
+        await asyncio.wait_for(call, 1)
+        self.assertTrue(closed.is_set())
+        self.assertLess(len(produced), 1000)
+        self.assertEqual((app.disconnects.handlers, app.disconnects.streams), (0, 1))
+
+    async def test_finished_requests_are_left_alone(self):
+        app = App()
+        async def quick(req, res, ctx): res.body = b'done'
+        app.GET('/quick', quick)
+
+        client = Client()
+        await app(scope('/quick'), client.receive, client.send)
+        client.left.set()
+        await asyncio.sleep(.01)
+        self.assertEqual(client.sent[-1]['body'], b'done')
+        self.assertEqual(app.disconnects.handlers, 0)
+
+    async def test_cancellation_from_outside_propagates(self):
+        app = App()
+        after = []
+        async def slow(req, res, ctx): await asyncio.sleep(10)
+        app.GET('/slow', slow)
+        app.AFTER('/*', lambda req, res, ctx: after.append(True))
+
+        client = Client()
+        call = asyncio.ensure_future(app(scope('/slow'), client.receive, client.send))
+        await asyncio.sleep(.01)
+        call.cancel()
+        with self.assertRaises(asyncio.CancelledError): await call
+        self.assertEqual((after, app.disconnects.handlers), ([], 0))
+
+
+class DeadlineTest(IsolatedAsyncioTestCase):
+    async def test_slow_route_gets_504_with_before_headers(self):
+        app = App()
+        app.BEFORE('/*', lambda req, res, ctx: res.header('access-control-allow-origin', '*'))
+        seen = []
+
+        async def slow(req, res, ctx):
+            seen.append(req.deadline)
+            await asyncio.sleep(10)
+        app.GET('/slow', slow, timeout=.05)
+
+        _, res, _ = await asyncio.wait_for(app.earth.GET('/slow'), 1)
+        self.assertEqual((res.status, res.body), (504, b'Gateway Timeout'))
+        self.assertIn((b'access-control-allow-origin', b'*'), res.headers)
+        self.assertTrue(0 < seen[0] <= .05)
+
+    async def test_app_default_and_route_opt_out(self):
+        app = App(timeout=.05)
+        async def slow(req, res, ctx):
+            await asyncio.sleep(.1)
+            res.body = b'late'
+        async def budget(req, res, ctx): res.body = repr(req.deadline).encode()
+        app.GET('/slow', slow)
+        app.GET('/patient', slow, timeout=0)
+        app.GET('/budget', budget, timeout=None)
+
+        _, res, _ = await app.earth.GET('/slow')
+        self.assertEqual(res.status, 504)
+        _, res, _ = await app.earth.GET('/patient')
+        self.assertEqual((res.status, res.body), (200, b'late'))
+        _, res, _ = await app.earth.GET('/budget')
+        self.assertLessEqual(float(res.body), .05)
+
+    async def test_fast_routes_are_untouched(self):
+        app = App(timeout=1)
+        async def quick(req, res, ctx):
+            await asyncio.sleep(0)
+            res.body = b'quick'
+        app.GET('/quick', quick)
+        app.GET('/open', quick, timeout=0)
+        _, res, _ = await app.earth.GET('/quick')
+        self.assertEqual((res.status, res.body), (200, b'quick'))
+        req, _, _ = await app.earth.GET('/open')
+        self.assertIsNone(req.deadline)
+
+    async def test_timeout_leaves_no_pending_cancellation(self):
+        app = App()
+        async def slow(req, res, ctx): await asyncio.sleep(10)
+        app.GET('/slow', slow, timeout=.01)
+        await app.earth.GET('/slow')
+        # the task the request ran in carries on as if nothing was cancelled
+        await asyncio.sleep(.02)
+        task = asyncio.current_task()
+        if hasattr(task, 'cancelling'): self.assertEqual(task.cancelling(), 0)
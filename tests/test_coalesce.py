@@ -0,0 +1,97 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from heaven import App
+from heaven.coalesce import Coalesce
+
+
+class CoalesceTest(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.app = App()
+        self.runs = 0
+        self.release = asyncio.Event()
+
+        async def feed(req, res, ctx):
+            self.runs += 1
+            await self.release.wait()
+            res.header('x-page', req.queries.get('page', ''))
+            res.body = {'page': req.queries.get('page'), 'language': req.headers.get('accept-language')}
+        self.feed = feed
+
+    async def gather(self, *requests):
+        pending = [asyncio.ensure_future(request) for request in requests]
+        await asyncio.sleep(.01)
+        self.release.set()
+        return await asyncio.gather(*pending)
+
+    async def test_identical_requests_share_one_run(self):
+        flights = Coalesce()
+        self.app.GET('/feed', self.feed, coalesce=flights)
+        seen = []
+        self.app.BEFORE('/feed', lambda req, res, ctx: seen.append(1) or res.header('x-before', str(len(seen))))
+        self.app.AFTER('/feed', lambda req, res, ctx: res.body.update(touched=True))
+
+        results = await self.gather(*[self.app.earth.GET('/feed?page=1') for _ in range(5)], self.app.earth.GET('/feed?page=2'))
+        self.assertEqual(self.runs, 2)
+        self.assertEqual((flights.executions, flights.saved, flights.inflight), (2, 4, 0))
+        for index, (_, res, _) in enumerate(results[:5]):
+            headers = dict(res.headers)
+            self.assertEqual(headers[b'x-page'], b'1')
+            # each request kept the headers of its own BEFORE hooks
+            self.assertEqual(headers[b'x-before'], str(index + 1).encode())
+            self.assertEqual(res.body, {'page': '1', 'language': None, 'touched': True})
+        self.assertEqual(len(seen), 6)
+
+    async def test_vary_headers_split_flights(self):
+        self.app.GET('/feed', self.feed, coalesce=Coalesce(vary=['Accept-Language']))
+        results = await self.gather(
+            self.app.earth.GET('/feed', headers={'accept-language': 'en'}),
+            self.app.earth.GET('/feed', headers={'accept-language': 'fr'}),
+            self.app.earth.GET('/feed', headers={'accept-language': 'fr'}),
+        )
+        self.assertEqual(self.runs, 2)
+        self.assertEqual(results[2][1].body['language'], 'fr')
+
+    async def test_hosts_split_flights_and_repeated_headers_share_one(self):
+        flights = Coalesce(vary=['Accept-Language'])
+        self.app.GET('/feed', self.feed, coalesce=flights)
+        languages = ['en', 'fr']
+        results = await self.gather(
+            self.app.earth.GET('/feed', headers={'host': 'alice.example', 'accept-language': languages}),
+            self.app.earth.GET('/feed', headers={'host': 'alice.example', 'accept-language': languages}),
+            self.app.earth.GET('/feed', headers={'host': 'bob.example', 'accept-language': languages}),
+        )
+        self.assertEqual((self.runs, flights.saved), (2, 1))
+        self.assertEqual(results[2][1].body['language'], languages)
+
+    async def test_waiters_past_the_bound_run_themselves(self):
+        flights = Coalesce(waiters=1)
+        self.app.GET('/feed', self.feed, coalesce=flights)
+        await self.gather(*[self.app.earth.GET('/feed') for _ in range(3)])
+        self.assertEqual((self.runs, flights.saved, flights.overflowed), (2, 1, 1))
+
+    async def test_leader_errors_reach_the_waiters(self):
+        async def broken(req, res, ctx):
+            await asyncio.sleep(.01)
+            raise ValueError('upstream')
+        self.app.GET('/broken', broken, coalesce=True)
+        results = await asyncio.gather(*[self.app.earth.GET('/broken') for _ in range(3)])
+        self.assertEqual([res.status for _, res, _ in results], [500, 500, 500])
+
+    async def test_cancelled_leader_hands_over(self):
+        self.app.GET('/feed', self.feed, coalesce=True)
+        leader = asyncio.ensure_future(self.app.earth.GET('/feed'))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(self.app.earth.GET('/feed'))
+        await asyncio.sleep(.01)
+        leader.cancel()
+        await asyncio.sleep(.01)
+        self.release.set()
+        _, res, _ = await follower
+        self.assertEqual(res.status, 200)
+        self.assertEqual(self.runs, 2)
+
+
+class CoalesceRegistrationTest(TestCase):
+    def test_only_get_routes_coalesce(self):
+        with self.assertRaises(TypeError): App().POST('/feed', lambda req, res, ctx: None, coalesce=True)
@@ -0,0 +1,140 @@
+import asyncio
+import gzip
+import zlib
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import patch
+
+from heaven import App
+from heaven.compression import Compression
+
+
+async def call(app, path, accept='gzip', method='GET'):
+    """Run one request through the whole app, returning status, headers and the
+    body chunks as they were sent."""
+    sent = []
+    async def receive(): return {'type': 'http.request', 'body': b'', 'more_body': False}
+    async def send(message): sent.append(message)
+    headers = [(b'host', b'localhost')]
+    # a list sends the header once per value
+    for value in ([accept] if isinstance(accept, str) else accept or ()): headers.append((b'accept-encoding', value.encode()))
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'headers': headers}
+    await app(scope, receive, send)
+    return sent[0]['status'], dict(sent[0]['headers']), [message['body'] for message in sent[1:]]
+
+
+ROWS = [{'id': index, 'name': f'item {index}', 'tags': ['a', 'b']} for index in range(200)]
+
+
+class NegotiationTest(TestCase):
+    def test_q_values_then_preference(self):
+        compression = Compression(encodings=['gzip', 'deflate'])
+        self.assertEqual(compression.negotiate('gzip, deflate, br'), 'gzip')
+        self.assertEqual(compression.negotiate('deflate, gzip;q=0.5'), 'deflate')
+        self.assertEqual(compression.negotiate('*'), 'gzip')
+        self.assertEqual(compression.negotiate('*, gzip;q=0'), 'deflate')
+        self.assertIsNone(compression.negotiate('br'))
+        self.assertIsNone(compression.negotiate('identity'))
+        self.assertIsNone(compression.negotiate(None))
+        self.assertEqual(compression.negotiate(['br', 'deflate']), 'deflate')
+
+    def test_bad_values(self):
+        with self.assertRaises(ValueError): Compression(level=0)
+        with self.assertRaises(ValueError): Compression(encodings=['lzma'])
+
+
+class CompressionTest(IsolatedAsyncioTestCase):
+    async def test_app_wide_json(self):
+        app = App(compress=True)
+        app.GET('/rows', lambda req, res, ctx: setattr(res, 'body', ROWS))
+        app.GET('/tiny', lambda req, res, ctx: setattr(res, 'body', b'ok'))
+
+        status, headers, chunks = await call(app, '/rows')
+        self.assertEqual((status, headers[b'Content-Encoding'], headers[b'Vary']), (200, b'gzip', b'Accept-Encoding'))
+        self.assertIn(b'"item 199"', gzip.decompress(chunks[0]))
+
+        # no accepted encoding: sent as it is, but still marked as varying
+        _, headers, chunks = await call(app, '/rows', accept=None)
+        self.assertNotIn(b'Content-Encoding', headers)
+        self.assertEqual(headers[b'Vary'], b'Accept-Encoding')
+        self.assertTrue(chunks[0].startswith(b'[{'))
+
+        _, headers, chunks = await call(app, '/tiny')
+        self.assertNotIn(b'Content-Encoding', headers)
+        self.assertEqual(chunks[0], b'ok')
+
+    async def test_repeated_accept_encoding_and_failures_still_answer(self):
+        app = App(compress=True)
+        app.GET('/rows', lambda req, res, ctx: setattr(res, 'body', ROWS))
+        status, headers, chunks = await call(app, '/rows', accept=['br;q=0', 'gzip'])
+        self.assertEqual((status, headers[b'Content-Encoding']), (200, b'gzip'))
+        self.assertIn(b'"item 199"', gzip.decompress(chunks[0]))
+
+        with patch('heaven.compression.ENCODERS', {'gzip': None}):
+            status, headers, chunks = await call(app, '/rows')
+        self.assertEqual(status, 200)
+        self.assertNotIn(b'Content-Encoding', headers)
+        self.assertTrue(chunks[0].startswith(b'[{'))
+
+        _, headers, chunks = await call(app, '/rows', method='HEAD')
+        self.assertEqual((headers[b'Content-Encoding'], chunks[0]), (b'gzip', b''))
+
+    async def test_per_route(self):
+        app = App()
+        app.GET('/on', lambda req, res, ctx: setattr(res, 'body', ROWS), compress=Compression(encodings=['deflate']))
+        app.GET('/off', lambda req, res, ctx: setattr(res, 'body', ROWS))
+        _, headers, chunks = await call(app, '/on', accept='gzip, deflate')
+        self.assertEqual(headers[b'Content-Encoding'], b'deflate')
+        self.assertIn(b'"item 0"', zlib.decompress(chunks[0]))
+        _, headers, _ = await call(app, '/off')
+        self.assertNotIn(b'Content-Encoding', headers)
+
+        app = App(compress=True)
+        app.GET('/off', lambda req, res, ctx: setattr(res, 'body', ROWS), compress=False)
+        _, headers, _ = await call(app, '/off')
+        self.assertNotIn(b'Content-Encoding', headers)
+
+    async def test_skips_what_is_compressed_already(self):
+        app = App(compress=True)
+        def image(req, res, ctx):
+            res.header('Content-Type', 'image/png')
+            res.body = b'\x89PNG' * 500
+        def encoded(req, res, ctx):
+            res.header('Content-Encoding', 'br')
+            res.body = b'x' * 2000
+        def svg(req, res, ctx):
+            res.header('Content-Type', 'image/svg+xml')
+            res.header('Vary', 'Origin')
+            res.body = b'<svg>' + b'<g/>' * 500 + b'</svg>'
+        app.GET('/image', image)
+        app.GET('/encoded', encoded)
+        app.GET('/svg', svg)
+        _, headers, _ = await call(app, '/image')
+        self.assertNotIn(b'Content-Encoding', headers)
+        _, headers, _ = await call(app, '/encoded')
+        self.assertEqual(headers[b'Content-Encoding'], b'br')
+        _, headers, _ = await call(app, '/svg')
+        self.assertEqual((headers[b'Content-Encoding'], headers[b'Vary']), (b'gzip', b'Origin, Accept-Encoding'))
+
+    async def test_streams_flush_every_event(self):
+        app = App(compress=True)
+        async def events():
+            for index in range(3):
+                yield {'index': index}
+                await asyncio.sleep(0)
+        app.GET('/events', lambda req, res, ctx: res.stream(events(), sse=True))
+
+        _, headers, chunks = await call(app, '/events')
+        self.assertEqual(headers[b'Content-Encoding'], b'gzip')
+        # every event decompresses on its own as soon as it arrives
+        decompressor = zlib.decompressobj(31)
+        for index, chunk in enumerate(chunks[:3]):
+            self.assertEqual(decompressor.decompress(chunk), f'data: {{"index":{index}}}\n\n'.encode())
+        decompressor.decompress(b''.join(chunks[3:]))
+        self.assertTrue(decompressor.eof)
+
+    async def test_files_stream_compressed(self):
+        app = App(compress=True)
+        app.GET('/readme', lambda req, res, ctx: res.file('README.md'))
+        _, headers, chunks = await call(app, '/readme')
+        self.assertEqual(headers[b'Content-Encoding'], b'gzip')
+        with open('README.md', 'rb') as file: self.assertEqual(gzip.decompress(b''.join(chunks)), file.read())
@@ -0,0 +1,121 @@
+import os
+import tempfile
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import patch
+
+from heaven import App
+from heaven.etags import fresh, httpdate, matches, strong, weak
+
+
+class ValidatorTest(TestCase):
+    def test_strong_and_weak(self):
+        self.assertEqual(strong(b'hello'), strong(b'hello'))
+        self.assertNotEqual(strong(b'hello'), strong(b'hello!'))
+        self.assertEqual(len(strong(b'')), 18)
+        self.assertEqual(weak(255, 16), 'W/"ff-10"')
+
+    def test_matching_is_weak(self):
+        self.assertTrue(matches('"a", W/"b"', '"b"'))
+        self.assertTrue(matches('W/"a"', '"a"'))
+        self.assertTrue(matches('*', '"z"'))
+        self.assertFalse(matches('"a"', '"b"'))
+
+    def test_if_none_match_wins_over_if_modified_since(self):
+        headers = {'if-none-match': '"old"', 'if-modified-since': httpdate(2000)}
+        self.assertFalse(fresh(headers, '"new"', 1000))
+        self.assertTrue(fresh({'if-modified-since': httpdate(2000)}, '"new"', 1000.5))
+        self.assertFalse(fresh({'if-modified-since': httpdate(2000)}, None, 3000))
+        self.assertFalse(fresh({'if-modified-since': 'yesterday'}, None, 1000))
+        self.assertTrue(fresh({'if-none-match': ['"old"', '"new", "newer"']}, '"new"'))
+        self.assertFalse(fresh({'if-modified-since': [httpdate(2000), httpdate(3000)]}, None, 1000))
+
+
+class ConditionalTest(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.app = App(etag=True)
+        self.runs = 0
+
+        def board(req, res, ctx):
+            self.runs += 1
+            res.body = {'widgets': [1, 2, 3]}
+        self.app.GET('/board', board)
+
+    async def test_dynamic_bodies_get_a_strong_etag_and_304(self):
+        _, res, _ = await self.app.earth.GET('/board')
+        etag = dict(res.headers)[b'ETag']
+        self.assertEqual(etag.decode(), strong(b'{"widgets":[1,2,3]}'))
+        self.assertEqual(dict(res.headers)[b'Content-Type'], b'application/json')
+
+        _, res, _ = await self.app.earth.GET('/board', headers={'if-none-match': etag.decode()})
+        self.assertEqual((res.status, res.body), (304, b''))
+        self.assertEqual(dict(res.headers)[b'ETag'], etag)
+
+        _, res, _ = await self.app.earth.GET('/board', headers={'if-none-match': '"stale"'})
+        self.assertEqual(res.status, 200)
+
+        # the header sent twice is read as one list
+        _, res, _ = await self.app.earth.GET('/board', headers={'if-none-match': ['"stale"', etag.decode()]})
+        self.assertEqual((res.status, res.body), (304, b''))
+
+    async def test_handler_etags_errors_and_posts_are_left_alone(self):
+        def own(req, res, ctx):
+            res.header('ETag', '"v7"')
+            res.body = b'seven'
+        def missing(req, res, ctx):
+            res.status = 404
+            res.body = b'gone'
+        self.app.GET('/own', own)
+        self.app.GET('/missing', missing)
+        self.app.POST('/submit', lambda req, res, ctx: setattr(res, 'body', b'ok'))
+
+        _, res, _ = await self.app.earth.GET('/own', headers={'if-none-match': '"v7"'})
+        self.assertEqual(res.status, 304)
+        _, res, _ = await self.app.earth.GET('/missing')
+        self.assertNotIn(b'ETag', dict(res.headers))
+        _, res, _ = await self.app.earth.POST('/submit')
+        self.assertNotIn(b'ETag', dict(res.headers))
+
+    async def test_opt_in_per_route(self):
+        app = App()
+        app.GET('/on', lambda req, res, ctx: setattr(res, 'body', b'on'), etag=True)
+        app.GET('/off', lambda req, res, ctx: setattr(res, 'body', b'off'))
+        _, res, _ = await app.earth.GET('/on')
+        self.assertIn(b'ETag', dict(res.headers))
+        _, res, _ = await app.earth.GET('/off')
+        self.assertNotIn(b'ETag', dict(res.headers))
+
+    async def test_cached_responses_keep_their_etag(self):
+        self.app.cache('/board')
+        _, res, _ = await self.app.earth.GET('/board')
+        etag = dict(res.headers)[b'ETag'].decode()
+        _, res, _ = await self.app.earth.GET('/board', headers={'if-none-match': etag})
+        self.assertEqual(res.status, 304)
+        self.assertEqual(self.runs, 1)
+
+    async def test_files_answer_304_without_being_opened(self):
+        folder = tempfile.mkdtemp()
+        with open(os.path.join(folder, 'report.csv'), 'wb') as file: file.write(b'a,b\n1,2\n')
+        self.app.GET('/files/:name', lambda req, res, ctx: res.file(req.params.get('name'), within=folder))
+
+        _, res, _ = await self.app.earth.GET('/files/report.csv')
+        headers = dict(res.headers)
+        info = os.stat(os.path.join(folder, 'report.csv'))
+        self.assertEqual(headers[b'ETag'].decode(), weak(info.st_size, info.st_mtime_ns))
+        self.assertEqual(headers[b'Last-Modified'].decode(), httpdate(info.st_mtime))
+
+        with patch('heaven.response.FileBody') as opened:
+            _, res, _ = await self.app.earth.GET('/files/report.csv', headers={'if-none-match': headers[b'ETag'].decode()})
+            self.assertEqual((res.status, res.body), (304, b''))
+            _, res, _ = await self.app.earth.GET('/files/report.csv', headers={'if-modified-since': headers[b'Last-Modified'].decode()})
+            self.assertEqual(res.status, 304)
+        opened.assert_not_called()
+
+    async def test_compression_weakens_the_etag(self):
+        app = App(etag=True, compress=True)
+        app.GET('/big', lambda req, res, ctx: setattr(res, 'body', b'x' * 2000))
+        sent = []
+        async def receive(): return {'type': 'http.request', 'body': b'', 'more_body': False}
+        async def send(message): sent.append(message)
+        scope = {'type': 'http', 'method': 'GET', 'path': '/big', 'query_string': b'', 'headers': [(b'host', b'x'), (b'accept-encoding', b'gzip')]}
+        await app(scope, receive, send)
+        self.assertEqual(dict(sent[0]['headers'])[b'ETag'], f'W/{strong(b"x" * 2000)}'.encode())
@@ -0,0 +1,190 @@
+import asyncio
+import os
+import pickle
+import threading
+import time
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from heaven import App
+from heaven.executors import Processes, Threads, Work
+
+
+def where(req, res, ctx):
+    res.body = threading.current_thread().name.encode()
+
+
+def square(work):
+    n = int(work.params['n'])
+    return 200, str(n * n).encode(), {'x-pid': str(os.getpid())}
+
+
+def echo(work):
+    return work.body[::-1]
+
+
+def fails(work):
+    raise ValueError(work.path)
+
+
+class ThreadsTest(IsolatedAsyncioTestCase):
+    async def test_gauges_follow_calls_through_the_pool(self):
+        threads = Threads(1)
+        release = threading.Event()
+        first = asyncio.ensure_future(threads.run(release.wait))
+        second = asyncio.ensure_future(threads.run(lambda: 'done'))
+        await asyncio.sleep(.05)
+        self.assertEqual((threads.active, threads.queued, threads.completed), (1, 1, 0))
+        release.set()
+        self.assertEqual(await second, 'done')
+        await first
+        self.assertEqual((threads.active, threads.queued, threads.completed), (0, 0, 2))
+        threads.shutdown()
+
+    async def test_cancelled_before_starting_leaves_the_queue(self):
+        threads = Threads(1)
+        release = threading.Event()
+        first = asyncio.ensure_future(threads.run(release.wait))
+        second = asyncio.ensure_future(threads.run(lambda: 'never'))
+        await asyncio.sleep(.05)
+        second.cancel()
+        with self.assertRaises(asyncio.CancelledError): await second
+        self.assertEqual(threads.queued, 0)
+        release.set()
+        await first
+        threads.shutdown()
+
+    async def test_default_size_is_reported(self):
+        threads = Threads()
+        await threads.run(lambda: None)
+        self.assertGreater(threads.workers, 0)
+        threads.shutdown()
+
+
+class ThreadedRoutesTest(IsolatedAsyncioTestCase):
+    async def test_sync_handlers_stay_on_the_loop_by_default(self):
+        app = App()
+        app.GET('/where', where)
+        _, res, _ = await app.earth.GET('/where')
+        self.assertEqual(res.body, threading.current_thread().name.encode())
+
+    async def test_app_threads_take_sync_hooks_and_handlers(self):
+        app = App(threads=2)
+        seen = []
+        app.BEFORE('/*', lambda req, res, ctx: seen.append(threading.current_thread().name))
+        app.GET('/where', where)
+        app.GET('/inline', where, threaded=False)
+        _, res, _ = await app.earth.GET('/where')
+        self.assertTrue(res.body.startswith(b'heaven'))
+        self.assertTrue(seen[0].startswith('heaven'))
+        _, res, _ = await app.earth.GET('/inline')
+        self.assertEqual(res.body, threading.current_thread().name.encode())
+        self.assertEqual(app.threads.completed, 2)
+        app.threads.shutdown()
+
+    async def test_route_can_opt_in_without_app_threads(self):
+        app = App()
+        app.GET('/where', where, threaded=True)
+        app.subdomain('api').GET('/where', where, threaded=True)
+        _, res, _ = await app.earth.GET('/where')
+        self.assertTrue(res.body.startswith(b'heaven'))
+        app.threads.shutdown()
+
+    async def test_blocking_handler_does_not_stall_the_loop(self):
+        app = App()
+        app.GET('/slow', lambda req, res, ctx: time.sleep(.3), threaded=True)
+
+        async def fast(req, res, ctx): res.body = b'fast'
+        app.GET('/fast', fast)
+
+        slow = asyncio.ensure_future(app.earth.GET('/slow'))
+        await asyncio.sleep(.05)
+        started = time.perf_counter()
+        _, res, _ = await app.earth.GET('/fast')
+        self.assertLess(time.perf_counter() - started, .2)
+        self.assertEqual(app.threads.active, 1)
+        await slow
+        app.threads.shutdown()
+
+    async def test_options_survive_mounting(self):
+        child = App()
+        child.GET('/where', where, threaded=True)
+        parent = App()
+        parent.mount(child)
+        self.assertEqual(parent.subdomains['www'].options[('GET', '/where')], {'threaded': True})
+        _, res, _ = await parent.earth.GET('/where')
+        self.assertTrue(res.body.startswith(b'heaven'))
+        parent.threads.shutdown()
+
+
+class RouteOptionsTest(TestCase):
+    def test_unknown_options_are_rejected(self):
+        with self.assertRaises(TypeError): App().GET('/', where, thread=True)
+
+
+class ProcessesTest(IsolatedAsyncioTestCase):
+    async def test_work_survives_pickling(self):
+        work = pickle.loads(pickle.dumps(Work('GET', '/a', '/:n', {'n': 1}, {}, {'host': 'x'}, b'body')))
+        self.assertEqual((work.method, work.path, work.params, work.body), ('GET', '/a', {'n': 1}, b'body'))
+
+    async def test_start_spawns_the_workers(self):
+        processes = Processes(1)
+        await processes.start()
+        self.assertEqual(processes.workers, 1)
+        self.assertEqual(await processes.run(echo, Work('GET', '/', '/', {}, {}, {}, b'ab')), b'ba')
+        self.assertEqual((processes.pending, processes.completed), (0, 1))
+        processes.shutdown()
+
+
+class ComputedRoutesTest(IsolatedAsyncioTestCase):
+    async def asyncTearDown(self):
+        self.app.processes.shutdown()
+
+    async def test_handler_runs_in_another_process(self):
+        self.app = app = App(processes=1)
+        app.BEFORE('/*', lambda req, res, ctx: setattr(res, 'headers', ('x-before', 'yes')))
+        app.GET('/square/:n', square, cpu=True)
+        app.POST('/echo', echo, cpu=True)
+        _, res, _ = await app.earth.GET('/square/12')
+        self.assertEqual((res.status, res.body), (200, b'144'))
+        headers = dict(res.headers)
+        self.assertNotEqual(headers[b'x-pid'], str(os.getpid()).encode())
+        self.assertEqual(headers[b'x-before'], b'yes')
+        _, res, _ = await app.earth.POST('/echo', body=b'abc')
+        self.assertEqual(res.body, b'cba')
+        self.assertEqual(app.processes.completed, 2)
+
+    async def test_errors_in_the_worker_are_500s(self):
+        self.app = app = App(processes=1)
+        app.GET('/fails', fails, cpu=True)
+        _, res, _ = await app.earth.GET('/fails')
+        self.assertEqual(res.status, 500)
+
+    async def test_survives_mounting(self):
+        child = App()
+        child.POST('/echo', echo, cpu=True)
+        self.app = app = App(processes=1)
+        app.mount(child)
+        _, res, _ = await app.earth.POST('/echo', body=b'abc')
+        self.assertEqual(res.body, b'cba')
+
+    async def test_lifespan_starts_and_stops_the_pool(self):
+        self.app = app = App(processes=1)
+        app.GET('/echo', echo, cpu=True)
+        messages = asyncio.Queue()
+        for kind in ('lifespan.startup', 'lifespan.shutdown'): messages.put_nowait({'type': kind})
+        sent = []
+
+        async def send(message):
+            sent.append(message['type'])
+            if message['type'] == 'lifespan.startup.complete': self.assertIsNotNone(app.processes._executor)
+            if message['type'] == 'lifespan.shutdown.complete': raise asyncio.CancelledError
+        with self.assertRaises(asyncio.CancelledError): await app({'type': 'lifespan'}, messages.get, send)
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        self.assertIsNone(app.processes._executor)
+
+    async def test_registration_checks_the_handler(self):
+        self.app = app = App()
+        async def asynchronous(work): pass
+        with self.assertRaises(TypeError): app.GET('/a', asynchronous, cpu=True)
+        with self.assertRaises(TypeError): app.GET('/b', lambda work: None, cpu=True)
+        with self.assertRaises(TypeError): app.POST('/c', echo, cpu=True, stream=True)
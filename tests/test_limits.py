@@ -0,0 +1,150 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from heaven import App
+from heaven.limits import Limit
+
+
+class LimitTest(IsolatedAsyncioTestCase):
+    async def test_queue_hands_slots_over_in_order(self):
+        limit = Limit(1, queue=2, wait=None)
+        self.assertTrue(await limit.acquire())
+        second = asyncio.ensure_future(limit.acquire())
+        third = asyncio.ensure_future(limit.acquire())
+        await asyncio.sleep(0)
+        self.assertEqual((limit.inflight, limit.queued), (1, 2))
+        self.assertFalse(await limit.acquire())
+        limit.release()
+        self.assertTrue(await second)
+        self.assertFalse(third.done())
+        limit.release()
+        self.assertTrue(await third)
+        self.assertEqual((limit.inflight, limit.admitted, limit.shed), (1, 3, 1))
+
+    async def test_wait_runs_out(self):
+        limit = Limit(1, wait=.01)
+        await limit.acquire()
+        self.assertFalse(await limit.acquire())
+        self.assertEqual((limit.queued, limit.shed), (0, 1))
+
+    async def test_cancelled_waiter_leaves_the_queue(self):
+        limit = Limit(1, wait=None)
+        await limit.acquire()
+        waiting = asyncio.ensure_future(limit.acquire())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError): await waiting
+        self.assertEqual(limit.queued, 0)
+        limit.release()
+        self.assertEqual(limit.inflight, 0)
+
+    async def test_adaptive_limit_backs_off_and_recovers(self):
+        limit = Limit(10, adaptive=True, latency=.1)
+        limit.inflight = 1
+        limit.release(.5)
+        self.assertAlmostEqual(limit.limit, 9.0)
+        # a second slow response in the same round trip does not cut again
+        limit.inflight = 1
+        limit.release(.5)
+        self.assertAlmostEqual(limit.limit, 9.0)
+        for _ in range(50):
+            limit.inflight = 1
+            limit.release(.01)
+        self.assertEqual(limit.limit, 10.0)
+
+    async def test_adaptive_limit_learns_its_target(self):
+        limit = Limit(4, adaptive=True)
+        for elapsed in (.01, .01, .5):
+            limit.inflight = 1
+            limit.release(elapsed)
+        self.assertLess(limit.limit, 4)
+
+
+class LimitedRoutesTest(IsolatedAsyncioTestCase):
+    async def test_group_limit_sheds_with_retry_after(self):
+        app = App()
+        release = asyncio.Event()
+        seen = []
+        async def report(req, res, ctx):
+            await release.wait()
+            res.body = b'report'
+        async def cheap(req, res, ctx): res.body = b'cheap'
+        app.BEFORE('/*', lambda req, res, ctx: seen.append(req.url))
+        app.GET('/reports/:id', report)
+        app.GET('/health', cheap)
+        limit = app.limit('/reports/*', 1, queue=1, wait=5)
+
+        first = asyncio.ensure_future(app.earth.GET('/reports/1'))
+        second = asyncio.ensure_future(app.earth.GET('/reports/2'))
+        await asyncio.sleep(.01)
+        self.assertEqual((limit.inflight, limit.queued), (1, 1))
+
+        _, res, _ = await app.earth.GET('/reports/3')
+        self.assertEqual(res.status, 503)
+        self.assertIn((b'Retry-After', b'6'), res.headers)
+        self.assertNotIn('/reports/3', seen)
+
+        _, res, _ = await app.earth.GET('/health')
+        self.assertEqual(res.body, b'cheap')
+
+        release.set()
+        for pending in (first, second):
+            _, res, _ = await pending
+            self.assertEqual(res.body, b'report')
+        self.assertEqual((limit.inflight, limit.admitted, limit.shed), (0, 2, 1))
+
+    async def test_a_wildcard_route_under_its_own_limit_takes_one_slot(self):
+        app = App()
+        async def report(req, res, ctx): res.body = b'report'
+        app.GET('/reports/*', report)
+        app.GET('/*', report)
+        limit = app.limit('/reports/*', 1)
+        everything = app.limit('/*', 1)
+        for url in ('/reports/1/pdf', '/reports/2', '/other'):
+            _, res, _ = await app.earth.GET(url)
+            self.assertEqual(res.body, b'report')
+        self.assertEqual((limit.inflight, limit.admitted, limit.shed), (0, 2, 0))
+        self.assertEqual((everything.inflight, everything.admitted, everything.shed), (0, 3, 0))
+
+    async def test_slots_come_back_after_errors_and_timeouts(self):
+        app = App()
+        async def fails(req, res, ctx): raise ValueError
+        async def slow(req, res, ctx): await asyncio.sleep(10)
+        app.GET('/fails', fails)
+        app.GET('/slow', slow, timeout=.01)
+        limit = app.limit('/*', 1)
+        _, res, _ = await app.earth.GET('/fails')
+        self.assertEqual(res.status, 500)
+        _, res, _ = await app.earth.GET('/slow')
+        self.assertEqual(res.status, 504)
+        self.assertEqual(limit.inflight, 0)
+
+    async def test_queueing_does_not_shrink_an_adaptive_limit(self):
+        app = App()
+        async def steady(req, res, ctx):
+            await asyncio.sleep(.01)
+            res.body = b'steady'
+        app.GET('/steady', steady)
+        limit = app.limit('/steady', 4, queue=40, wait=None, adaptive=True)
+        # ten times the slots, so most requests queue for several service times
+        for _ in range(2): await asyncio.gather(*[app.earth.GET('/steady') for _ in range(40)])
+        self.assertEqual(limit.admitted, 80)
+        self.assertEqual(limit.limit, 4.0)
+
+    async def test_subdomain_and_mounted_limits(self):
+        child = App()
+        async def ok(req, res, ctx): res.body = b'ok'
+        child.GET('/ok', ok)
+        limit = child.limit('/ok', 2)
+        parent = App()
+        parent.mount(child)
+        await parent.earth.GET('/ok')
+        self.assertEqual(limit.admitted, 1)
+        api = parent.subdomain('api')
+        self.assertEqual(api.limit('/*', 3).maximum, 3)
+
+
+class LimitRegistrationTest(TestCase):
+    def test_bad_limits_are_rejected(self):
+        with self.assertRaises(ValueError): App().limit('/*', 0)
+        with self.assertRaises(Exception): App().limit('reports', 1)
@@ -0,0 +1,142 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from heaven import App
+from heaven.memo import Memo
+
+
+class CachedTest(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.app = App()
+        self.calls = []
+
+    async def test_async_results_are_kept_by_arguments(self):
+        @self.app.cached(maxsize=10)
+        async def price(sku, region='eu'):
+            self.calls.append((sku, region))
+            return f'{sku}:{region}'
+
+        self.assertEqual(await price('a'), 'a:eu')
+        self.assertEqual(await price('a'), 'a:eu')
+        self.assertEqual(await price('a', region='us'), 'a:us')
+        self.assertEqual(await price('a', region='us'), 'a:us')
+        self.assertEqual(self.calls, [('a', 'eu'), ('a', 'us')])
+        memo = self.app.memos[price.memo.name]
+        self.assertEqual((memo.hits, memo.misses, memo.loads), (2, 2, 2))
+        self.assertEqual(price.__name__, 'price')
+
+    async def test_concurrent_misses_load_once(self):
+        @self.app.cached()
+        async def flags(tenant):
+            self.calls.append(tenant)
+            await asyncio.sleep(.01)
+            return {'tenant': tenant}
+
+        results = await asyncio.gather(*[flags('acme') for _ in range(20)], flags('other'))
+        self.assertEqual(sorted(self.calls), ['acme', 'other'])
+        self.assertTrue(all(result == {'tenant': 'acme'} for result in results[:20]))
+        self.assertEqual(flags.memo.loads, 2)
+
+    async def test_errors_reach_waiters_and_are_not_kept(self):
+        @self.app.cached()
+        async def broken():
+            self.calls.append(1)
+            await asyncio.sleep(.01)
+            raise ValueError('upstream')
+
+        results = await asyncio.gather(broken(), broken(), return_exceptions=True)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        with self.assertRaises(ValueError): await broken()
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(len(broken.memo), 0)
+
+    async def test_cancelled_load_hands_over(self):
+        @self.app.cached()
+        async def slow():
+            self.calls.append(1)
+            await asyncio.sleep(.02)
+            return 'done'
+
+        first = asyncio.ensure_future(slow())
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(slow())
+        await asyncio.sleep(0)
+        first.cancel()
+        self.assertEqual(await second, 'done')
+        self.assertEqual(len(self.calls), 2)
+
+    async def test_lru_and_ttl_eviction(self):
+        @self.app.cached(ttl=.02, maxsize=2)
+        def square(n):
+            self.calls.append(n)
+            return n * n
+
+        square(1); square(2); square(1); square(3)
+        # 2 was least recently used when 3 came in
+        self.assertEqual(square(1), 1)
+        self.assertEqual(square(2), 4)
+        self.assertEqual(square.memo.evictions, 2)
+        await asyncio.sleep(.03)
+        square(2)
+        self.assertEqual(self.calls, [1, 2, 3, 2, 2])
+        self.assertEqual(square.memo.expirations, 1)
+
+    async def test_invalidation_by_key_and_tag(self):
+        @self.app.cached(tags=lambda tenant, name: [f'tenant:{tenant}'])
+        async def flag(tenant, name):
+            self.calls.append((tenant, name))
+            return True
+
+        @self.app.cached(tags=['pricing'])
+        def table(): return self.calls.append('table') or len(self.calls)
+
+        for tenant, name in (('a', 'x'), ('a', 'y'), ('b', 'x')): await flag(tenant, name)
+        table()
+        self.assertTrue(flag.invalidate('b', 'x'))
+        self.assertFalse(flag.invalidate('b', 'x'))
+        self.assertEqual(self.app.invalidate('tenant:a', 'pricing'), 3)
+        self.assertEqual(len(flag.memo), 0)
+        await flag('a', 'x'); table()
+        self.assertEqual(len(self.calls), 6)
+
+    async def test_invalidated_while_loading_is_not_kept(self):
+        @self.app.cached()
+        async def value():
+            self.calls.append(1)
+            await asyncio.sleep(.01)
+            return len(self.calls)
+
+        pending = asyncio.ensure_future(value())
+        await asyncio.sleep(0)
+        value.invalidate()
+        self.assertEqual(await pending, 1)
+        self.assertEqual(len(value.memo), 0)
+
+    def test_custom_key(self):
+        @self.app.cached(key=lambda query: tuple(sorted(query.items())))
+        def search(query): return self.calls.append(query) or len(self.calls)
+        search({'q': 1, 'page': 2})
+        search({'page': 2, 'q': 1})
+        self.assertEqual(len(self.calls), 1)
+
+
+class SyncSingleFlightTest(TestCase):
+    def test_threads_share_one_load(self):
+        app = App()
+        calls = []
+
+        @app.cached()
+        def slow(n):
+            calls.append(n)
+            time.sleep(.05)
+            return n * 2
+
+        with ThreadPoolExecutor(8) as pool: results = list(pool.map(slow, [3] * 8))
+        self.assertEqual(results, [6] * 8)
+        self.assertEqual(calls, [3])
+
+    def test_bad_values(self):
+        with self.assertRaises(ValueError): Memo(len, ttl=0)
+        with self.assertRaises(ValueError): Memo(len, maxsize=0)
@@ -45,3 +45,52 @@ class TestQueryString(unittest.TestCase):
 
 if __name__ == '__main__':
     unittest.main()
+
+
+class TestQueryParsing(unittest.TestCase):
+    def test_matches_urllib_parse_qs(self):
+        import random
+        from urllib.parse import parse_qs
+        from heaven.utils import parse_querystring
+        rng = random.Random(7)
+        pieces = ['a', 'b', 'k', '=', '&', '&&', '+', '%20', '%2B', '%3D', '%26', '%', '%zz', '%C3%A9', 'é', ';', '']
+        for _ in range(3000):
+            qs = ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 12)))
+            with self.subTest(qs=qs):
+                self.assertEqual(parse_querystring(qs), parse_qs(qs, keep_blank_values=True))
+
+    def test_hints_compile_once_into_a_readonly_map(self):
+        from types import MappingProxyType
+        from heaven.utils import compile_queryhint, lenient_boolean
+        compiled = compile_queryhint('page:int&flag:bool&bad&odd:nope')
+        self.assertIsInstance(compiled, MappingProxyType)
+        self.assertEqual(dict(compiled), {'page': int, 'flag': lenient_boolean})
+        self.assertIs(compile_queryhint('page:int&flag:bool&bad&odd:nope'), compiled)
+
+    def test_repeated_keys_and_blank_values(self):
+        scope = {'type': 'http', 'query_string': b'tag=a&tag=b&empty=&bare&n=4'}
+        request = Request(scope, b'', None, (None, {}))
+        request.qh = 'n:int&tag:str'
+        self.assertEqual(request.queries, {'tag': ['a', 'b'], 'empty': '', 'bare': '', 'n': 4})
+
+    def test_routes_hand_requests_the_map_compiled_at_registration(self):
+        from unittest.mock import patch
+        from heaven import App
+        from heaven.constants import DEFAULT
+        from heaven.mocks import MockRequest
+        # more distinct hints than the compile memo holds
+        for freeze in (None, {}, {'generate_code': True}):
+            app = App(route_cache=64)
+            for index in range(1100): app.GET(f'/r{index}/:id?n{index}:int', lambda req, res, ctx: None)
+            app.GET('/static?page:int', lambda req, res, ctx: None)
+            if freeze is not None: app.freeze(**freeze)
+            engine = app.subdomains[DEFAULT]
+            with patch('heaven.request.compile_queryhint') as compiled, patch('heaven.utils.compile_queryhint') as inner:
+                for path, hint in (('/r1099/7', 'n1099:int'), ('/r1099/7', 'n1099:int'), ('/static', 'page:int')):
+                    with self.subTest(freeze=freeze, path=path):
+                        request = MockRequest(path)
+                        engine.resolve('GET', path, request)
+                        self.assertEqual(request.qh, hint)
+                        self.assertEqual(dict(request._hint[1]), {hint.split(':')[0]: int})
+            compiled.assert_not_called()
+            inner.assert_not_called()
@@ -0,0 +1,109 @@
+import os
+import tempfile
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from heaven import App
+from heaven.etags import httpdate
+from heaven.ranges import MAXIMUM, current, parse
+
+
+CONTENT = bytes(range(256)) * 40
+
+
+async def read(res):
+    if isinstance(res.body, bytes): return res.body
+    return b''.join([chunk async for chunk in res.body])
+
+
+class ParseTest(TestCase):
+    def test_forms(self):
+        self.assertEqual(parse('bytes=0-99', 1000), [(0, 99)])
+        self.assertEqual(parse('bytes=900-', 1000), [(900, 999)])
+        self.assertEqual(parse('bytes=-100', 1000), [(900, 999)])
+        self.assertEqual(parse('bytes=-5000', 1000), [(0, 999)])
+        self.assertEqual(parse('bytes=990-2000', 1000), [(990, 999)])
+        self.assertEqual(parse('bytes=0-0, 10-19', 1000), [(0, 0), (10, 19)])
+
+    def test_unsatisfiable_and_ignored(self):
+        self.assertEqual(parse('bytes=1000-', 1000), [])
+        self.assertEqual(parse('bytes=-0', 1000), [])
+        self.assertIsNone(parse('items=0-1', 1000))
+        self.assertIsNone(parse('bytes=5-1', 1000))
+        self.assertIsNone(parse('bytes=a-b', 1000))
+        self.assertIsNone(parse('bytes=' + ','.join(['0-1'] * (MAXIMUM + 1)), 1000))
+        self.assertIsNone(parse(['bytes=0-1', 'bytes=5-9'], 1000))
+
+    def test_if_range_is_strong(self):
+        self.assertTrue(current(httpdate(1000), None, 1000.7))
+        self.assertFalse(current(httpdate(999), None, 1000))
+        self.assertFalse(current('W/"a"', 'W/"a"', 1000))
+        self.assertTrue(current('"a"', '"a"', 1000))
+        self.assertFalse(current(['"a"', '"a"'], '"a"', 1000))
+
+
+class FileRangeTest(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.folder, 'media'))
+        self.path = os.path.join(self.folder, 'media', 'clip.bin')
+        with open(self.path, 'wb') as file: file.write(CONTENT)
+        self.app = App()
+        self.app.GET('/clip', lambda req, res, ctx: res.file(self.path, chunk_size=1000))
+
+    async def test_whole_file_advertises_ranges(self):
+        _, res, _ = await self.app.earth.GET('/clip')
+        self.assertEqual(res.status, 200)
+        self.assertEqual(dict(res.headers)[b'Accept-Ranges'], b'bytes')
+        self.assertEqual(await read(res), CONTENT)
+
+    async def test_single_range(self):
+        _, res, _ = await self.app.earth.GET('/clip', headers={'range': 'bytes=5000-7499'})
+        headers = dict(res.headers)
+        self.assertEqual(res.status, 206)
+        self.assertEqual(headers[b'Content-Range'], f'bytes 5000-7499/{len(CONTENT)}'.encode())
+        self.assertEqual(headers[b'Content-Length'], b'2500')
+        self.assertEqual(await read(res), CONTENT[5000:7500])
+
+    async def test_multiple_ranges(self):
+        _, res, _ = await self.app.earth.GET('/clip', headers={'range': 'bytes=0-9, -10'})
+        headers = dict(res.headers)
+        self.assertEqual(res.status, 206)
+        kind = headers[b'Content-Type'].decode()
+        self.assertTrue(kind.startswith('multipart/byteranges; boundary='))
+        boundary = kind.split('=', 1)[1]
+        body = await read(res)
+        self.assertEqual(int(headers[b'Content-Length']), len(body))
+
+        parts = body.split(f'--{boundary}'.encode())
+        self.assertEqual(parts[0], b'')
+        self.assertEqual(parts[-1], b'--\r\n')
+        first, second = parts[1:3]
+        self.assertIn(f'Content-Range: bytes 0-9/{len(CONTENT)}'.encode(), first)
+        self.assertTrue(first.endswith(b'\r\n\r\n' + CONTENT[:10] + b'\r\n'))
+        self.assertIn(b'Content-Type: application/octet-stream', second)
+        self.assertTrue(second.endswith(b'\r\n\r\n' + CONTENT[-10:] + b'\r\n'))
+
+    async def test_unsatisfiable(self):
+        _, res, _ = await self.app.earth.GET('/clip', headers={'range': f'bytes={len(CONTENT)}-'})
+        self.assertEqual(res.status, 416)
+        self.assertEqual(dict(res.headers)[b'Content-Range'], f'bytes */{len(CONTENT)}'.encode())
+
+    async def test_if_range(self):
+        modified = httpdate(os.stat(self.path).st_mtime)
+        _, res, _ = await self.app.earth.GET('/clip', headers={'range': 'bytes=0-9', 'if-range': modified})
+        self.assertEqual(res.status, 206)
+        _, res, _ = await self.app.earth.GET('/clip', headers={'range': 'bytes=0-9', 'if-range': httpdate(0)})
+        self.assertEqual(res.status, 200)
+        self.assertEqual(await read(res), CONTENT)
+
+        # either header sent twice is not honoured, and the whole file goes out
+        for headers in ({'range': ['bytes=0-9', 'bytes=10-19']}, {'range': 'bytes=0-9', 'if-range': [modified, modified]}):
+            _, res, _ = await self.app.earth.GET('/clip', headers=headers)
+            self.assertEqual(res.status, 200)
+            self.assertEqual(await read(res), CONTENT)
+
+    async def test_assets_serve_ranges(self):
+        self.app.ASSETS('media', relative_to=os.path.join(self.folder, 'app.py'))
+        _, res, _ = await self.app.earth.GET('/media/clip.bin', headers={'range': 'bytes=100-199'})
+        self.assertEqual(res.status, 206)
+        self.assertEqual(await read(res), CONTENT[100:200])
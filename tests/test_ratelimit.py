@@ -0,0 +1,98 @@
+import gc
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from heaven import App
+from heaven.ratelimit import RateLimiter
+
+
+class RateLimiterTest(TestCase):
+    def test_burst_then_steady_rate(self):
+        limiter = RateLimiter(2, per=1, burst=3)
+        self.assertEqual([limiter.hit('a', 0)[:2] for _ in range(3)], [(True, 2), (True, 1), (True, 0)])
+        allowed, remaining, retry = limiter.hit('a', 0)
+        self.assertEqual((allowed, remaining), (False, 0))
+        self.assertAlmostEqual(retry, .5)
+        self.assertTrue(limiter.hit('a', .5)[0])
+        self.assertFalse(limiter.hit('a', .5)[0])
+        self.assertTrue(limiter.hit('b', .5)[0])
+        self.assertEqual((limiter.allowed, limiter.limited), (5, 2))
+
+    def test_full_buckets_are_forgotten(self):
+        limiter = RateLimiter(10, per=1)
+        for index in range(1000): limiter.hit(str(index), 0)
+        self.assertEqual(len(limiter), 1000)
+        # a client still coming back is carried into the new generation, while the
+        # rest are dropped as traffic rotates each shard
+        for now in (1.5, 2.9): limiter.hit('7', now)
+        for index in range(200): limiter.hit(f'new{index}', 3.1)
+        self.assertEqual(len(limiter), 201)
+
+    def test_denied_client_stays_limited_across_rotation(self):
+        limiter = RateLimiter(1, per=10)
+        limiter.hit('a', 0)
+        limiter.hit('b', 10.5)
+        self.assertFalse(limiter.hit('a', 10.5)[0] and limiter.hit('a', 10.5)[0])
+
+    def test_many_clients_stay_out_of_the_collector(self):
+        limiter = RateLimiter(100, per=60)
+        for index in range(50000): limiter.hit(f'10.0.{index >> 8}.{index & 255}', 0)
+        for shard in limiter._shards: self.assertFalse(gc.is_tracked(shard.current))
+
+
+class RateLimitRoutesTest(IsolatedAsyncioTestCase):
+    async def test_429_with_headers(self):
+        app = App()
+        async def ok(req, res, ctx): res.body = b'ok'
+        app.GET('/api/data', ok)
+        app.GET('/free', ok)
+        limiter = app.ratelimit(2, per=60, route='/api/*')
+
+        for remaining in (b'1', b'0'):
+            _, res, _ = await app.earth.GET('/api/data')
+            self.assertEqual(res.status, 200)
+            self.assertIn((b'RateLimit-Remaining', remaining), res.headers)
+        _, res, _ = await app.earth.GET('/api/data')
+        self.assertEqual((res.status, res.body), (429, b'Too Many Requests'))
+        headers = dict(res.headers)
+        self.assertEqual(headers[b'RateLimit-Limit'], b'2')
+        self.assertEqual(headers[b'Retry-After'], b'30')
+
+        _, res, _ = await app.earth.GET('/free')
+        self.assertEqual(res.status, 200)
+        self.assertNotIn(b'RateLimit-Limit', dict(res.headers))
+        self.assertEqual(limiter.limited, 1)
+
+    async def test_keyed_by_header_or_callable(self):
+        app = App()
+        async def ok(req, res, ctx): res.body = b'ok'
+        app.GET('/keyed', ok)
+        app.GET('/custom', ok)
+        app.ratelimit(1, per=60, key='x-api-key', route='/keyed', headers=False)
+        app.ratelimit(1, per=60, key=lambda req: req.queries.get('team', ''), route='/custom')
+
+        _, res, _ = await app.earth.GET('/keyed', headers={'x-api-key': 'one'})
+        self.assertNotIn(b'RateLimit-Limit', dict(res.headers))
+        _, res, _ = await app.earth.GET('/keyed', headers={'x-api-key': 'two'})
+        self.assertEqual(res.status, 200)
+        _, res, _ = await app.earth.GET('/keyed', headers={'x-api-key': 'one'})
+        self.assertEqual(res.status, 429)
+
+        _, res, _ = await app.earth.GET('/custom?team=a')
+        _, res, _ = await app.earth.GET('/custom?team=b')
+        self.assertEqual(res.status, 200)
+        _, res, _ = await app.earth.GET('/custom?team=a')
+        self.assertEqual(res.status, 429)
+
+    async def test_subdomain_and_method_scoping(self):
+        app = App()
+        async def ok(req, res, ctx): res.body = b'ok'
+        api = app.subdomain('api')
+        api.GET('/x', ok)
+        api.POST('/x', ok)
+        api.ratelimit(1, per=60, methods=['POST'])
+        for _ in range(3):
+            _, res, _ = await app.earth.GET('/x', subdomain='api')
+            self.assertEqual(res.status, 200)
+        await app.earth.POST('/x', subdomain='api')
+        _, res, _ = await app.earth.POST('/x', subdomain='api')
+        self.assertEqual(res.status, 429)
@@ -1,3 +1,4 @@
+import asyncio
 from collections import deque
 from ujson import dumps, loads
 from typing import Callable
@@ -35,6 +36,17 @@ class AsyncRouterTest(IsolatedAsyncioTestCase):
         self.assertEqual(router._.name, 'naming')
         self.assertEqual(router._buckets, {'name': 'naming'})
 
+    async def test_a_rejected_duplicate_leaves_the_route_as_it_was(self):
+        async def slow(req, res, ctx):
+            await asyncio.sleep(.05)
+            res.body = b'slow'
+        self.router.GET('/v1/slow', slow)
+        with self.assertRaises(UrlDuplicateError): self.router.GET('/v1/slow', slow, timeout=.01, stream=True)
+        self.assertNotIn(('GET', '/v1/slow'), self.engine.options)
+        self.assertNotIn(('GET', '/v1/slow'), self.engine.streams)
+        _, res, _ = await self.router.earth.GET('/v1/slow')
+        self.assertEqual((res.status, res.body), (200, b'slow'))
+
     async def test_deferred_forwarded(self):
         receiver = _get_mock_receiver()
         mocked = Mock()
@@ -241,28 +253,29 @@ class RoutesTest(TestCase):
         self.assertRaises(UrlDuplicateError, self.engine.add, 'GET', '/v1/customers/:id/receipts', one, self.router)
         root_route_node = self.engine.routes.get('GET')
         self.assertEqual(root_route_node.handler, four)
-        self.assertFalse(root_route_node.parameterized)
+        self.assertEqual(root_route_node.parameters, ())
 
         v1_route_node = root_route_node.children.get('v1')
         self.assertIsNotNone(v1_route_node)
         self.assertIsNone(v1_route_node.route)
         self.assertIsNone(v1_route_node.handler)
-        self.assertDictEqual(v1_route_node.parameterized, {})
+        self.assertEqual(v1_route_node.parameters, ())
 
         customers_route_node = v1_route_node.children.get('customers')
         self.assertIsNotNone(customers_route_node)
         self.assertEqual(customers_route_node.route, '/v1/customers')
         self.assertEqual(customers_route_node.handler, three)
-        self.assertDictEqual(customers_route_node.parameterized, {})
+        self.assertEqual(customers_route_node.parameters, ())
     
         id_route_node = customers_route_node.children.get(':')
         self.assertIsNotNone(id_route_node)
-        self.assertTrue(id_route_node.parameterized)
-        self.assertEqual(id_route_node.parameterized, {'/v1/customers/:id/receipts': 'id'})
+        self.assertIsNone(id_route_node.route)
         
         receipts_route_node = id_route_node.children.get('receipts')
         self.assertIsNotNone(receipts_route_node)
         self.assertEqual(receipts_route_node.handler, one)
+        # the route's parameters live on the node carrying it, in segment order
+        self.assertEqual(receipts_route_node.parameters, (('id', None),))
 
     def test_routes_cache(self):
         self.assertIsNotNone(self.engine.cache['GET']['/v1/customers/:id/receipts'])
@@ -1,3 +1,4 @@
+import random
 from collections import deque
 from datetime import date, datetime
 from uuid import UUID
@@ -8,9 +9,10 @@ from unittest import TestCase, IsolatedAsyncioTestCase
 from unittest.mock import Mock, patch, AsyncMock, ANY, MagicMock
 
 from heaven import App, Application, Router, Response, Request, Context
-from heaven.router import DEFAULT, Routes, _isparamx, _notify, _get_configuration
+from heaven.router import DEFAULT, FrozenRoute, Routes, _isparamx, _notify, _get_configuration
 from heaven.errors import SubdomainError, UrlDuplicateError, UrlError
 from heaven.mocks import MOCK_SCOPE, MOCK_BODY, MockRequest, _get_mock_receiver
+from heaven.utils import subdomain_of
 
 from tests import mock_scope
 
@@ -119,3 +121,312 @@ class AsyncRouterTest(IsolatedAsyncioTestCase):
         self.assertEqual(orders_route.handler, handler)
         await self.app(mock_scope, receive, send)
 
+
+
+class StaticRoutesTest(TestCase):
+    def setUp(self):
+        self.router = Router()
+        self.router.GET('/health', lambda r, w, c: None)
+        self.router.GET('/api/v1/status?verbose:bool', lambda r, w, c: None)
+        self.router.GET('/api/v1/:name', lambda r, w, c: None)
+        self.router.GET('/files/*', lambda r, w, c: None)
+        self.engine = self.router.subdomains.get(DEFAULT)
+
+    def test_only_static_routes_are_tabled(self):
+        self.assertEqual(set(self.engine.statics['GET']), {'health', 'api/v1/status'})
+
+    def test_static_route_resolves_without_walking(self):
+        req = MockRequest('/api/v1/status')
+        with patch('heaven.router.Route.match', side_effect=AssertionError('walked')):
+            matched, handler, _ = self.engine.resolve('GET', '/api/v1/status/', req)
+        self.assertEqual(matched, '/api/v1/status')
+        self.assertIsNotNone(handler)
+        self.assertEqual(req.qh, 'verbose:bool')
+
+    def test_parameterized_route_still_walks(self):
+        req = MockRequest('/api/v1/other')
+        matched, _, _ = self.engine.resolve('GET', '/api/v1/other', req)
+        self.assertEqual(matched, '/api/v1/:name')
+        self.assertEqual(req.params.get('name'), 'other')
+
+    def test_removed_route_leaves_the_table(self):
+        self.engine.remove('GET', '/health')
+        self.assertNotIn('health', self.engine.statics['GET'])
+        matched, _, _ = self.engine.resolve('GET', '/health', MockRequest('/health'))
+        self.assertFalse(matched)
+
+
+class CompiledParametersTest(TestCase):
+    def setUp(self):
+        self.app = Router()
+        self.app.GET('/orgs/:org:uuid/projects/:pid:int/builds/:bid', lambda r, w, c: None)
+        self.engine = self.app.subdomains[DEFAULT]
+
+    def test_terminal_node_carries_names_and_converters(self):
+        node = self.engine.routes['GET']
+        for part in ['orgs', ':', 'projects', ':', 'builds', ':']: node = node.children[part]
+        self.assertEqual(node.parameters, (('org', UUID), ('pid', int), ('bid', None)))
+        self.assertEqual(self.engine.routes['GET'].children['orgs'].parameters, ())
+
+    def test_params_are_converted_from_the_node(self):
+        org = 'c1b7a1a8-5c62-4ac4-9d7f-0c1f4b9a7e11'
+        req = MockRequest('/')
+        matched, _, _ = self.engine.resolve('GET', f'/orgs/{org}/projects/7/builds/b9', req)
+        self.assertEqual(matched, '/orgs/:org:uuid/projects/:pid:int/builds/:bid')
+        self.assertEqual(req.params, {'org': UUID(org), 'pid': 7, 'bid': 'b9'})
+
+    def test_unconvertible_value_misses(self):
+        matched, _, _ = self.engine.resolve('GET', '/orgs/nope/projects/7/builds/b9', MockRequest('/'))
+        self.assertFalse(matched)
+
+
+class HostDispatchTest(IsolatedAsyncioTestCase):
+    async def call(self, app, host):
+        scope = {**MOCK_SCOPE, 'path': '/', 'query_string': b'', 'headers': [(b'host', host)]}
+        sent = []
+        async def send(message): sent.append(message)
+        await app(scope, _get_mock_receiver(), send)
+        return sent[-1]['body']
+
+    async def test_repeat_hosts_skip_subdomain_parsing(self):
+        app = App()
+        app.GET('/', lambda r, w, c: setattr(w, 'body', b'www'))
+        app.subdomain('api').GET('/', lambda r, w, c: setattr(w, 'body', b'api'))
+        with patch('heaven.router.subdomain_of', wraps=subdomain_of) as parsed:
+            self.assertEqual(await self.call(app, b'api.example.com'), b'api')
+            self.assertEqual(await self.call(app, b'api.example.com'), b'api')
+            self.assertEqual(await self.call(app, b'example.com'), b'www')
+        self.assertEqual(parsed.call_count, 2)
+        self.assertEqual(app._hosts.hits, 1)
+
+    async def test_new_subdomain_empties_the_cache(self):
+        app = App()
+        app.GET('/', lambda r, w, c: setattr(w, 'body', b'www'))
+        self.assertEqual(await self.call(app, b'shop.example.com'), b'www')
+        app.subdomain('shop').GET('/', lambda r, w, c: setattr(w, 'body', b'shop'))
+        self.assertEqual(await self.call(app, b'shop.example.com'), b'shop')
+
+    async def test_headers_are_decoded_only_when_read(self):
+        app = App()
+        app.GET('/', lambda r, w, c: setattr(w, 'body', ','.join(r.headers.get('x-tag')).encode()))
+        scope = {**MOCK_SCOPE, 'path': '/', 'query_string': b'', 'headers': [(b'host', b'example.com'), (b'x-tag', b'a'), (b'x-tag', b'b')]}
+        sent = []
+        async def send(message): sent.append(message)
+        await app(scope, _get_mock_receiver(), send)
+        self.assertEqual(sent[-1]['body'], b'a,b')
+
+
+class ResolutionCacheTest(TestCase):
+    def setUp(self):
+        self.router = Router(route_cache=2)
+        self.router.GET('/products/:id:int?sort:str', lambda r, w, c: None)
+        self.engine = self.router.subdomains.get(DEFAULT)
+
+    def test_off_by_default(self):
+        self.assertIsNone(Router().subdomains.get(DEFAULT).resolved)
+
+    def test_hit_skips_the_walk_and_keeps_converted_params(self):
+        self.engine.resolve('GET', '/products/7', MockRequest('/products/7'))
+        req = MockRequest('/products/7')
+        with patch('heaven.router.Route.match', side_effect=AssertionError('walked')):
+            matched, _, _ = self.engine.resolve('GET', '/products/7', req)
+        self.assertEqual(matched, '/products/:id:int')
+        self.assertEqual(req.params, {'id': 7})
+        self.assertEqual(req.qh, 'sort:str')
+        self.assertEqual((self.engine.resolved.hits, self.engine.resolved.misses), (1, 1))
+
+    def test_misses_are_not_remembered(self):
+        self.engine.resolve('GET', '/products/abc', MockRequest('/products/abc'))
+        self.assertEqual(len(self.engine.resolved), 0)
+
+    def test_bounded(self):
+        for id in range(5): self.engine.resolve('GET', f'/products/{id}', MockRequest('/'))
+        self.assertEqual(len(self.engine.resolved), 2)
+        self.assertEqual(self.engine.resolved.evictions, 3)
+
+    def test_registration_invalidates(self):
+        self.engine.resolve('GET', '/products/7', MockRequest('/products/7'))
+        self.router.GET('/products/7', lambda r, w, c: None)
+        self.assertEqual(len(self.engine.resolved), 0)
+        matched, _, _ = self.engine.resolve('GET', '/products/7', MockRequest('/products/7'))
+        self.assertEqual(matched, '/products/7')
+
+
+class PipelineTest(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.calls = []
+        self.app = App()
+        self.app.BEFORE('/*', self.outer)
+        self.app.BEFORE('/users/:id', self.inner, methods=['POST'])
+        self.app.GET('/users/:id', lambda r, w, c: self.calls.append('handler'))
+        self.engine = self.app.subdomains.get(DEFAULT)
+
+    def outer(self, r, w, c): self.calls.append('outer')
+    async def inner(self, r, w, c): self.calls.append('inner')
+
+    async def test_compiled_once_per_method_and_route(self):
+        await self.app.earth.GET('/users/1')
+        await self.app.earth.GET('/users/2')
+        self.assertEqual(list(self.engine.pipelines), [('GET', '/users/:id')])
+        pipeline = self.engine.pipelines[('GET', '/users/:id')]
+        self.assertEqual([hook for hook, _, _ in pipeline.befores], [self.outer])
+        self.assertEqual(self.calls, ['outer', 'handler', 'outer', 'handler'])
+
+    async def test_hook_registration_invalidates(self):
+        await self.app.earth.GET('/users/1')
+        self.app.AFTER('/users/*', lambda r, w, c: self.calls.append('after'))
+        self.assertEqual(self.engine.pipelines, {})
+        await self.app.earth.GET('/users/1')
+        self.assertEqual(self.calls[-1], 'after')
+
+    async def test_bypass_after_compiling_still_applies(self):
+        await self.app.earth.GET('/users/1')
+        self.app.earth.bypass(self.outer)
+        self.calls.clear()
+        await self.app.earth.GET('/users/1')
+        self.assertEqual(self.calls, ['handler'])
+
+
+class AllowedTest(TestCase):
+    def setUp(self):
+        self.router = Router()
+        self.router.GET('/users', lambda r, w, c: None)
+        self.router.POST('/users', lambda r, w, c: None)
+        self.router.DELETE('/users/:id', lambda r, w, c: None)
+        self.engine = self.router.subdomains.get(DEFAULT)
+
+    def test_static_path_needs_no_walk(self):
+        self.router.PATCH('/health', lambda r, w, c: None)
+        self.router.PUT('/health', lambda r, w, c: None)
+        with patch('heaven.router.Route.match', side_effect=AssertionError('walked')):
+            self.assertEqual(self.engine.allowed('/health'), {'PATCH', 'PUT'})
+
+    def test_static_path_walks_only_other_trees_under_its_prefix(self):
+        with patch('heaven.router.Route.match', return_value=('', None)) as match:
+            self.assertEqual(self.engine.allowed('/users'), {'GET', 'HEAD', 'POST'})
+        self.assertEqual(match.call_count, 1)
+
+    def test_unknown_prefix_needs_no_walk(self):
+        with patch('heaven.router.Route.match', side_effect=AssertionError('walked')):
+            self.assertEqual(self.engine.allowed('/wp-admin/setup.php'), set())
+
+    def test_dynamic_paths_still_walk_their_candidates(self):
+        self.assertEqual(self.engine.allowed('/users/7'), {'DELETE'})
+
+    def test_root_catchall_keeps_every_path_a_candidate(self):
+        self.router.OPTIONS('/*', lambda r, w, c: None)
+        self.assertEqual(self.engine.allowed('/wp-admin/setup.php'), {'OPTIONS'})
+
+    def test_answers_are_remembered_until_routes_change(self):
+        self.engine.allowed('/nothing/here')
+        with patch('heaven.router.Route.match', side_effect=AssertionError('walked')):
+            self.assertEqual(self.engine.allowed('/nothing/here'), set())
+        self.assertEqual(self.engine.allowances.hits, 1)
+        self.router.PUT('/nothing/here', lambda r, w, c: None)
+        self.assertEqual(self.engine.allowed('/nothing/here'), {'PUT'})
+
+
+def _random_table(seed, size=40):
+    """A route table over a tiny alphabet so literal, `:` and `*` segments collide
+    often, which is where matching precedence and backtracking get exercised."""
+    rng = random.Random(seed)
+    pieces = ['a', 'b', 'c', ':x', ':n:int', '*']
+    routes = set()
+    while len(routes) < size:
+        depth = rng.randint(1, 4)
+        routes.add('/' + '/'.join(rng.choice(pieces) for _ in range(depth)))
+    return rng, sorted(routes)
+
+
+def _random_paths(rng, count=300):
+    pieces = ['a', 'b', 'c', '1', 'x', ':', '*', '']
+    return ['/' + '/'.join(rng.choice(pieces) for _ in range(rng.randint(0, 5))) for _ in range(count)]
+
+
+def _outcome(engine, method, path):
+    req = MockRequest('/')
+    matched, handler, _ = engine.resolve(method, path, req)
+    return matched or None, handler if matched else None, req._params, req.qh
+
+
+class FrozenRoutesTest(TestCase):
+    def test_matches_like_the_mutable_tree(self):
+        for seed in range(25):
+            rng, routes = _random_table(seed)
+            live, frozen = Router(), Router()
+            for route in routes:
+                handler = lambda r, w, c, route=route: route
+                for app in (live, frozen):
+                    try: app.GET(f'{route}?q:int', handler)
+                    except AssertionError: pass
+            frozen.freeze()
+            for path in _random_paths(rng):
+                with self.subTest(seed=seed, path=path):
+                    self.assertEqual(
+                        _outcome(live.subdomains[DEFAULT], 'GET', path),
+                        _outcome(frozen.subdomains[DEFAULT], 'GET', path),
+                    )
+
+    def test_single_child_chains_are_merged(self):
+        router = Router()
+        router.GET('/api/v1/internal/status', lambda r, w, c: None)
+        router.GET('/api/v1/users/:id', lambda r, w, c: None)
+        router.freeze()
+        root = router.subdomains[DEFAULT].frozen['GET']
+        api = root.nodes[root.keys.index('api')]
+        self.assertEqual(api.prefix, ('v1',))
+        internal = api.nodes[api.keys.index('internal')]
+        self.assertEqual((internal.prefix, internal.route), (('status',), '/api/v1/internal/status'))
+
+    def test_frozen_routes_refuse_registration(self):
+        router = Router()
+        router.GET('/users', lambda r, w, c: None)
+        router.freeze()
+        self.assertTrue(router.finalized)
+        self.assertEqual(router.subdomains[DEFAULT].routes['GET'].children, {})
+        with self.assertRaises(RuntimeError): router.GET('/more', lambda r, w, c: None)
+        with self.assertRaises(RuntimeError): router.subdomains[DEFAULT].remove('GET', '/users')
+
+    def test_allowed_and_statics_use_the_frozen_tree(self):
+        router = Router()
+        router.GET('/users', lambda r, w, c: None)
+        router.DELETE('/users/:id:int', lambda r, w, c: None)
+        router.freeze()
+        engine = router.subdomains[DEFAULT]
+        self.assertIsInstance(engine.statics['GET']['users'], FrozenRoute)
+        self.assertEqual(engine.allowed('/users/3'), {'DELETE'})
+        self.assertEqual(engine.allowed('/users/three'), set())
+
+
+class GeneratedRoutesTest(TestCase):
+    def test_matches_like_the_mutable_tree(self):
+        for seed in range(25):
+            rng, routes = _random_table(seed)
+            live, generated = Router(), Router()
+            for route in routes:
+                handler = lambda r, w, c, route=route: route
+                for app in (live, generated):
+                    try: app.GET(f'{route}?q:int', handler)
+                    except AssertionError: pass
+            generated.freeze(generate_code=True)
+            self.assertIn('GET', generated.subdomains[DEFAULT].generated)
+            for path in _random_paths(rng):
+                with self.subTest(seed=seed, path=path):
+                    self.assertEqual(
+                        _outcome(live.subdomains[DEFAULT], 'GET', path),
+                        _outcome(generated.subdomains[DEFAULT], 'GET', path),
+                    )
+
+    def test_wide_and_deep_trees_spill_into_helpers(self):
+        live, generated = Router(), Router()
+        routes = [f'/wide/w{i}/:id:int' for i in range(20)] + ['/deep/' + '/'.join(f'd{i}' if i % 2 else ':p' for i in range(60))]
+        for route in routes:
+            handler = lambda r, w, c, route=route: route
+            for app in (live, generated): app.GET(route, handler)
+        generated.freeze(generate_code=True)
+        match = generated.subdomains[DEFAULT].generated['GET']
+        self.assertIn('def _n', match.__source__)
+        deep = '/deep/' + '/'.join(f'd{i}' if i % 2 else str(i) for i in range(60))
+        for path in ['/wide/w7/3', '/wide/w7/x', '/wide/w30/3', deep, deep + '/more']:
+            with self.subTest(path=path):
+                self.assertEqual(_outcome(live.subdomains[DEFAULT], 'GET', path), _outcome(generated.subdomains[DEFAULT], 'GET', path))
@@ -0,0 +1,64 @@
+import os
+import tempfile
+from unittest import IsolatedAsyncioTestCase
+
+from heaven import App
+from heaven.sendfile import PATHSEND, FileBody
+
+
+CONTENT = os.urandom(10_000)
+
+
+class SendfileTest(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'blob.bin')
+        with open(self.path, 'wb') as file: file.write(CONTENT)
+        self.app = App()
+        self.app.GET('/blob', lambda req, res, ctx: res.file(self.path, chunk_size=3000))
+
+    async def serve(self, app, method='GET', headers=(), extensions=None):
+        sent = []
+        async def receive(): return {'type': 'http.request', 'body': b'', 'more_body': False}
+        async def send(message): sent.append(message)
+        scope = {'type': 'http', 'method': method, 'path': '/blob', 'query_string': b'', 'headers': [(b'host', b'x'), *headers]}
+        if extensions is not None: scope['extensions'] = extensions
+        await app(scope, receive, send)
+        return sent
+
+    async def test_the_server_is_handed_the_path_when_it_offers_pathsend(self):
+        sent = await self.serve(self.app, extensions={PATHSEND: {}})
+        self.assertEqual(dict(sent[0]['headers'])[b'Content-Length'], str(len(CONTENT)).encode())
+        self.assertEqual(sent[1:], [{'type': PATHSEND, 'path': os.path.abspath(self.path)}])
+
+    async def test_otherwise_the_file_is_read_in_chunks_of_the_declared_length(self):
+        sent = await self.serve(self.app, extensions={})
+        self.assertEqual(dict(sent[0]['headers'])[b'Content-Length'], str(len(CONTENT)).encode())
+        chunks = [message['body'] for message in sent[1:]]
+        self.assertEqual([len(chunk) for chunk in chunks], [3000, 3000, 3000, 1000, 0])
+        self.assertEqual(b''.join(chunks), CONTENT)
+
+    async def test_ranges_compression_and_head_are_not_sent_by_path(self):
+        extensions = {PATHSEND: {}}
+        sent = await self.serve(self.app, headers=[(b'range', b'bytes=10-19')], extensions=extensions)
+        self.assertEqual(b''.join(message.get('body', b'') for message in sent[1:]), CONTENT[10:20])
+
+        sent = await self.serve(self.app, method='HEAD', extensions=extensions)
+        self.assertEqual(dict(sent[0]['headers'])[b'Content-Length'], str(len(CONTENT)).encode())
+        self.assertEqual(sent[1]['type'], 'http.response.body')
+        self.assertEqual(sent[1]['body'], b'')
+
+        app = App(compress=True)
+        with open(os.path.join(self.folder, 'notes.txt'), 'wb') as file: file.write(b'plain text ' * 200)
+        app.GET('/blob', lambda req, res, ctx: res.file(os.path.join(self.folder, 'notes.txt')))
+        sent = await self.serve(app, headers=[(b'accept-encoding', b'gzip')], extensions=extensions)
+        self.assertEqual(dict(sent[0]['headers'])[b'Content-Encoding'], b'gzip')
+        self.assertNotIn(PATHSEND, [message['type'] for message in sent])
+
+    async def test_closing_early_closes_the_file(self):
+        body = FileBody(self.path, len(CONTENT), chunk_size=1000)
+        chunks = body.__aiter__()
+        self.assertEqual(await chunks.__anext__(), CONTENT[:1000])
+        await body.aclose()
+        self.assertIsNone(chunks.ag_frame)
+        with self.assertRaises(ValueError): FileBody(self.path, 1, chunk_size=0)
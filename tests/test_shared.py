@@ -0,0 +1,105 @@
+import os
+import tempfile
+import time
+from multiprocessing import get_context
+from unittest import TestCase
+
+from heaven import App
+from heaven.shared import WAYS, SharedCache
+
+
+def writer(path, count):
+    """Runs in another process, storing what the test then reads back."""
+    cache = SharedCache(path)
+    for index in range(count): cache.set(f'key:{index}', {'index': index, 'pid': os.getpid()})
+    cache.set('raw', b'\x00bytes')
+    cache.close()
+
+
+class SharedCacheTest(TestCase):
+    def setUp(self):
+        folder = tempfile.mkdtemp()
+        self.path = os.path.join(folder, 'shared.cache')
+
+    def open(self, **kwargs):
+        cache = SharedCache(self.path, **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_values_round_trip(self):
+        cache = self.open(slots=64, slotsize=256)
+        self.assertTrue(cache.set('flags', {'beta': True, 'limits': [1, 2]}))
+        self.assertTrue(cache.set(b'blob', b'\x00\x01'))
+        self.assertEqual(cache.get('flags'), {'beta': True, 'limits': [1, 2]})
+        self.assertEqual(cache.get('blob'), b'\x00\x01')
+        self.assertIsNone(cache.get('missing'))
+        self.assertEqual(cache.get('missing', 7), 7)
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+        cache.set('flags', 'replaced')
+        self.assertEqual(cache.get('flags'), 'replaced')
+        self.assertEqual(len(cache), 2)
+        self.assertTrue(cache.delete('flags'))
+        self.assertFalse(cache.delete('flags'))
+        self.assertNotIn('flags', cache)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_too_large_is_refused(self):
+        cache = self.open(slots=8, slotsize=128)
+        self.assertFalse(cache.set('big', b'x' * 200))
+        self.assertEqual(cache.rejected, 1)
+        self.assertNotIn('big', cache)
+
+    def test_ttl(self):
+        cache = self.open(slots=8, slotsize=128)
+        cache.set('soon', 1, ttl=.01)
+        cache.set('later', 2)
+        time.sleep(.02)
+        self.assertIsNone(cache.get('soon'))
+        self.assertEqual(cache.get('later'), 2)
+
+    def test_full_set_evicts_least_recently_used(self):
+        # a single set, so every key competes for the same slots
+        cache = self.open(slots=WAYS, slotsize=128)
+        for index in range(WAYS): cache.set(index.to_bytes(2, 'big'), index)
+        cache.get((0).to_bytes(2, 'big'))
+        cache.set(b'new', 'new')
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.get((0).to_bytes(2, 'big')), 0)
+        self.assertIsNone(cache.get((1).to_bytes(2, 'big')))
+        self.assertEqual(len(cache), WAYS)
+
+    def test_reopening_follows_the_file(self):
+        first = self.open(slots=16, slotsize=256)
+        first.set('kept', 'yes')
+        second = self.open(slots=9999, slotsize=64)
+        self.assertEqual((second.capacity, second.slotsize), (16, 256))
+        self.assertEqual(second.get('kept'), 'yes')
+
+        with open(self.path, 'r+b') as file: file.write(b'garbage!')
+        with self.assertRaises(ValueError): SharedCache(self.path)
+
+    def test_other_processes_see_the_same_entries(self):
+        cache = self.open()
+        process = get_context('spawn').Process(target=writer, args=(self.path, 50))
+        process.start()
+        process.join(30)
+        self.assertEqual(process.exitcode, 0)
+        for index in range(50):
+            value = cache.get(f'key:{index}')
+            self.assertEqual(value['index'], index)
+            self.assertNotEqual(value['pid'], os.getpid())
+        self.assertEqual(cache.get('raw'), b'\x00bytes')
+
+
+class RouterShareTest(TestCase):
+    def test_share_opens_app_shared(self):
+        app = App()
+        with self.assertRaises(RuntimeError): app.shared
+        path = os.path.join(tempfile.mkdtemp(), 'app.cache')
+        cache = app.share(path, slots=32, slotsize=512)
+        self.addCleanup(cache.close)
+        self.assertIs(app.shared, cache)
+        app.shared.set('pricing', {'eu': 10})
+        self.assertEqual(app.shared.get('pricing'), {'eu': 10})
@@ -2,7 +2,7 @@ from unittest import TestCase
 
 from heaven.constants import DEFAULT
 from heaven.mocks import MOCK_SCOPE
-from heaven.utils import b_or_s, preprocessor
+from heaven.utils import LRU, b_or_s, host_header, preprocessor, subdomain_of
 
 
 class TestUtils(TestCase):
@@ -24,3 +24,44 @@ class TestUtils(TestCase):
         subdomain, headers = preprocessor(self.scope)
         self.assertEqual(subdomain, DEFAULT)
         self.assertDictEqual(headers, {'host': '127.0.0.1'})
+
+    def test_host_header_is_scanned_raw(self):
+        self.assertEqual(host_header({'headers': [(b'accept', b'*/*'), (b'host', b'api.example.com')]}), b'api.example.com')
+        self.assertEqual(host_header(self.scope), 'host.localdomain.localhost:8000')
+        self.assertIsNone(host_header({'headers': [(b'accept', b'*/*')]}))
+
+    def test_subdomain_of(self):
+        cases = {
+            None: DEFAULT,
+            b'api.example.com': 'api',
+            'https://api.example.com:443': 'api',
+            'example.com': DEFAULT,
+            '10.0.0.1:8000': DEFAULT,
+            '1.2.3': '1',
+            '999.1.1.1': '999',
+            '[::1]:8000': DEFAULT,
+        }
+        for host, subdomain in cases.items():
+            with self.subTest(host=host): self.assertEqual(subdomain_of(host), subdomain)
+
+
+class TestLRU(TestCase):
+    def test_evicts_least_recently_used_by_count(self):
+        lru = LRU(maxsize=2)
+        lru.put('a', 1)
+        lru.put('b', 2)
+        lru.get('a')
+        lru.put('c', 3)
+        self.assertIn('a', lru)
+        self.assertNotIn('b', lru)
+        self.assertEqual((lru.hits, lru.evictions), (1, 1))
+
+    def test_evicts_by_size(self):
+        lru = LRU(maxbytes=10)
+        lru.put('a', b'x' * 6, 6)
+        lru.put('b', b'x' * 6, 6)
+        self.assertNotIn('a', lru)
+        self.assertEqual(lru.size, 6)
+        self.assertFalse(lru.put('c', b'x' * 11, 11))
+        self.assertEqual(lru.get('c', 'missing'), 'missing')
+        self.assertEqual(lru.misses, 1)